@@ -9,6 +9,7 @@ from typing import List, Optional, Union
 import math as math
 import warnings
 import os
+import sys
 import pathlib
 import matplotlib.colors as mcolors
 import matplotlib.lines as mlines
@@ -31,119 +32,53 @@ warnings.filterwarnings("ignore")
 # Function to load and concatenate files from a directory
 # -------------------
 
-def load_and_concat_files_then_pyam(directory_path, file_types=None):
-    """
-    Load specified file types from a directory, concatenate them as pandas DataFrames,
-    then convert the result to a pyam IamDataFrame.
-
-    Parameters:
-    -----------
-    directory_path : str
-        Path to the directory containing data files
-    file_types : str or list, optional
-        Specify which file types to process: "xlsx", "csv", or ["xlsx", "csv"]
-        If None, both xlsx and csv files will be processed
-
-    Returns:
-    --------
-    pyam.IamDataFrame
-        Combined IamDataFrame from all files
-    """
-    # Set default file types if not specified
-    if file_types is None:
-        file_types = ["xlsx", "csv"]
-    elif isinstance(file_types, str):
-        file_types = [file_types]
-
-    # Create lookup for file extensions
-    valid_extensions = {
-        "xlsx": ".xlsx",
-        "csv": ".csv"
-    }
-
-    # Get the extensions to look for
-    extensions_to_check = [valid_extensions[ft] for ft in file_types if ft in valid_extensions]
-
-    # List to store all pandas dataframes
-    all_dfs = []
-
-    # Get all files with the specified extensions in the directory
-    for file_name in os.listdir(directory_path):
-        if any(file_name.endswith(ext) for ext in extensions_to_check):
-            full_path = os.path.join(directory_path, file_name)
-
-            try:
-                # Read the file based on its extension
-                if file_name.endswith('.csv'):
-                    try:
-                        data_file = pd.read_csv(full_path)
-                    except UnicodeDecodeError:
-                        data_file = pd.read_csv(full_path, encoding='ISO-8859-1')
-                elif file_name.endswith('.xlsx'):
-                    data_file = pd.read_excel(full_path)
-
-                # Add to list of pandas DataFrames
-                all_dfs.append(data_file)
-                print(f"Read {file_name}")
-
-            # If there is an error, print a message and continue to the next file
-            except Exception as e:
-                print(f"Error reading {file_name}: {e}")
-                continue
-
-    # Concatenate all pandas dataframes
-    if all_dfs:
-        combined_df = pd.concat(all_dfs, ignore_index=True)
-        # Convert the combined DataFrame to pyam IamDataFrame
-        result_df = pyam.IamDataFrame(combined_df)
-        return result_df
-    else:
-        print("No files were processed")
-        return None
+# Shared with the analysis notebooks: files are parsed in a process pool with
+# categorical identifiers and typed year columns (see derp_tools/loading.py)
+sys.path.append("../..")
+from derp_tools.loading import load_and_concat_files_then_pyam
+
+# Wall time, CPU time, peak memory and rows of every stage (each input file
+# and dashboard panel included) are logged and written at the end of the
+# script to pipeline_logs/ (see derp_tools/instrument.py)
+from derp_tools.instrument import PipelineLog
+
+pipeline_log = PipelineLog("FRIDA uncertainties")
 
 #%%
 
-# Load data
+# Load data (parsed files are cached in .derp_cache/ and re-used while unchanged)
 path = "data/"  
-df = load_and_concat_files_then_pyam(path, file_types=["csv"])
+with pipeline_log.stage("load") as st:
+    df = st.output(load_and_concat_files_then_pyam(path, file_types=["csv"], cache_dir=".derp_cache"))
 
 
 #%%
 # -------------------
-# Function to rename data
+# Label registry
 # -------------------
 
-def rename_data(iam_df: pyam.IamDataFrame, renaming: dict, obj_type: str = "scenario") -> Optional[pyam.IamDataFrame]:
-    """Renames scenarios, models, or variables in a pyam.IamDataFrame."""
-
-    if iam_df is None:
-        print("Error: No IamDataFrame provided for renaming.")
-        return None
+# Renames and display names of models, scenarios and variables are kept in one
+# registry; renames are applied once per distinct label, not per row
+# (see derp_tools/labels.py)
+from derp_tools.labels import LabelRegistry
 
-    try:
-        iam_df.rename(**{obj_type: renaming}, inplace=True)
-        return iam_df
-    except Exception as e:
-        print(f"Error during renaming: {e}")
-        return None
+label_registry = LabelRegistry()
 
 # -------------------
 # Examples
 # -------------------
 
 # # Rename scenarios
-# scenario_renaming = {
+# label_registry.add_rename("scenario", {
 #     'DERP1': 'NDC_EI_DERP1',
 #     #... (rest of your renaming mapping)
-# }
-# renamed_data = rename_data(all_data, scenario_renaming)
+# })
 
 # # Rename Models
-# model_renaming = {
+# label_registry.add_rename("model", {
 #     'AIM/CGE': 'AIM',
 #     'MESSAGEix-GLOBIOM 1.0': 'MESSAGE',
-# }
-# renamed_models = rename_data(all_data, model_renaming, obj_type='model')
+# })
 
 
 #%%
@@ -153,7 +88,8 @@ variable_renaming = {
     'Capacity|Electricity|Gas|CCS': 'Capacity|Electricity|Gas|w/ CCS',
     'Capacity|Electricity|Coal|CCS': 'Capacity|Electricity|Coal|w/ CCS',
 }
-renamed_variables = rename_data(df, variable_renaming, obj_type='variable')
+label_registry.add_rename("variable", variable_renaming)
+df = label_registry.rename(df)
 
 
 #%%
@@ -1115,32 +1051,35 @@ CO2_emissions_transport_names = {
     # 'Emissions|CO2|Energy|Demand|Transportation': 'CO2|Transport',
 }
 
-# --- Combine all renaming dictionaries ---
-all_vars_names = {}
-all_vars_names.update(capacity_additions_names)
-all_vars_names.update(overall_capacity_names)
-all_vars_names.update(emissions_names)
-all_vars_names.update(CO2_emissions_names)
-all_vars_names.update(carbon_sequestration_names)
-all_vars_names.update(land_use_sequestration_names)
-all_vars_names.update(carbon_dioxide_removal_names)
-all_vars_names.update(timeseries_variables_names)
-all_vars_names.update(energy_investment_names)
-all_vars_names.update(primary_energy_names)
-all_vars_names.update(final_energy_by_carriers_names)
-all_vars_names.update(final_energy_by_sources_names)
-all_vars_names.update(finals_by_sector_names)
-all_vars_names.update(finals_by_sector_electricity_names)
-all_vars_names.update(secondary_energy_electricity_names)
-all_vars_names.update(secondary_energy_non_electric_names)
-all_vars_names.update(residential_final_energy_names)
-all_vars_names.update(commercial_final_energy_names)
-all_vars_names.update(residential_commercial_final_energy_names)
-all_vars_names.update(transport_mode_final_energy_names)
-all_vars_names.update(transport_carrier_final_energy_names)
-all_vars_names.update(industry_carrier_final_energy_names)
-all_vars_names.update(industry_subsector_final_energy_names)
-all_vars_names.update(CO2_emissions_transport_names)
+# --- Combine all renaming dictionaries (later ones win) ---
+label_registry.add_display(
+    "variable",
+    capacity_additions_names,
+    overall_capacity_names,
+    emissions_names,
+    CO2_emissions_names,
+    carbon_sequestration_names,
+    land_use_sequestration_names,
+    carbon_dioxide_removal_names,
+    timeseries_variables_names,
+    energy_investment_names,
+    primary_energy_names,
+    final_energy_by_carriers_names,
+    final_energy_by_sources_names,
+    finals_by_sector_names,
+    finals_by_sector_electricity_names,
+    secondary_energy_electricity_names,
+    secondary_energy_non_electric_names,
+    residential_final_energy_names,
+    commercial_final_energy_names,
+    residential_commercial_final_energy_names,
+    transport_mode_final_energy_names,
+    transport_carrier_final_energy_names,
+    industry_carrier_final_energy_names,
+    industry_subsector_final_energy_names,
+    CO2_emissions_transport_names,
+)
+all_vars_names = label_registry.mapping("variable")
 
 
 #%%
@@ -1177,6 +1116,7 @@ scenario_names = {
     'HD_IR_RCP85_5_CDD_30_20_nCAP': 'D4_IR_5RCP85_CDD_30_20_nCAP',
 
 }
+label_registry.add_display("scenario", scenario_names)
 
 
 
@@ -1309,6 +1249,17 @@ groups = {
 }
 
 
+#%%
+
+# Check that the reported children of each parent variable add up to it
+# (e.g. Capacity|Electricity|* vs Capacity|Electricity) for every
+# model/scenario/region/year; violations beyond 1% are listed
+from derp_tools.hierarchy import check_sums, violation_summary
+
+with pipeline_log.stage("check sums") as st:
+    sum_violations = st.output(check_sums(df, parents="Capacity|Electricity", rtol=1e-2))
+print("Parent/child sum violations:")
+print(violation_summary(sum_violations))
 
 
 #%%
@@ -1316,47 +1267,43 @@ groups = {
 # First, prepare your data with baseline comparisons
 baseline_scenario = 'NDC_EI_DERP2_HD'
 
-# Create the df_with_changes DataFrame 
-if 'baseline_value' not in df.data.columns:
-    # Create a DataFrame with baseline values
-    baseline_df = df.data[df.data['scenario'] == baseline_scenario].copy()
-    baseline_df = baseline_df.rename(columns={'value': 'baseline_value'})
-    baseline_df = baseline_df[['model', 'region', 'variable', 'year', 'baseline_value']]
-
-    # Merge with original data and calculate changes
-    merged_df = pd.merge(df.data, baseline_df, on=['model', 'region', 'variable', 'year'], how='left')
-    merged_df['delta'] = merged_df['value'] - merged_df['baseline_value']
-    merged_df['percentage_change'] = (merged_df['delta'] / merged_df['baseline_value']) * 100
-
-    # Replace infinite values (from division by zero) with NaN
-    merged_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+# Changes relative to the baseline, kept compact: identifiers as integer
+# codes, one value array and the baseline per model/region/variable/year;
+# baseline values, deltas and percentage changes are derived for the rows a
+# panel selects (see derp_tools/store.py). Missing or zero baselines give NaN
+# percentage changes. df_with_changes.to_frame() gives the full DataFrame
+# (as derp_tools.changes.compute_baseline_changes).
+from derp_tools.store import CompactStore
 
-    # Store the enhanced DataFrame
-    df_with_changes = merged_df
-else:
-    df_with_changes = df.data
+with pipeline_log.stage("baseline changes") as st:
+    df_with_changes = st.output(CompactStore.from_data(df).changes(baseline_scenario))
 
 
 
 #%%
 
 
-# Find rows where percentage_change is NaN
-missing_percentage = df_with_changes[df_with_changes['percentage_change'].isna()]
+# Classify every missing or undefined percentage change in one pass: no
+# baseline, zero baseline, missing scenario value or year not reported
+# (see derp_tools/diagnostics.py)
+from derp_tools.diagnostics import diagnose_missing
 
-# Categorize the reason for missing data
-missing_percentage['reason'] = 'Unknown'
-missing_percentage.loc[missing_percentage['baseline_value'].isna(), 'reason'] = 'No Baseline Data'
-missing_percentage.loc[(missing_percentage['baseline_value'] == 0) & 
-                       (missing_percentage['reason'] == 'Unknown'), 'reason'] = 'Division by Zero'
+with pipeline_log.stage("missing diagnostics") as st:
+    missing_report = diagnose_missing(df, baseline_scenario)
+    st.output(missing_report.cells)
 
 # Count missing values by reason
-missing_counts = missing_percentage['reason'].value_counts()
+missing_counts = missing_report.summary()
 print("Missing percentage change counts by reason:")
 print(missing_counts)
+print(missing_report.counts(by=["model", "scenario"]))
+
+# Share of defined percentage changes per model/scenario and variable
+coverage = missing_report.coverage(index=["model", "scenario"], columns="variable")
 
 # Examine missing data for a specific scenario/region/variable combination
-specific_missing = missing_percentage.query('scenario == "HD_ER_RCP85_1_CDD_20_10" & region == "World" & variable == "Final Energy|Industry|Electricity"')
+specific_missing = missing_report.select(scenario="HD_ER_RCP85_1_CDD_20_10", region="World",
+                                         variable="Final Energy|Industry|Electricity")
 print("\nMissing data for specific combination:")
 print(specific_missing[['model', 'year', 'value', 'baseline_value', 'reason']])
 
@@ -1369,27 +1316,17 @@ print(specific_missing[['model', 'year', 'value', 'baseline_value', 'reason']])
 electricity_var = 'Final Energy|Electricity'
 total_var = 'Final Energy'
 
-# Extract data for both variables
-electricity_df = df.filter(variable=electricity_var).data
-total_df = df.filter(variable=total_var).data
-
-# Rename value columns for clarity
-electricity_df = electricity_df.rename(columns={'value': 'electricity_value'})
-total_df = total_df.rename(columns={'value': 'total_value'})
-
-# Merge the dataframes
-merged = pd.merge(
-    electricity_df[['model', 'scenario', 'region', 'year', 'electricity_value']],
-    total_df[['model', 'scenario', 'region', 'year', 'total_value']],
-    on=['model', 'scenario', 'region', 'year'],
-    how='inner'
-)
-
-# Calculate the share
-merged['electricity_share'] = (merged['electricity_value'] / merged['total_value']) * 100
+# Share (%) for every model/scenario/region/year in one vectorised division;
+# zero totals give NaN (see derp_tools/shares.py)
+from derp_tools.shares import compute_share, slice_share
 
-# Handle any division by zero or invalid values
-merged['electricity_share'].replace([np.inf, -np.inf], np.nan, inplace=True)
+with pipeline_log.stage("share") as st:
+    shares = st.output(compute_share(df, electricity_var, total_var, values=True))
+merged = (shares.rename(columns={electricity_var: 'electricity_share',
+                                 f'{electricity_var} value': 'electricity_value',
+                                 f'{total_var} value': 'total_value'})
+          .reset_index()
+          [['model', 'scenario', 'region', 'year', 'electricity_value', 'total_value', 'electricity_share']])
 
 # Quick look at the results
 print("Electricity share summary statistics by model:")
@@ -1403,7 +1340,11 @@ print(merged[merged['electricity_share'].isna()].groupby('model').size())
 
 #%%
 
-df_share = merged.query("region == 'World' & scenario == ['HD_ER_RCP85_1_CDD_20_10', 'HD_IR_RCP85_1_CDD_20_10_nCAP', 'NDC_EI_DERP2_HD'] & year == [2040, 2070, 2100]")
+df_share = (slice_share(shares, region='World',
+                        scenario=['HD_ER_RCP85_1_CDD_20_10', 'HD_IR_RCP85_1_CDD_20_10_nCAP', 'NDC_EI_DERP2_HD'],
+                        year=[2040, 2070, 2100])
+            .rename(columns={electricity_var: 'electricity_share'})
+            .reset_index())
 
 
 
@@ -1411,20 +1352,31 @@ df_share = merged.query("region == 'World' & scenario == ['HD_ER_RCP85_1_CDD_20_
 
 unc_dir = "data/uncertainty"  
 
-frida_unc_data = {}
-frida_unc_data['Capacity|Electricity'] = {}
+# Percentile files (FRIDA_<scenario>_<5th|95th>.csv) are read lazily, and only
+# the rows of the variables that a panel asks for are parsed
+from derp_tools.frida import (EnsembleMembers, PercentileTable, UncertaintyBands,
+                              ensemble_percentile_differences)
 
-for scen in scenarios_of_interest:
-    frida_unc_data['Capacity|Electricity'][scen] = {}
-    
-    for pct in ['5th', '95th']:
-        df_in = pd.read_csv(f'{unc_dir}/FRIDA_{scen}_{pct}.csv')
-        df_in = df_in.loc[df_in['Variable'] == 'Capacity|Electricity'].loc[:, '1980':'2150']
-        frida_unc_data['Capacity|Electricity'][scen][pct] = df_in.values[0,:]/1000 # TW
+frida_unc_data = UncertaintyBands(unc_dir)
 
  
+# Percentile differences, indexed once by (variable, scenario, percentile, year).
+# With the ensemble runs (FRIDA_<scenario>_members.csv) in member_dir they are
+# recomputed from the members, for any years or percentiles (scenarios without
+# a members file keep their precomputed rows); otherwise the precomputed table
+# is read
 perc_unc_file = "data/differences/FRIDA_percentage_capacity_differences.csv"   
-df_perc_unc = pd.read_csv(perc_unc_file)
+member_dir = "data/ensemble"
+with pipeline_log.stage("uncertainty load") as st:
+    if os.path.isdir(member_dir):
+        precomputed = PercentileTable.from_csv(perc_unc_file)
+        perc_unc_table = ensemble_percentile_differences(
+            EnsembleMembers(member_dir), baseline_scenario,
+            scenarios=precomputed.scenarios, variables=precomputed.variables,
+            years=precomputed.years, percentiles=precomputed.percentiles,
+            fallback=precomputed)
+    else:
+        perc_unc_table = PercentileTable.from_csv(perc_unc_file)
 
 var_dict = {
      'Biomass':'Capacity|Biomass',
@@ -1470,295 +1422,77 @@ model_linestyles = {
     "FRIDAv2.1":       ":",
     # "PROMETHEUS":      "-."
 }
-def _display_name(var: str, name_map: Dict[str, str]) -> str:
-    return name_map.get(var, var.split("|")[-1])
-def _model_markers(models: List[str]) -> Dict[str, str]:
-    # base = ["P", "^", "s", "D", "v", "<", ">", "o"]
-    base = ["P", "X", "s", "D", "v", "<", ">", "o"]
-    return {m: base[i % len(base)] for i, m in enumerate(models)}
 
 # ----------------------------------------------------------------
-# 2.  individual panels
+# 2.  panels & master plot (derp_tools/dashboard.py)
 # ----------------------------------------------------------------
-def plot_total_capacity_ax(df, *, ax, region, models, scenarios,
-                           all_vars, colours, frida_unc=False, frida_unc_data):
-    """Top-left panel – Total electricity capacity in TW."""
-    dfv = (df.filter(variable="Capacity|Electricity", region=region)
-             .filter(model=models).filter(scenario=scenarios))
-    if dfv.empty:
-        ax.text(.5, .5, "no data", ha="center", va="center"); ax.axis("off"); return
-
-    for m in models:
-        ls = model_linestyles.get(m, "-")
-        for s in scenarios:
-            seri = dfv.filter(model=m, scenario=s)
-            if seri.empty: continue
-            ts = (seri.timeseries().reset_index()
-                       .melt(id_vars=["model","scenario","region","variable","unit"],
-                             var_name="year", value_name="value"))
-            ts["year"]  = pd.to_numeric(ts["year"], errors="coerce")
-            ts["value"] = ts["value"] / 1_000   # → TW
-            ax.plot(ts["year"], ts["value"],
-                    color=colours.get(s, "black"), linestyle=ls, lw=2)
-
-            if m == 'FRIDAv2.1' and frida_unc == True:
-                ax.fill_between(ts["year"], frida_unc_data['Capacity|Electricity'][s]['5th'],
-                        frida_unc_data['Capacity|Electricity'][s]['95th'],
-                        color=colours.get(s, "black"), alpha=0.15, lw=0)
-            
-
-    # ax.set_xlim(2025, 2100)
-    ax.set_xlim(1980, 2150)
-    ax.set_xlabel("Year", fontsize=10)
-    ax.set_ylabel("TW",  fontsize=10)
-    ax.tick_params(axis="both", labelsize=10)
-    ax.set_title("Total Electricity Capacity", fontsize=14, pad=6)
-    ax.grid(True, ls="--", alpha=.3)
-    
+from derp_tools.dashboard import create_cap_elec_polar_dashboard
+from derp_tools.batch import render_batch
+from derp_tools.templates import close_templates
 
-# ................................................................
-def plot_elec_share_ax(ax, df_share, *, region,
-                       base_scenario, compare_scenarios,
-                       years, colours, m_mark,
-                       bar_color="#bdbdbd", whisker_color="black", jitter=0.12):
-    """Top-right panel – electricity share bars + dots."""
-    years = [int(y) for y in (years if hasattr(years, "__iter__") else [years])]
-    df_r  = df_share[df_share["region"] == region]
-
-    stats = (df_r[df_r["scenario"] == base_scenario]
-             .loc[lambda d: d["year"].isin(years)]
-             .groupby("year")["electricity_share"]
-             .agg(["mean", "min", "max"])
-             .reindex(years))
-    if stats["mean"].isna().all():
-        ax.axis("off"); return
-
-    means, x_pos = stats["mean"], np.arange(len(years))
-    lowers, uppers = means - stats["min"], stats["max"] - means
-
-    ax.bar(x_pos, means, yerr=[lowers, uppers],
-           capsize=5, color=bar_color, edgecolor=bar_color,
-           error_kw={"elinewidth":1.5, "ecolor":whisker_color, "capsize":5},
-           width=.6, zorder=2)
-
-    for s_idx, scen in enumerate(compare_scenarios):
-        df_s = df_r[df_r["scenario"] == scen]
-        if df_s.empty: continue
-        for m_idx, model in enumerate(sorted(df_s["model"].unique())):
-            df_m = df_s[(df_s["model"] == model) & (df_s["year"].isin(years))]
-            offset = (-1)**s_idx * (jitter + m_idx*0.02)
-            ax.scatter(x_pos + offset,
-                       df_m.sort_values("year")["electricity_share"],
-                       marker=m_mark[model], s=70, alpha=.7,
-                       color=colours.get(scen, "black"),
-                       edgecolors="dimgrey", linewidths=.3, zorder=3)
-
-    ax.set_xticks(x_pos); ax.set_xticklabels(years, fontsize=10)
-    ax.set_ylabel("(%)", fontsize=10)
-    ax.tick_params(axis="y", labelsize=10)
-    ax.set_title("Electricity Share in FE Compared to Current Trends", fontsize=14, pad=6)
-    ax.grid(True, ls="--", alpha=.3)
-
-# ................................................................
-def plot_single_polar_ax(dfc, *, ax, region, year, variables,
-                         models, scenarios, all_vars,
-                         colours, m_mark,
-                         var_label_fs=10, r_tick_fs=10, title_fs=14,
-                         frida_unc = False, frida_unc_data):
-    """One polar chart (bottom row)."""
-    sub = (dfc[(dfc["region"]==region) & (dfc["year"]==year) &
-               (dfc["variable"].isin(variables)) &
-               (dfc["model"].isin(models)) &
-               (dfc["scenario"].isin(scenarios))])
-    if sub.empty:
-        ax.text(.5, .5, "no data", ha="center", va="center"); ax.axis("off"); return
-
-    sub["disp"] = sub["variable"].map(lambda v: _display_name(v, all_vars))
-    # var_list, ang = sorted(sub["disp"].unique()), None
-    var_list = var_dict.keys()
-    ang = np.linspace(0, 2*np.pi, len(var_list), endpoint=False)
-    pv = sub.pivot_table(index=["model","scenario"], columns="disp",
-                         values="percentage_change", aggfunc="first")
-
-    # limit = pv.loc[:, var_list].stack().abs().max(skipna=True) or 100
-    # limit = 50 * math.ceil((limit*1.1)/50)
-    # ax.set_ylim(-limit, limit)
-
-
-    for m in models:
-        mk = m_mark[m]
-        for s in scenarios:
-            print(s)
-            
-            if (m,s) not in pv.index: continue
-            # vals, mask = pv.loc[(m,s), var_list], None
-            # mask = vals.notna()
-            # if mask.any() and m != 'FRIDAv2.1':
-            #     ax.scatter(ang[mask], vals[mask],
-            #                marker=mk, s=90, alpha=.75,
-            #                color=colours.get(s, "grey"),
-            #                edgecolors="dimgrey", linewidths=.3)
-                
-            if m == 'FRIDAv2.1' and frida_unc == True:
-                
-                for v_i, var in enumerate(var_list):
-                    
-                    med_val = df_perc_unc.loc[(df_perc_unc['Variable'] == var_dict[var]) &
-                                              (df_perc_unc['Scenario'] == s) &
-                                              (df_perc_unc['Percentile'] == 50)
-                                              ][str(year)].values[0]
-                    
-                    ax.scatter(ang[v_i], med_val,
-                               marker=mk, s=90, alpha=.75,
-                               color=colours.get(s, "grey"),
-                               edgecolors="dimgrey", linewidths=.3)
-                    
-                    unc_vals = np.asarray([
-                        df_perc_unc.loc[(df_perc_unc['Variable'] == var_dict[var]) &
-                            (df_perc_unc['Scenario'] == s) &
-                            (df_perc_unc['Percentile'] == 5)
-                            ][str(year)].values[0],
-                        df_perc_unc.loc[(df_perc_unc['Variable'] == var_dict[var]) &
-                            (df_perc_unc['Scenario'] == s) &
-                            (df_perc_unc['Percentile'] == 95)
-                            ][str(year)].values[0],
-                        
-                        ])
-                    ax.plot(np.repeat(ang[v_i], 2), unc_vals, 
-                            color=colours.get(s, "grey"), alpha=.75)
-
-                    print(f'{s} {var}: Median {med_val}, 5th {unc_vals[0]}, 95th {unc_vals[1]}')
-
-    l1, l2 = ax.get_ylim()
-    
-    limit = np.amax((np.abs(l1), np.abs(l2)))
 
-    # print(limit)
-    
-    ax.set_xticks(ang); ax.set_xticklabels(var_list, fontsize=var_label_fs)
-    yt = mticker.MaxNLocator(nbins=5, prune="both").tick_values(-limit, limit)
-    ax.set_yticks(yt); ax.set_yticklabels([f"{t:.0f}%" for t in yt], fontsize=r_tick_fs)
-    ax.grid(True, ls="--", alpha=.6)
-    # ax.axhline(0, color="grey", lw=1)
-    # ax.axhline(0, color="grey")
-    ax.plot(np.linspace(0, 2*np.pi, 100), np.zeros(100), color='grey', lw=1)
+# In[26]:
 
-    ax.set_title(str(year), y=1.10, fontsize=title_fs)
 
-# ----------------------------------------------------------------
-# 3.  master plot
-# ----------------------------------------------------------------
-def create_cap_elec_polar_dashboard(
-        *, df, df_changes, df_share,
-        region, years_bottom,
-        scenarios, models, baseline_scenario,
-        all_vars_names, scenario_names, groups,
-        colours,                      
-        save_dir="../figures/combined_panels/uncertainties/",
-        figsize=(20,12), share_years=(2040,2070,2100)):
-
-    # manual legend overrides – use if dicts uncommented
-    scen_disp = globals().get("scenario_display", {})
-    mod_disp  = globals().get("model_display", {})
-
-    m_mark  = _model_markers(models)
-    scen_no_base = [s for s in scenarios if s != baseline_scenario]
-
-    pathlib.Path(save_dir).mkdir(parents=True, exist_ok=True)
-    fig = plt.figure(figsize=figsize)
-    gs  = gridspec.GridSpec(2, 3, figure=fig,
-                            height_ratios=[1,1], width_ratios=[1,1,1],
-                            hspace=.45, wspace=.25)
-
-    # --- top-left ---------------------------------------------------------
-    ax_ts = fig.add_subplot(gs[0, :])
-    plot_total_capacity_ax(df, ax=ax_ts, region=region,
-                           models=models, scenarios=scenarios,
-                           all_vars=all_vars_names, colours=colours,
-                           frida_unc=True, frida_unc_data=frida_unc_data)
-
-    # --- top-right --------------------------------------------------------
-    # ax_share = fig.add_subplot(gs[0, 2])
-    # plot_elec_share_ax(ax_share, df_share, region=region,
-    #                    base_scenario=baseline_scenario,
-    #                    compare_scenarios=scen_no_base,
-    #                    years=share_years,
-    #                    colours=colours, m_mark=m_mark)
-
-    # --- bottom row -------------------------------------------------------
-    p_vars = groups["Installed Electricity Capacity"]
-    for col, yr in enumerate(years_bottom):
-        axp = fig.add_subplot(gs[1, col], projection="polar")
-        plot_single_polar_ax(df_changes, ax=axp, region=region, year=yr,
-                             variables=p_vars, models=models,
-                             scenarios=scen_no_base,
-                             all_vars=all_vars_names,
-                             colours=colours, m_mark=m_mark,
-                             frida_unc=True, frida_unc_data=frida_unc_data)
-
-    # row title
-    fig.text(.52, .48, "Electricity Capacity by Technology Compared to Current Trends",
-             ha="center", va="bottom", fontsize=14)
-
-    # --- legend -----------------------------------------------------------
-    scen_handles = [mlines.Line2D([], [], color=colours[s], marker="o",
-                                  ls="None", ms=8,
-                                  label=scen_disp.get(s, scenario_names.get(s,s)))
-                    for s in scen_no_base]
-
-    bar_patch = mpatches.Patch(facecolor="#bdbdbd", edgecolor="#bdbdbd",
-                               label=scen_disp.get(baseline_scenario,
-                                                   scenario_names.get(baseline_scenario,
-                                                                      baseline_scenario)))
-
-    model_handles = [mlines.Line2D([], [], color="black",
-                                   marker=m_mark[m], ls="None", ms=8,
-                                   label=mod_disp.get(m, m.replace("_"," ")))
-                     for m in models]
-
-    line_handles = [mlines.Line2D([], [], color="black",
-                                  ls=model_linestyles.get(m,"-"), lw=2.5,
-                                  label=mod_disp.get(m, m.replace("_"," ")))
-                    for m in models]
-
-    handles_all = scen_handles + [bar_patch] + model_handles + line_handles
-    fig.legend(handles=handles_all,
-               ncol=len(handles_all),
-               bbox_to_anchor=(.5,.03), loc="lower center",
-               fontsize=9, frameon=True,
-               title="Scenario               |               Model marker               |               Model line")
-
-    # --- title & save -----------------------------------------------------
-    fig.suptitle("Heatwaves and Drought Illustrative Scenarios",
-                 fontsize=18, fontweight="bold", y=.975)
-    fig.tight_layout(rect=[0,.07,1,.94])
-
-    png = f"{save_dir}/dashboard_cap_elec_{region.replace(' ','_')}.png"
-    pdf = png.replace(".png", ".pdf")
-    fig.savefig(png, dpi=150, bbox_inches="tight")
-    fig.savefig(pdf, dpi=300, bbox_inches="tight",
-                metadata={"Title":"", "Subject":"", "Creator":"", "Producer":""})
-    plt.close(fig)
-    print("saved:", pathlib.Path(png).name, "&", pathlib.Path(pdf).name)
+# One dashboard per (region, scenario set, model set, years) job, rendered in
+# a process pool; outputs and timings go to batch_manifest.json. Dashboards
+# whose data and arguments did not change since the last run are skipped, and
+# each worker builds the figure skeleton (axes, legend, layout) once and only
+# swaps the data of every further region in (see derp_tools/templates.py).
+dashboard_jobs = [
+    {"region": region,
+     "scenarios": scenarios_of_interest,
+     "models": models_of_interest,
+     "years_bottom": [2040, 2070, 2100]}
+    for region in regions_of_interest
+]
 
+with pipeline_log.stage("dashboards", n_jobs=len(dashboard_jobs)):
+    render_batch(
+        create_cap_elec_polar_dashboard,
+        dashboard_jobs,
+        shared=dict(
+            df=df,
+            df_changes=df_with_changes,
+            df_share=df_share,
+            baseline_scenario=baseline_scenario,
+            all_vars_names=all_vars_names,
+            scenario_names=scenario_names,
+            groups=groups,
+            colours=colours,
+            frida_unc_data=frida_unc_data,
+            perc_unc_table=perc_unc_table,
+            var_dict=var_dict,
+            model_linestyles=model_linestyles,
+            scenario_display=scenario_display,
+            share_years=[2040, 2070, 2100],
+            force=False,    # True redraws figures that are already up to date
+            reuse_template=True,
+        ),
+        manifest_path="../figures/combined_panels/uncertainties/batch_manifest.json",
+    )
+close_templates()
 
-# In[26]:
 
+#%%
+
+# Export the derived tables behind the figures (Parquet, partitioned by
+# model/scenario), so they can be reused without re-running this script:
+# read_derived("data/derived/baseline_changes", filters={"scenario": ...})
+from derp_tools.export import write_derived
 
-create_cap_elec_polar_dashboard(
-    df=df,
-    df_changes=df_with_changes,
-    df_share=df_share,
-    region="World",
-    years_bottom=[2040, 2070, 2100],
-    scenarios=scenarios_of_interest,
-    models=models_of_interest,
-    baseline_scenario=baseline_scenario,
-    all_vars_names=all_vars_names,
-    scenario_names=scenario_names,
-    groups=groups,
-    colours=colours,              
-    share_years=[2040, 2070, 2100]
-)
+derived_dir = "data/derived"
+with pipeline_log.stage("export") as st:
+    write_derived(df_with_changes, os.path.join(derived_dir, "baseline_changes"),
+                  description=f"Changes relative to {baseline_scenario}")
+    write_derived(merged, os.path.join(derived_dir, "electricity_share"),
+                  description=f"Share (%) of {electricity_var} in {total_var}")
+    write_derived(perc_unc_table.to_frame(), os.path.join(derived_dir, "percentage_capacity_differences"),
+                  description=f"Long format of {perc_unc_file}")
 
 
+#%%
+
+# Where the run spent its time and memory, per stage
+pipeline_log.write("pipeline_logs/frida_uncertainties")
+print(pipeline_log.to_frame()[["stage", "wall_seconds", "cpu_seconds", "peak_rss_mb", "rows"]])
@@ -0,0 +1,88 @@
+"""
+Check of the FRIDA ensemble engine on a synthetic ensemble.
+
+Writes ensemble runs (derp_tools/synthetic.py) for a baseline and a few
+scenarios, with one variable at 0 in the baseline, then compares the
+percentile differences of ``ensemble_percentile_differences`` (read in small
+chunks) with a PercentileTable computed directly from the generated values.
+The time and memory of the engine are printed from its pipeline log:
+
+    python check_ensemble.py
+    python check_ensemble.py --members 2000 --chunk-size 5000
+"""
+import argparse
+import pathlib
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from derp_tools.frida import EnsembleMembers, PercentileTable, ensemble_percentile_differences
+from derp_tools.instrument import PipelineLog
+from derp_tools.synthetic import CAPACITY_COMPONENTS, write_synthetic_ensemble
+
+BASELINE = "Baseline"
+SCENARIOS = ["Scenario 001", "Scenario 002", "Scenario 003"]
+YEARS = [2040, 2070, 2100]
+PERCENTILES = [50, 5, 95]
+# Variable reported as 0 in the baseline: its differences are all NaN
+ZERO_VARIABLE = "Capacity|Geothermal"
+
+
+def expected_table(values: dict, variables) -> PercentileTable:
+    """Percentile differences computed directly from the generated values."""
+    rows = []
+    base = values[BASELINE]
+    for scenario in SCENARIOS:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diffs = np.where(base != 0, (values[scenario] - base) / base * 100, np.nan)
+        for p in PERCENTILES:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN columns
+                pct = np.nanpercentile(diffs, p, axis=0)
+            for v, variable in enumerate(variables):
+                rows.append({"Variable": variable, "Scenario": scenario, "Percentile": p,
+                             **{str(y): pct[v, i] for i, y in enumerate(YEARS)}})
+    return PercentileTable.from_frame(pd.DataFrame(rows), source="expected")
+
+
+def check(n_members: int, chunk_size: int) -> bool:
+    variables = list(CAPACITY_COMPONENTS)
+    with tempfile.TemporaryDirectory() as tmp:
+        values = write_synthetic_ensemble(tmp, [BASELINE] + SCENARIOS, variables, YEARS,
+                                          n_members, zero_in={BASELINE: [ZERO_VARIABLE]})
+        log = PipelineLog("ensemble check")
+        with log.stage("ensemble percentiles") as st:
+            table = st.output(ensemble_percentile_differences(
+                EnsembleMembers(tmp, chunk_size=chunk_size), BASELINE, SCENARIOS,
+                variables, YEARS, PERCENTILES))
+            st.output(table.to_frame())
+
+    expected = expected_table(values, variables)
+    got, want = table.to_wide(), expected.to_wide()
+    keys, year_cols = ["Variable", "Scenario", "Percentile"], [str(y) for y in YEARS]
+    same_rows = got[keys].equals(want[keys])
+    same_values = same_rows and np.allclose(got[year_cols].to_numpy(), want[year_cols].to_numpy(),
+                                            equal_nan=True)
+    zero_rows = got[got["Variable"] == ZERO_VARIABLE]
+    zero_kept = (len(zero_rows) == len(SCENARIOS) * len(PERCENTILES)
+                 and zero_rows[year_cols].isna().all().all())
+
+    record = log.records[-1]
+    print(f"{n_members} members x {len(variables)} variables x {len(YEARS)} years, "
+          f"chunks of {chunk_size} rows: {record['wall_seconds']:.3f} s, "
+          f"peak RSS growth {record['peak_rss_growth_mb']} MB")
+    print(f"rows as expected: {same_rows}, values as expected: {same_values}, "
+          f"{ZERO_VARIABLE} rows kept as NaN: {zero_kept}")
+    return same_rows and same_values and zero_kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=500, help="members per scenario (default 500)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows read at a time (default 1000)")
+    args = parser.parse_args()
+    sys.exit(0 if check(args.members, args.chunk_size) else 1)
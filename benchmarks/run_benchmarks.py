@@ -0,0 +1,192 @@
+"""
+Benchmarks of the analysis pipeline on synthetic IAMC data.
+
+Each scale generates a synthetic dataset (derp_tools/synthetic.py), writes it
+as one csv file per scenario, and times every stage (loading, baseline
+changes, share, dashboard) over repeated runs. Results are stored as one
+JSON file per run in results/, named after the git commit, so that runs of
+different commits can be compared:
+
+    python run_benchmarks.py                   # small and medium scales
+    python run_benchmarks.py --scales large --repeat 3
+    python run_benchmarks.py --compare         # table of all stored runs
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from derp_tools.changes import compute_baseline_changes
+from derp_tools.instrument import PipelineLog
+from derp_tools.loading import load_and_concat_files_then_pyam
+from derp_tools.shares import compute_share
+from derp_tools.store import CompactStore
+from derp_tools.synthetic import CAPACITY_COMPONENTS, synthetic_iamc, synthetic_labels, write_synthetic_files
+
+RESULTS_DIR = pathlib.Path(__file__).resolve().parent / "results"
+
+# Arguments of synthetic_iamc per scale; "frida" is the size of the three
+# FRIDA scenario files (23 variables, 1980-2150)
+SCALES = {
+    "frida":  dict(n_models=1, n_scenarios=3, n_regions=1, n_variables=23,
+                   years=range(1980, 2151, 5)),
+    "small":  dict(n_models=3, n_scenarios=5, n_regions=5, n_variables=50),
+    "medium": dict(n_models=5, n_scenarios=10, n_regions=20, n_variables=200),
+    "large":  dict(n_models=6, n_scenarios=12, n_regions=25, n_variables=300),
+}
+
+STAGES = ["load", "baseline changes", "compact changes", "share", "dashboard"]
+
+
+def git_commit() -> str:
+    """Short hash of the checked-out commit, with a '+' if the tree has changes."""
+    try:
+        repo = pathlib.Path(__file__).resolve().parents[1]
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def dashboard_arguments(labels: dict, out_dir: str) -> dict:
+    """Keyword arguments of the dashboard for a synthetic dataset (World region)."""
+    scenarios = labels["scenario"][:3]
+    palette = ["#1b9e77", "#d95f02", "#7570b3"]
+    return dict(
+        region="World", years_bottom=[2040, 2070, 2100],
+        scenarios=scenarios, models=labels["model"][:4], baseline_scenario=scenarios[0],
+        all_vars_names={v: v.split("|")[-1] for v in labels["variable"]},
+        scenario_names={s: s for s in scenarios},
+        groups={"Installed Electricity Capacity": CAPACITY_COMPONENTS},
+        colours=dict(zip(scenarios, palette)),
+        frida_unc_data=None, perc_unc_table=None,
+        var_dict={v.split("|")[-1]: v for v in CAPACITY_COMPONENTS},
+        save_dir=out_dir, force=True,
+    )
+
+
+def run_stages(log: PipelineLog, data_dir: str, labels: dict, out_dir: str,
+               max_workers: int):
+    """One timed run of every stage on the files in ``data_dir``."""
+    from derp_tools.dashboard import create_cap_elec_polar_dashboard
+
+    with log.stage("load") as st:
+        df = st.output(load_and_concat_files_then_pyam(data_dir, file_types=["csv"],
+                                                       max_workers=max_workers))
+    with log.stage("baseline changes") as st:
+        changes = st.output(compute_baseline_changes(df, labels["scenario"][0]))
+    with log.stage("compact changes") as st:
+        st.output(CompactStore.from_data(df).changes(labels["scenario"][0]))
+    with log.stage("share") as st:
+        st.output(compute_share(df, "Final Energy|Electricity", "Final Energy"))
+    with log.stage("dashboard"):
+        create_cap_elec_polar_dashboard(df=df, df_changes=changes, df_share=None,
+                                        **dashboard_arguments(labels, out_dir))
+
+
+def run_scale(name: str, size: dict, repeat: int, max_workers: int) -> dict:
+    """Time every stage ``repeat`` times on one synthetic dataset."""
+    import matplotlib
+    matplotlib.use("Agg")
+
+    labels = synthetic_labels(**{k: v for k, v in size.items() if k != "years"})
+    with tempfile.TemporaryDirectory() as tmp:
+        wide = synthetic_iamc(**size, missing=0.02)
+        write_synthetic_files(os.path.join(tmp, "data"), wide)
+        n_points = int(wide.iloc[:, 5:].notna().to_numpy().sum())
+        print(f"{name}: {len(wide)} series, {n_points} data points")
+        del wide
+
+        # The stages' own messages and warnings are not of interest here
+        log = PipelineLog(f"benchmark {name}")
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for _ in range(repeat):
+                run_stages(log, os.path.join(tmp, "data"), labels, tmp, max_workers)
+
+    # Only the top-level stages are summarised; per-file and per-panel
+    # stages stay in the raw records
+    records = pd.DataFrame(log.records)
+    summary = {}
+    for stage in STAGES:
+        runs = records[records["stage"] == stage]
+        summary[stage] = {
+            "wall_min": float(runs["wall_seconds"].min()),
+            "wall_median": float(runs["wall_seconds"].median()),
+            "cpu_median": float(runs["cpu_seconds"].median()),
+            "peak_rss_mb": float(runs["peak_rss_mb"].max()) if runs["peak_rss_mb"].notna().any() else None,
+            "rows": None if pd.isna(runs["rows"].iloc[-1]) else int(runs["rows"].iloc[-1]),
+        }
+    return {"size": size, "series": len(labels["model"]) * len(labels["scenario"]) *
+            len(labels["region"]) * len(labels["variable"]), "data_points": n_points,
+            "stages": summary, "records": log.records}
+
+
+def run(scales, repeat: int, max_workers: int) -> str:
+    """Run the benchmarks of ``scales`` and store them in results/; returns the file path."""
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "repeat": repeat,
+        "scales": {name: run_scale(name, SCALES[name], repeat, max_workers) for name in scales},
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{commit.replace('+', '-dirty')}.json"
+    with open(path, "w") as f:
+        json.dump(result, f, indent=1, default=str)
+    print(f"Results written to {path}")
+    return str(path)
+
+
+def compare(results_dir=RESULTS_DIR) -> pd.DataFrame:
+    """Median wall time (s) per scale and stage of every stored run, one column per run."""
+    columns = {}
+    for path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        with open(path) as f:
+            result = json.load(f)
+        label = f"{result['created'][:16]} {result['commit']}"
+        columns[label] = {(scale, stage): timing["wall_median"]
+                          for scale, run_ in result["scales"].items()
+                          for stage, timing in run_["stages"].items()}
+    if not columns:
+        print(f"No benchmark results in {results_dir}")
+        return pd.DataFrame()
+    table = pd.DataFrame(columns)
+    table.index.names = ["scale", "stage"]
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage (default 5)")
+    parser.add_argument("--max-workers", type=int, default=None,
+                        help="loader process pool size (default: one per file, capped at the CPUs)")
+    parser.add_argument("--compare", action="store_true", help="only print the stored results")
+    args = parser.parse_args()
+
+    if not args.compare:
+        run(args.scales, args.repeat, args.max_workers)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(compare())
@@ -0,0 +1,7 @@
+"""
+Shared helpers for the DERPs analysis scripts and notebooks.
+
+The sub-modules are imported explicitly (e.g. ``from derp_tools.loading import
+load_and_concat_files_then_pyam``) so that importing the package itself stays
+cheap and does not pull in pandas, pyam or matplotlib.
+"""
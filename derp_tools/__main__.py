@@ -0,0 +1,6 @@
+"""``python -m derp_tools <config>``: see derp_tools/cli.py."""
+import sys
+
+from derp_tools.cli import main
+
+sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Batch rendering of dashboards over many (region, scenario set, model set,
+years) jobs in a process pool.
+
+The input data is handed to the workers once, not once per job: with the
+``fork`` start method (Linux, macOS) the workers inherit it read-only from
+the parent, otherwise each worker receives it once through the pool
+initializer. Workers draw with the non-interactive Agg backend.
+"""
+import json
+import multiprocessing
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from derp_tools.instrument import PipelineLog, record_stages
+
+# Render function and keyword arguments shared by every job of the batch.
+# Set in the parent before the pool is created, so forked workers see it as is.
+_SHARED: Dict[str, object] = {}
+
+
+def _init_worker(shared: Optional[dict] = None):
+    """Pool initializer: non-interactive backend and (without fork) the shared inputs."""
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    if shared is not None:
+        _SHARED.clear()
+        _SHARED.update(shared)
+
+
+def job_name(job: dict) -> str:
+    """Name of a job for the manifest: its ``name`` entry, or the region plus suffix."""
+    if "name" in job:
+        return str(job["name"])
+    return f"{job.get('region', 'job')}{job.get('file_suffix', '')}"
+
+
+def _run_job(position: int, job: dict) -> dict:
+    """Render one job with the shared inputs; errors are reported, not raised."""
+    render_fn = _SHARED["render_fn"]
+    kwargs = {k: v for k, v in job.items() if k != "name"}
+
+    # Stages of the job (panels, saves) are collected here and merged into
+    # the parent's log, as a worker's own log is not seen by the parent
+    log = PipelineLog(job_name(job))
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        with log.stage(f"render {job_name(job)}"):
+            outputs = render_fn(**_SHARED["kwargs"], **kwargs)
+        status, error = "ok", None
+    except Exception as e:
+        outputs, status, error = None, "error", f"{type(e).__name__}: {e}"
+
+    return {
+        "job": job_name(job),
+        "position": position,
+        "pid": os.getpid(),
+        "status": status,
+        "error": error,
+        "outputs": [str(p) for p in (outputs or [])],
+        "wall_seconds": round(time.perf_counter() - start_wall, 4),
+        "cpu_seconds": round(time.process_time() - start_cpu, 4),
+        "arguments": {k: v for k, v in kwargs.items()
+                      if isinstance(v, (str, int, float, bool, list, tuple))},
+        "stages": log.records,
+    }
+
+
+def write_manifest(manifest_path: str, results: List[dict], total_seconds: float,
+                   max_workers: int):
+    """Write the outputs and timings of a batch as JSON."""
+    pathlib.Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "max_workers": max_workers,
+        "total_seconds": round(total_seconds, 4),
+        "n_jobs": len(results),
+        "n_failed": sum(r["status"] != "ok" for r in results),
+        "jobs": results,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1, default=str)
+
+
+# -------------------
+# Function to render a batch of dashboards
+# -------------------
+
+def render_batch(render_fn: Callable, jobs: List[dict], *, shared: Optional[dict] = None,
+                 max_workers: Optional[int] = None,
+                 manifest_path: Optional[str] = None) -> List[dict]:
+    """
+    Render one dashboard per job in a process pool.
+
+    Parameters:
+    -----------
+    render_fn : callable
+        Dashboard function taking keyword arguments and returning the list of
+        files it wrote, e.g. ``derp_tools.dashboard.create_cap_elec_polar_dashboard``
+    jobs : list of dict
+        Keyword arguments that differ between dashboards, typically
+        ``region``, ``scenarios``, ``models`` and ``years_bottom``. An optional
+        ``name`` entry labels the job in the manifest. Jobs writing to the
+        same directory need distinct regions or a ``file_suffix``.
+    shared : dict, optional
+        Keyword arguments common to all jobs (data frames, colours, ...).
+        These are not pickled per job.
+    max_workers : int, optional
+        Size of the process pool. Defaults to one worker per job (capped at
+        the number of CPUs); 1 renders in-process with the current backend.
+    manifest_path : str, optional
+        If given, a JSON manifest of the outputs and per-job timings is written there
+
+    Returns:
+    --------
+    list of dict
+        One record per job, in job order (status, outputs, timings)
+    """
+    shared = dict(shared or {})
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+
+    _SHARED.clear()
+    _SHARED.update({"render_fn": render_fn, "kwargs": shared})
+
+    start = time.perf_counter()
+    try:
+        if max_workers > 1 and len(jobs) > 1:
+            if "fork" in multiprocessing.get_all_start_methods():
+                context, initargs = multiprocessing.get_context("fork"), (None,)
+            else:
+                # No fork: every worker gets the shared inputs once at start-up
+                context, initargs = multiprocessing.get_context(), (dict(_SHARED),)
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                     initializer=_init_worker, initargs=initargs) as pool:
+                futures = [pool.submit(_run_job, i, job) for i, job in enumerate(jobs)]
+                results = [future.result() for future in futures]
+        else:
+            results = [_run_job(i, job) for i, job in enumerate(jobs)]
+    finally:
+        _SHARED.clear()
+    total_seconds = time.perf_counter() - start
+
+    for result in results:
+        record_stages(result["stages"])
+        if result["status"] == "ok":
+            print(f"Rendered {result['job']} in {result['wall_seconds']:.1f} s")
+        else:
+            print(f"Error rendering {result['job']}: {result['error']}")
+
+    if manifest_path is not None:
+        write_manifest(manifest_path, results, total_seconds, max_workers)
+    return results
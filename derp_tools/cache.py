@@ -0,0 +1,253 @@
+"""
+Persistent cache of parsed IAMC input files.
+
+Each parsed (long format) file is stored as an uncompressed Arrow IPC file so
+that warm runs can memory-map it instead of re-parsing the CSV/XLSX source.
+Requires pyarrow; without it the cache is disabled and every file is parsed.
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Bump when the layout of the cached frames changes
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_BYTES = 512 * 1024 ** 2
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a file (blake2b, read in chunks)."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_state(path: str) -> dict:
+    """mtime, size and content hash of a source file, as stored with its cache entry."""
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "digest": file_digest(path)}
+
+
+class ParsedFileCache:
+    """
+    Size-bounded cache of parsed input files, keyed by path, mtime and content hash.
+
+    An entry is reused as-is while the source file keeps its mtime and size.
+    If either changed the file is re-hashed: same content means the entry is
+    still valid (e.g. after a fresh checkout), different content invalidates
+    it. Least recently used entries are evicted once ``max_bytes`` is exceeded.
+
+    Several processes (the loader's workers, notebooks sharing a cache
+    folder) can use one cache: ``index.json`` is only changed under a file
+    lock, re-read and merged with the changes of this process, and replaced
+    atomically.
+
+    Parameters:
+    -----------
+    cache_dir : str
+        Directory holding the Arrow files and the ``index.json`` bookkeeping
+    max_bytes : int, optional
+        Upper bound on the total size of the cached Arrow files
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = pa is not None
+        if not self.enabled:
+            print("pyarrow is not installed - parsed input files will not be cached")
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._lock_path = os.path.join(cache_dir, "index.lock")
+        self._entries = self._read_index()
+
+    # -------------------
+    # Bookkeeping
+    # -------------------
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get("version") != CACHE_FORMAT_VERSION:
+            return {}
+        # Drop entries whose data file has gone missing
+        return {k: e for k, e in index.get("entries", {}).items()
+                if os.path.exists(os.path.join(self.cache_dir, e["file"]))}
+
+    def _write_index(self):
+        tmp = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": CACHE_FORMAT_VERSION, "entries": self._entries}, f, indent=1)
+        os.replace(tmp, self._index_path)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the index, across processes."""
+        with open(self._lock_path, "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _update_index(self, updates: Optional[Dict[str, dict]] = None,
+                      stale: Iterable[str] = (), evict: bool = False):
+        """
+        Apply this process's changes to the index on disk: under the lock the
+        index is re-read (keeping entries written by other processes), the
+        changes applied and the result written back. ``stale`` entries are
+        dropped unless another process has refreshed them meanwhile.
+        """
+        with self._locked():
+            self._entries = self._read_index()
+            for key in stale:
+                entry = self._entries.get(key)
+                if entry is not None and not self._is_valid(dict(entry), entry["path"]):
+                    self._remove(key)
+            self._entries.update(updates or {})
+            if evict:
+                self.evict()
+            self._write_index()
+
+    @staticmethod
+    def _entry_key(path: str, variant: str) -> str:
+        return hashlib.blake2b(f"{os.path.abspath(path)}|{variant}".encode(),
+                               digest_size=16).hexdigest()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except OSError:
+                pass
+
+    def _is_valid(self, entry: dict, path: str) -> bool:
+        """Check an entry against the source file, re-hashing only if mtime/size changed."""
+        st = os.stat(path)
+        if entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return True
+        if entry["size"] == st.st_size and entry["digest"] == file_digest(path):
+            entry["mtime_ns"] = st.st_mtime_ns
+            return True
+        return False
+
+    # -------------------
+    # Public interface
+    # -------------------
+
+    def get(self, path: str, variant: str = "") -> Optional[pd.DataFrame]:
+        """Return the cached frame for ``path`` (memory-mapped), or None on a miss."""
+        if not self.enabled:
+            return None
+        key = self._entry_key(path, variant)
+        if key not in self._entries:
+            return None
+        entry = dict(self._entries[key])
+        if not self._is_valid(entry, path):
+            self._update_index(stale=[key])
+            return None
+
+        try:
+            source = pa.memory_map(os.path.join(self.cache_dir, entry["file"]), "r")
+        except OSError:
+            # Evicted by another process since the index was read
+            return None
+        table = pa.ipc.open_file(source).read_all()
+        entry["last_used"] = time.time()
+        self._update_index({key: entry})
+        # split_blocks keeps the numeric columns as zero-copy views of the map
+        return table.to_pandas(split_blocks=True)
+
+    def put(self, path: str, frame: pd.DataFrame, variant: str = "",
+            state: Optional[dict] = None):
+        """
+        Store the parsed frame for ``path`` and evict old entries if needed.
+
+        ``state`` is the ``source_state`` of the file taken before it was
+        parsed, so that an edit made during the parse invalidates the entry
+        instead of being cached as the parsed content; without it the file
+        is hashed now.
+        """
+        if not self.enabled:
+            return
+        key = self._entry_key(path, variant)
+        state = source_state(path) if state is None else state
+
+        # Written under a temporary name: another process may be reading the entry
+        file_name = f"{key}.arrow"
+        target = os.path.join(self.cache_dir, file_name)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, target)
+
+        self._update_index({key: {
+            "path": os.path.abspath(path),
+            "variant": variant,
+            "mtime_ns": state["mtime_ns"],
+            "size": state["size"],
+            "digest": state["digest"],
+            "file": file_name,
+            "nbytes": os.path.getsize(target),
+            "last_used": time.time(),
+        }}, evict=True)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drop the entries of one source file, or of every file if ``path`` is None."""
+        if not self.enabled:
+            return
+        target = None if path is None else os.path.abspath(path)
+        with self._locked():
+            self._entries = self._read_index()
+            for key in [k for k, e in self._entries.items() if target in (None, e["path"])]:
+                self._remove(key)
+            self._write_index()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in ``max_bytes``."""
+        by_age = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+        total = sum(e["nbytes"] for e in self._entries.values())
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key]["nbytes"]
+            self._remove(key)
+
+    def size(self) -> int:
+        """Total size in bytes of the cached Arrow files."""
+        if not self.enabled:
+            return 0
+        return sum(e["nbytes"] for e in self._entries.values())
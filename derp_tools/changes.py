@@ -0,0 +1,126 @@
+"""
+Changes of IAMC data relative to baseline scenarios.
+"""
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+import pyam
+
+# Columns that identify a series independently of its scenario
+SERIES_COLUMNS = ["model", "region", "variable"]
+
+
+# -------------------
+# Helpers
+# -------------------
+
+def as_long(df) -> pd.DataFrame:
+    """Return the long data of a pyam.IamDataFrame, or the DataFrame itself."""
+    return df.data if isinstance(df, pyam.IamDataFrame) else df
+
+
+def factorize_columns(data: pd.DataFrame, columns: List[str]):
+    """
+    Integer codes for the unique combinations of ``columns``.
+
+    Returns the codes (one per row, numbered by first appearance) and the
+    position of the first row of each combination, so that its labels are
+    ``data[columns].iloc[first_rows]``.
+    """
+    combined = np.zeros(len(data), dtype=np.int64)
+    for col in columns:
+        codes, labels = pd.factorize(data[col])
+        combined = combined * len(labels) + codes
+    codes, uniques = pd.factorize(combined)
+
+    # Scatter in reverse so that the first occurrence of each code wins
+    first_rows = np.empty(len(uniques), dtype=np.int64)
+    first_rows[codes[::-1]] = np.arange(len(data) - 1, -1, -1)
+    return codes, first_rows
+
+
+def align_on_series(data: pd.DataFrame, scenarios: List[str], value_col: str = "value",
+                    with_labels: bool = False):
+    """
+    Scatter the values of ``scenarios`` onto an aligned array.
+
+    Returns ``(stack, key_codes, year_codes)`` where ``stack`` has shape
+    (len(scenarios), n_series, n_years) with NaN where a scenario does not
+    report a (model, region, variable) series in a year, and ``key_codes`` /
+    ``year_codes`` locate every row of ``data`` on the last two axes.
+    With ``with_labels=True`` the first row of each series and the sorted
+    years are returned as well, to label the axes.
+    """
+    key_codes, first_rows = factorize_columns(data, SERIES_COLUMNS)
+    year_codes, years = pd.factorize(data["year"], sort=True)
+
+    stack = np.full((len(scenarios), len(first_rows), len(years)), np.nan)
+    scen_pos = pd.Index(scenarios).get_indexer(data["scenario"])
+    rows = scen_pos >= 0
+    stack[scen_pos[rows], key_codes[rows], year_codes[rows]] = data[value_col].to_numpy()[rows]
+    if with_labels:
+        return stack, key_codes, year_codes, first_rows, np.asarray(years)
+    return stack, key_codes, year_codes
+
+
+# -------------------
+# Function to compute changes relative to one or more baselines
+# -------------------
+
+def compute_baseline_changes(df, baseline: Union[str, List[str]],
+                             value_col: str = "value") -> pd.DataFrame:
+    """
+    Add baseline values, absolute and percentage changes to IAMC long data.
+
+    The baseline scenarios are laid out once on an aligned
+    (model, region, variable) x year array, and every row of the data picks its
+    baseline from that array by index instead of through a merge. Percentage
+    changes are only computed where the baseline is reported and non-zero;
+    elsewhere they are NaN.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Data in long format (model, scenario, region, variable, unit, year, value)
+    baseline : str or list
+        Baseline scenario, or several baselines to compare against in one pass
+    value_col : str, optional
+        Name of the value column
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The long data with ``baseline_value``, ``delta`` and
+        ``percentage_change`` columns. With a list of baselines the rows are
+        repeated once per baseline and a ``baseline`` column says which one.
+    """
+    data = as_long(df)
+    baselines = [baseline] if isinstance(baseline, str) else list(dict.fromkeys(baseline))
+
+    missing = [b for b in baselines if b not in set(data["scenario"].unique())]
+    if missing:
+        print(f"Warning: baseline scenario(s) not in data: {missing}")
+
+    stack, key_codes, year_codes = align_on_series(data, baselines, value_col)
+
+    # Broadcast: each row gets the baseline of its series and year, per baseline
+    baseline_value = stack[:, key_codes, year_codes]
+    delta = data[value_col].to_numpy()[np.newaxis, :] - baseline_value
+
+    # Missing and zero baselines are masked instead of producing inf
+    defined = ~np.isnan(baseline_value) & (baseline_value != 0)
+    percentage_change = np.full_like(delta, np.nan)
+    np.divide(delta, baseline_value, out=percentage_change, where=defined)
+    percentage_change *= 100
+
+    if isinstance(baseline, str):
+        result = data.reset_index(drop=True)
+    else:
+        result = data.iloc[np.tile(np.arange(len(data)), len(baselines))].reset_index(drop=True)
+        result["baseline"] = np.repeat(baselines, len(data))
+
+    result["baseline_value"] = baseline_value.ravel()
+    result["delta"] = delta.ravel()
+    result["percentage_change"] = percentage_change.ravel()
+    return result
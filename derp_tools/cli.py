@@ -0,0 +1,489 @@
+"""
+Command-line runs of the dashboard pipeline from a config file.
+
+Regions, scenarios, models, years, output formats and paths are read from a
+JSON (or TOML) config instead of the globals of
+``H&D/Additional Results/01_FRIDA_uncertainties.py``, so that several
+regions or scenario sets are rendered without editing the script:
+
+    python -m derp_tools "H&D/Additional Results/frida_uncertainties.json"
+    python -m derp_tools <config> --validate          # check the config only
+    python -m derp_tools <config> --list              # jobs and files, nothing run
+    python -m derp_tools <config> --regions World --stages render --force
+
+``--validate`` and ``--list`` use the standard library only and finish in a
+fraction of a second. A run imports pandas/pyam when the data is loaded and
+matplotlib only when the render stage runs. Relative paths in the config
+are relative to the config file.
+
+Config keys (see the example next to the FRIDA script):
+
+    data               {"path": ..., "file_types": [...], "cache_dir": ..., "filters": {...}}
+    baseline           baseline scenario, one of ``scenarios``
+    regions, scenarios, models
+    years              years of the polar panels
+    formats            figure formats, some of png, pdf, svg (default png and pdf)
+    stages             stages run by default (default all of STAGES)
+    output             {"figures": ..., "manifest": ..., "derived": ..., "log": ...}
+    uncertainty        {"bands": ..., "percentile_table": ..., "members": ...} (FRIDA)
+    capacity_variables variables of the polar panels
+    colours            colour of every scenario
+    renames            {"variable": {...}, ...} renames applied when loading
+    labels             {"variable": {...}, "scenario": {...}} display names
+    scenario_display, model_display, model_linestyles, var_dict
+    share              {"numerator": ..., "denominator": ...}
+    title, max_workers, force
+"""
+import argparse
+import json
+import os
+import pathlib
+import sys
+import time
+from typing import List, Optional, Tuple
+
+# Stages of a run, in order; the data is loaded by any of them
+STAGES = ["render", "export"]
+
+# Formats the dashboard can save (derp_tools.dashboard.SAVE_OPTIONS)
+FIGURE_FORMATS = ["png", "pdf", "svg"]
+
+REQUIRED_KEYS = ["data", "baseline", "regions", "scenarios", "models", "years", "output"]
+
+DEFAULTS = {
+    "formats": ["png", "pdf"],
+    "stages": list(STAGES),
+    "uncertainty": {},
+    "capacity_variables": [],
+    "colours": {},
+    "renames": {},
+    "labels": {},
+    "scenario_display": {},
+    "model_display": {},
+    "model_linestyles": None,
+    "var_dict": {},
+    "share": {"numerator": "Final Energy|Electricity", "denominator": "Final Energy"},
+    "title": None,
+    "max_workers": None,
+    "force": False,
+}
+
+# Keys of the nested sections, and which of their values are paths
+SECTION_KEYS = {
+    "data": ["path", "file_types", "cache_dir", "filters"],
+    "output": ["figures", "manifest", "derived", "log"],
+    "uncertainty": ["bands", "percentile_table", "members"],
+    "renames": ["model", "scenario", "region", "variable", "unit"],
+    "labels": ["scenario", "variable"],
+    "share": ["numerator", "denominator"],
+}
+PATH_KEYS = {
+    "data": ["path", "cache_dir"],
+    "output": ["figures", "manifest", "derived", "log"],
+    "uncertainty": ["bands", "percentile_table", "members"],
+}
+
+FILE_EXTENSIONS = {"csv": ".csv", "xlsx": ".xlsx"}
+
+FRIDA_MODEL = "FRIDAv2.1"
+
+
+class ConfigError(ValueError):
+    """A config file that cannot be run."""
+
+
+# -------------------
+# Config file
+# -------------------
+
+def read_config(path: str) -> dict:
+    """
+    Read a JSON or TOML (``.toml``, Python 3.11+) config, fill in the
+    defaults and resolve relative paths against the config's folder.
+    """
+    path = pathlib.Path(path)
+    try:
+        if path.suffix == ".toml":
+            import tomllib
+            with open(path, "rb") as f:
+                raw = tomllib.load(f)
+        else:
+            with open(path) as f:
+                raw = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read config {path}: {e}") from e
+    if not isinstance(raw, dict):
+        raise ConfigError(f"Config {path} must hold a mapping of settings")
+
+    config = {key: (dict(value) if isinstance(value, dict) else
+                    list(value) if isinstance(value, list) else value)
+              for key, value in DEFAULTS.items()}
+    config.update(raw)
+    config["_path"] = str(path)
+
+    base = path.resolve().parent
+    for section, keys in PATH_KEYS.items():
+        if not isinstance(config.get(section), dict):
+            continue
+        for key in keys:
+            value = config[section].get(key)
+            if isinstance(value, str):
+                config[section][key] = os.path.normpath(base / value)
+    return config
+
+
+def _is_str_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _is_str_dict(value) -> bool:
+    return isinstance(value, dict) and all(isinstance(v, str) for v in value.values())
+
+
+def validate_config(config: dict) -> Tuple[List[str], List[str]]:
+    """
+    Check a config read by ``read_config`` without loading any data.
+
+    Returns:
+    --------
+    tuple of (list, list)
+        Errors (the config cannot be run) and warnings (it runs, but some
+        panels or files will be missing)
+    """
+    errors, warnings = [], []
+
+    known = set(REQUIRED_KEYS) | set(DEFAULTS) | {"_path"}
+    errors += [f"Unknown key {key!r}" for key in config if key not in known]
+    errors += [f"Missing key {key!r}" for key in REQUIRED_KEYS if key not in config]
+    for section, keys in SECTION_KEYS.items():
+        value = config.get(section)
+        if value is None:
+            continue
+        if not isinstance(value, dict):
+            errors.append(f"{section!r} must be a mapping")
+            continue
+        errors += [f"Unknown key {section}.{key}" for key in value if key not in keys]
+    if errors:
+        return errors, warnings
+
+    for key in ["regions", "scenarios", "models"]:
+        if not _is_str_list(config[key]) or not config[key]:
+            errors.append(f"{key!r} must be a non-empty list of names")
+    years = config["years"]
+    if not isinstance(years, list) or not years or not all(isinstance(y, int) for y in years):
+        errors.append("'years' must be a non-empty list of integers")
+    for key, choices in [("formats", FIGURE_FORMATS), ("stages", STAGES)]:
+        value = config[key]
+        if not _is_str_list(value) or any(v not in choices for v in value):
+            errors.append(f"{key!r} must be a list of some of {choices}, got {value!r}")
+    if not config["formats"]:
+        errors.append("'formats' must name at least one format")
+    if not isinstance(config["baseline"], str):
+        errors.append("'baseline' must be a scenario name")
+    if not isinstance(config["force"], bool):
+        errors.append("'force' must be true or false")
+    workers = config["max_workers"]
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        errors.append("'max_workers' must be a positive integer")
+    for key in ["colours", "scenario_display", "model_display", "var_dict"]:
+        if not _is_str_dict(config[key]):
+            errors.append(f"{key!r} must map names to strings")
+    if config["model_linestyles"] is not None and not _is_str_dict(config["model_linestyles"]):
+        errors.append("'model_linestyles' must map models to line styles")
+    for section in ["renames", "labels"]:
+        for dim, names in config[section].items():
+            if not _is_str_dict(names):
+                errors.append(f"{section}.{dim} must map labels to strings")
+    if errors:
+        return errors, warnings
+
+    # Consistency of the names
+    scenarios = config["scenarios"]
+    if config["baseline"] not in scenarios:
+        errors.append(f"Baseline {config['baseline']!r} is not among the scenarios")
+    missing_colours = [s for s in scenarios if s not in config["colours"]]
+    if missing_colours:
+        errors.append(f"No colour for scenario(s) {missing_colours}")
+    if "render" in config["stages"] and not _is_str_list(config["capacity_variables"]):
+        errors.append("'capacity_variables' must be a list of variables")
+    elif "render" in config["stages"] and not config["capacity_variables"]:
+        errors.append("'capacity_variables' must list the variables of the polar panels")
+
+    # Inputs and outputs
+    data = config["data"]
+    file_types = data.get("file_types") or list(FILE_EXTENSIONS)
+    file_types = [file_types] if isinstance(file_types, str) else file_types
+    if any(ft not in FILE_EXTENSIONS for ft in file_types):
+        errors.append(f"data.file_types must be some of {list(FILE_EXTENSIONS)}, got {file_types!r}")
+    elif not isinstance(data.get("path"), str):
+        errors.append("data.path must name the folder with the IAMC files")
+    elif not os.path.isdir(data["path"]):
+        errors.append(f"Data folder {data['path']} does not exist")
+    elif not data_files(config):
+        errors.append(f"No {'/'.join(file_types)} files in {data['path']}")
+    if data.get("filters") is not None and not isinstance(data["filters"], dict):
+        errors.append("data.filters must be a mapping of dimension to values")
+
+    output = config["output"]
+    needed = {"render": "figures", "export": "derived"}
+    for stage_name in config["stages"]:
+        if not isinstance(output.get(needed[stage_name]), str):
+            errors.append(f"output.{needed[stage_name]} is needed by the {stage_name} stage")
+
+    if "render" in config["stages"] and FRIDA_MODEL in config["models"]:
+        unc = config["uncertainty"]
+        if unc.get("bands") is None:
+            warnings.append("No uncertainty.bands folder, the FRIDA bands are not drawn")
+        elif not os.path.isdir(unc["bands"]):
+            warnings.append(f"FRIDA band folder {unc['bands']} does not exist")
+        else:
+            missing = [f"FRIDA_{s}_{p}.csv" for s in scenarios for p in ["5th", "95th"]
+                       if not os.path.exists(os.path.join(unc["bands"], f"FRIDA_{s}_{p}.csv"))]
+            if missing:
+                errors.append(f"FRIDA band files missing in {unc['bands']}: {missing}")
+        table, members = unc.get("percentile_table"), unc.get("members")
+        if table is None:
+            warnings.append("No uncertainty.percentile_table, the FRIDA percentiles are not drawn")
+        elif not os.path.exists(table):
+            errors.append(f"Percentile table {table} does not exist")
+        if not config["var_dict"]:
+            warnings.append("Empty 'var_dict', the FRIDA percentiles are not drawn")
+    return errors, warnings
+
+
+def data_files(config: dict) -> List[str]:
+    """Input files of the config's data folder, as the loader would pick them."""
+    data = config["data"]
+    file_types = data.get("file_types") or list(FILE_EXTENSIONS)
+    file_types = [file_types] if isinstance(file_types, str) else file_types
+    extensions = tuple(FILE_EXTENSIONS[ft] for ft in file_types if ft in FILE_EXTENSIONS)
+    try:
+        return sorted(f for f in os.listdir(data["path"]) if f.endswith(extensions))
+    except OSError:
+        return []
+
+
+def dashboard_jobs(config: dict, regions: Optional[List[str]] = None) -> List[dict]:
+    """Jobs of ``derp_tools.batch.render_batch``, one per region."""
+    return [{"region": region,
+             "scenarios": config["scenarios"],
+             "models": config["models"],
+             "years_bottom": config["years"]}
+            for region in (regions or config["regions"])]
+
+
+def job_outputs(config: dict, job: dict) -> List[str]:
+    """Files a dashboard job writes (as named in derp_tools.dashboard)."""
+    stem = os.path.join(config["output"]["figures"],
+                        f"dashboard_cap_elec_{job['region'].replace(' ', '_')}")
+    return [f"{stem}.{fmt}" for fmt in config["formats"]]
+
+
+def print_plan(config: dict, stages: List[str], regions: Optional[List[str]] = None):
+    """Print the stages, input files, jobs and output files of a run."""
+    print(f"Config: {config['_path']}")
+    print(f"Stages: {', '.join(stages) or '(none)'}")
+    files = data_files(config)
+    print(f"Data: {config['data']['path']} ({len(files)} files)")
+    for f in files:
+        print(f"  {f}")
+    print(f"Baseline: {config['baseline']}")
+    if "render" in stages:
+        for job in dashboard_jobs(config, regions):
+            print(f"Dashboard {job['region']}: {len(job['scenarios'])} scenarios, "
+                  f"{len(job['models'])} models, years {job['years_bottom']}")
+            for path in job_outputs(config, job):
+                print(f"  {path}")
+    if "export" in stages:
+        print(f"Derived tables: {config['output']['derived']}")
+
+
+# -------------------
+# Run
+# -------------------
+
+def _load(config: dict, regions: List[str]):
+    from derp_tools.labels import LabelRegistry
+    from derp_tools.loading import load_and_concat_files_then_pyam
+
+    data = config["data"]
+    filters = dict(data.get("filters") or {})
+    filters.setdefault("model", config["models"])
+    filters.setdefault("scenario", config["scenarios"])
+    filters.setdefault("region", regions)
+    df = load_and_concat_files_then_pyam(data["path"], file_types=data.get("file_types"),
+                                         cache_dir=data.get("cache_dir"), filters=filters)
+    if df is None:
+        raise ConfigError(f"No data for the config's models, scenarios and regions in {data['path']}")
+    if config["renames"]:
+        df = LabelRegistry(rename=config["renames"]).rename(df)
+    return df
+
+
+def _uncertainty(config: dict):
+    """
+    FRIDA bands and percentile differences; None where not configured (or
+    the band folder is missing), and the dashboards then leave them out.
+    """
+    from derp_tools.frida import (EnsembleMembers, PercentileTable, UncertaintyBands,
+                                  ensemble_percentile_differences)
+
+    unc = config["uncertainty"]
+    bands = None
+    if unc.get("bands") and os.path.isdir(unc["bands"]):
+        bands = UncertaintyBands(unc["bands"])
+    table = None
+    if unc.get("percentile_table"):
+        table = PercentileTable.from_csv(unc["percentile_table"])
+        if unc.get("members") and os.path.isdir(unc["members"]):
+            table = ensemble_percentile_differences(
+                EnsembleMembers(unc["members"]), config["baseline"],
+                scenarios=table.scenarios, variables=table.variables,
+                years=table.years, percentiles=table.percentiles,
+                fallback=table)
+    return bands, table
+
+
+def run(config: dict, stages: List[str], regions: Optional[List[str]] = None,
+        force: Optional[bool] = None, max_workers: Optional[int] = None) -> List[dict]:
+    """
+    Run ``stages`` of a validated config; returns the batch records of the
+    render stage (empty if it did not run).
+    """
+    from derp_tools.instrument import PipelineLog
+
+    regions = regions or config["regions"]
+    log = PipelineLog(config.get("title") or pathlib.Path(config["_path"]).stem)
+    results = []
+    with log.activate():
+        with log.stage("load") as st:
+            df = st.output(_load(config, regions))
+
+        from derp_tools.shares import compute_share, slice_share
+        from derp_tools.store import CompactStore
+
+        baseline = config["baseline"]
+        with log.stage("baseline changes") as st:
+            df_changes = st.output(CompactStore.from_data(df).changes(baseline))
+        numerator, denominator = config["share"]["numerator"], config["share"]["denominator"]
+        with log.stage("share") as st:
+            shares = st.output(compute_share(df, numerator, denominator))
+
+        frida_unc_data = perc_unc_table = None
+        if "render" in stages or config["uncertainty"].get("percentile_table"):
+            with log.stage("uncertainty load"):
+                frida_unc_data, perc_unc_table = _uncertainty(config)
+
+        if "render" in stages:
+            # Plotting modules are only needed from here on
+            from derp_tools.batch import render_batch
+            from derp_tools.dashboard import create_cap_elec_polar_dashboard, use_style
+            from derp_tools.templates import close_templates
+
+            use_style()
+
+            labels = config["labels"]
+            df_share = (slice_share(shares, region=regions, scenario=config["scenarios"],
+                                    year=config["years"])
+                        .rename(columns={numerator: "electricity_share"})
+                        .reset_index())
+            jobs = dashboard_jobs(config, regions)
+            with log.stage("dashboards", n_jobs=len(jobs)):
+                results = render_batch(
+                    create_cap_elec_polar_dashboard, jobs,
+                    shared=dict(
+                        df=df, df_changes=df_changes, df_share=df_share,
+                        baseline_scenario=baseline,
+                        all_vars_names=labels.get("variable", {}),
+                        scenario_names=labels.get("scenario", {}),
+                        groups={"Installed Electricity Capacity": config["capacity_variables"]},
+                        colours=config["colours"],
+                        frida_unc_data=frida_unc_data, perc_unc_table=perc_unc_table,
+                        var_dict=config["var_dict"],
+                        model_linestyles=config["model_linestyles"],
+                        scenario_display=config["scenario_display"],
+                        model_display=config["model_display"],
+                        share_years=config["years"],
+                        save_dir=config["output"]["figures"],
+                        formats=config["formats"],
+                        force=config["force"] if force is None else force,
+                        reuse_template=True,
+                    ),
+                    max_workers=max_workers or config["max_workers"],
+                    manifest_path=config["output"].get("manifest"),
+                )
+            close_templates()
+
+        if "export" in stages:
+            from derp_tools.export import write_derived
+
+            derived_dir = config["output"]["derived"]
+            with log.stage("export"):
+                write_derived(df_changes, os.path.join(derived_dir, "baseline_changes"),
+                              description=f"Changes relative to {baseline}")
+                write_derived(shares.rename(columns={numerator: "electricity_share"}).reset_index(),
+                              os.path.join(derived_dir, "electricity_share"),
+                              description=f"Share (%) of {numerator} in {denominator}")
+                if perc_unc_table is not None:
+                    write_derived(perc_unc_table.to_frame(),
+                                  os.path.join(derived_dir, "percentage_capacity_differences"),
+                                  description="Long format of "
+                                              f"{config['uncertainty']['percentile_table']}")
+
+    if config["output"].get("log"):
+        log.write(config["output"]["log"])
+    return results
+
+
+# -------------------
+# Entry point
+# -------------------
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m derp_tools",
+        description="Render the dashboards and export the derived tables of a config file.")
+    parser.add_argument("config", help="JSON or TOML config file")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--validate", action="store_true",
+                      help="check the config and its input paths, load nothing")
+    mode.add_argument("--list", action="store_true",
+                      help="print the jobs and files of the run, run nothing")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                        help="stages to run (default: the config's 'stages')")
+    parser.add_argument("--regions", nargs="+", default=None,
+                        help="render only these regions (default: the config's 'regions')")
+    parser.add_argument("--force", action="store_true", default=None,
+                        help="redraw dashboards that are up to date")
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        config = read_config(args.config)
+    except ConfigError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.stages is not None:
+        config["stages"] = args.stages
+    errors, warnings = validate_config(config)
+    if not errors and args.regions:
+        unknown = [r for r in args.regions if r not in config["regions"]]
+        errors += [f"Region {r!r} is not in the config" for r in unknown]
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    for error in errors:
+        print(f"Error: {error}", file=sys.stderr)
+    if errors:
+        return 1
+
+    if args.list:
+        print_plan(config, config["stages"], args.regions)
+        return 0
+    if args.validate:
+        print(f"Config is valid ({time.perf_counter() - start:.3f} s)")
+        return 0
+
+    results = run(config, config["stages"], regions=args.regions, force=args.force,
+                  max_workers=args.max_workers)
+    return int(any(r["status"] != "ok" for r in results))
@@ -0,0 +1,119 @@
+"""
+Dense model x scenario x region x variable x year cube of IAMC data, for
+panels that draw one line per (model, scenario).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.changes import as_long
+
+# Axes of the cube, in order
+CUBE_AXES = ["model", "scenario", "region", "variable", "year"]
+
+
+def _as_list(labels) -> Optional[List[object]]:
+    if labels is None:
+        return None
+    if isinstance(labels, (str, int, np.integer)):
+        return [labels]
+    return list(labels)
+
+
+class IamcCube:
+    """
+    IAMC data laid out once as a dense float array with axes
+    (model, scenario, region, variable, year) plus label indexes.
+
+    Built with ``IamcCube.from_data``, optionally restricted to some labels so
+    that the array stays small. ``series`` then returns a NumPy view of one
+    line instead of a filter/timeseries/melt round-trip per line. Points that
+    are not reported are NaN.
+    """
+
+    def __init__(self, values: np.ndarray, labels: Dict[str, Sequence[object]],
+                 units: Dict[str, str]):
+        self.values = values
+        self.labels = {axis: list(labels[axis]) for axis in CUBE_AXES}
+        self.years = np.asarray(self.labels["year"])
+        self.units = units
+        self._pos = {axis: {label: i for i, label in enumerate(self.labels[axis])}
+                     for axis in CUBE_AXES}
+
+    @classmethod
+    def from_data(cls, df, *, model=None, scenario=None, region=None,
+                  variable=None, year=None) -> "IamcCube":
+        """
+        Build the cube from a pyam.IamDataFrame or long DataFrame.
+
+        Keyword arguments restrict an axis to the given label(s); the axis
+        then follows that order. Other axes hold the labels present in the
+        data, sorted.
+        """
+        data = as_long(df)
+        wanted = {"model": _as_list(model), "scenario": _as_list(scenario),
+                  "region": _as_list(region), "variable": _as_list(variable),
+                  "year": _as_list(year)}
+
+        keep = np.ones(len(data), dtype=bool)
+        for axis, labels in wanted.items():
+            if labels is not None:
+                keep &= data[axis].isin(labels).to_numpy()
+        data = data[keep]
+
+        codes, labels = [], {}
+        for axis in CUBE_AXES:
+            if wanted[axis] is not None:
+                index = pd.Index(wanted[axis])
+                codes.append(index.get_indexer(data[axis]))
+            else:
+                c, index = pd.factorize(data[axis], sort=True)
+                codes.append(c)
+            labels[axis] = index
+
+        values = np.full(tuple(len(labels[axis]) for axis in CUBE_AXES), np.nan)
+        values[tuple(codes)] = data["value"].to_numpy()
+
+        units = dict(zip(data["variable"], data["unit"]))
+        return cls(values, labels, units)
+
+    @property
+    def empty(self) -> bool:
+        return not np.isfinite(self.values).any()
+
+    def index(self, axis: str, label) -> int:
+        """Position of ``label`` on ``axis``; KeyError if it is not in the cube."""
+        try:
+            return self._pos[axis][label]
+        except KeyError:
+            raise KeyError(f"{axis} {label!r} not in cube") from None
+
+    def series(self, model, scenario, region, variable) -> Optional[np.ndarray]:
+        """
+        Values of one line over ``self.years`` as a view into the cube, or
+        None if the line is not in the cube or has no reported value.
+        """
+        try:
+            idx = tuple(self.index(axis, label) for axis, label in
+                        zip(CUBE_AXES[:4], (model, scenario, region, variable)))
+        except KeyError:
+            return None
+        line = self.values[idx]
+        return line if np.isfinite(line).any() else None
+
+    def line(self, model, scenario, region, variable) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Years and values of one line for plotting, with unreported years left
+        out so that the line is drawn across gaps. None if there is no data.
+        """
+        values = self.series(model, scenario, region, variable)
+        if values is None:
+            return None
+        reported = ~np.isnan(values)
+        if reported.all():
+            return self.years, values
+        return self.years[reported], values[reported]
+
+    def unit(self, variable) -> Optional[str]:
+        return self.units.get(variable)
@@ -0,0 +1,429 @@
+"""
+Heat- & Drought illustrative dashboard: total electricity capacity with the
+FRIDA uncertainty band on top, polar charts of capacity changes per
+technology below.
+
+Moved out of ``H&D/Additional Results/01_FRIDA_uncertainties.py`` so that the
+dashboard can be rendered for many regions and scenario sets in worker
+processes (see derp_tools/batch.py). Everything the panels used to read from
+script globals is passed in as an argument.
+"""
+import functools
+import pathlib
+from typing import Dict, List, Optional
+
+import matplotlib.lines as mlines
+import matplotlib.patches as mpatches
+import matplotlib.gridspec as gridspec
+import matplotlib.ticker as mticker
+import matplotlib.pyplot as plt
+import numpy as np
+
+from derp_tools.cube import IamcCube
+from derp_tools.fingerprint import (fingerprint, is_up_to_date, mark_rendered,
+                                    source_fingerprint)
+from derp_tools.instrument import stage
+from derp_tools.labels import LabelRegistry
+from derp_tools.model_stats import ModelStatistics
+from derp_tools.store import ChangesView
+from derp_tools.templates import FigureTemplate, get_template
+
+# ----------------------------------------------------------------
+# 1.  basic style helpers
+# ----------------------------------------------------------------
+MODEL_LINESTYLES = {
+    "GCAM 7.0":        "-",
+    "TIAM_Grantham":   "--",
+    "FRIDAv2.1":       ":",
+    "PROMETHEUS":      "-."
+}
+
+# savefig options per output format of the dashboard
+SAVE_OPTIONS = {
+    "png": dict(dpi=150, bbox_inches="tight"),
+    "pdf": dict(dpi=300, bbox_inches="tight",
+                metadata={"Title":"", "Subject":"", "Creator":"", "Producer":""}),
+    "svg": dict(bbox_inches="tight", metadata={"Date": None}),
+}
+
+
+def use_style():
+    """Plot style of the analysis scripts (seaborn "white"/"talk", font size 14)."""
+    import seaborn as sns
+    sns.set()
+    sns.set_style("white")
+    sns.set_context("talk")
+    plt.rcParams['figure.dpi']= 100
+    plt.rc("savefig", dpi=150)
+    plt.rc("font", size=14)
+def _model_markers(models: List[str]) -> Dict[str, str]:
+    # base = ["P", "^", "s", "D", "v", "<", ">", "o"]
+    base = ["P", "X", "s", "D", "v", "<", ">", "o"]
+    return {m: base[i % len(base)] for i, m in enumerate(models)}
+
+def _select_changes(dfc, *, region, year, variables, models, scenarios):
+    """Rows of a changes table (DataFrame or ChangesView) for one region and year(s)."""
+    if isinstance(dfc, ChangesView):
+        return dfc.select(region=region, year=year, variable=variables,
+                          model=models, scenario=scenarios)
+    years = year if isinstance(year, (list, tuple)) else [year]
+    return dfc[(dfc["region"] == region) & (dfc["year"].isin(years)) &
+               (dfc["variable"].isin(variables)) &
+               (dfc["model"].isin(models)) &
+               (dfc["scenario"].isin(scenarios))]
+
+# ----------------------------------------------------------------
+# 2.  individual panels
+# ----------------------------------------------------------------
+def plot_total_capacity_ax(df, *, ax, region, models, scenarios,
+                           all_vars, colours, frida_unc=False, frida_unc_data,
+                           variable="Capacity|Electricity", model_linestyles=None):
+    """
+    Top-left panel – Total electricity capacity in TW.
+
+    ``df`` is a pyam.IamDataFrame, or an IamcCube already holding the lines.
+    """
+    cube = df if isinstance(df, IamcCube) else IamcCube.from_data(
+        df, variable=variable, region=region, model=models, scenario=scenarios)
+    if cube.empty:
+        ax.text(.5, .5, "no data", ha="center", va="center"); ax.axis("off"); return
+
+    model_linestyles = MODEL_LINESTYLES if model_linestyles is None else model_linestyles
+    for m in models:
+        ls = model_linestyles.get(m, "-")
+        for s in scenarios:
+            line = cube.line(m, s, region, variable)
+            if line is None: continue
+            years, values = line
+            ax.plot(years, values / 1_000,   # → TW
+                    color=colours.get(s, "black"), linestyle=ls, lw=2)
+
+            if m == 'FRIDAv2.1' and frida_unc == True:
+                unc_years, unc_lo, unc_hi = frida_unc_data.band(variable, s, "5th", "95th")
+                ax.fill_between(unc_years, unc_lo / 1_000, unc_hi / 1_000,   # → TW
+                        color=colours.get(s, "black"), alpha=0.15, lw=0)
+            
+
+    # ax.set_xlim(2025, 2100)
+    ax.set_xlim(1980, 2150)
+    ax.set_xlabel("Year", fontsize=10)
+    ax.set_ylabel("TW",  fontsize=10)
+    ax.tick_params(axis="both", labelsize=10)
+    ax.set_title("Total Electricity Capacity", fontsize=14, pad=6)
+    ax.grid(True, ls="--", alpha=.3)
+    
+
+# ................................................................
+def plot_elec_share_ax(ax, df_share, *, region,
+                       base_scenario, compare_scenarios,
+                       years, colours, m_mark,
+                       bar_color="#bdbdbd", whisker_color="black", jitter=0.12):
+    """
+    Top-right panel – electricity share bars + dots.
+
+    ``df_share`` is the share frame (``electricity_share`` column) or its
+    ModelStatistics, which batch runs build once for all regions.
+    """
+    years = [int(y) for y in (years if hasattr(years, "__iter__") else [years])]
+    share_stats = df_share if isinstance(df_share, ModelStatistics) else ModelStatistics.from_data(
+        df_share, value_col="electricity_share", region=region)
+
+    stats = share_stats.get(base_scenario, region, years=years)
+    if stats["mean"].isna().all():
+        ax.axis("off"); return
+
+    means, x_pos = stats["mean"], np.arange(len(years))
+    lowers, uppers = means - stats["min"], stats["max"] - means
+
+    ax.bar(x_pos, means, yerr=[lowers, uppers],
+           capsize=5, color=bar_color, edgecolor=bar_color,
+           error_kw={"elinewidth":1.5, "ecolor":whisker_color, "capsize":5},
+           width=.6, zorder=2)
+
+    for s_idx, scen in enumerate(compare_scenarios):
+        models, values = share_stats.model_values(scen, region, years=years)
+        for m_idx, (model, shares) in enumerate(zip(models, values)):
+            offset = (-1)**s_idx * (jitter + m_idx*0.02)
+            reported = ~np.isnan(shares)
+            ax.scatter(x_pos[reported] + offset, shares[reported],
+                       marker=m_mark[model], s=70, alpha=.7,
+                       color=colours.get(scen, "black"),
+                       edgecolors="dimgrey", linewidths=.3, zorder=3)
+
+    ax.set_xticks(x_pos); ax.set_xticklabels(years, fontsize=10)
+    ax.set_ylabel("(%)", fontsize=10)
+    ax.tick_params(axis="y", labelsize=10)
+    ax.set_title("Electricity Share in FE Compared to Current Trends", fontsize=14, pad=6)
+    ax.grid(True, ls="--", alpha=.3)
+
+# ................................................................
+def plot_single_polar_ax(dfc, *, ax, region, year, variables,
+                         models, scenarios, all_vars,
+                         colours, m_mark,
+                         var_label_fs=10, r_tick_fs=10, title_fs=14,
+                         frida_unc = False, frida_unc_data,
+                         var_dict, perc_unc_table, labels: Optional[LabelRegistry] = None):
+    """
+    One polar chart (bottom row); ``var_dict`` maps axis labels to variables.
+    ``dfc`` is the output of ``compute_baseline_changes`` or a ChangesView.
+
+    Display names come from ``labels`` if given (shared by the panels of a
+    dashboard), otherwise from ``all_vars``.
+    """
+    sub = _select_changes(dfc, region=region, year=year, variables=variables,
+                          models=models, scenarios=scenarios)
+    if sub.empty:
+        ax.text(.5, .5, "no data", ha="center", va="center"); ax.axis("off"); return
+
+    labels = labels or LabelRegistry(display={"variable": all_vars})
+    sub = sub.assign(disp=labels.display_column("variable", sub["variable"]))
+    var_list = var_dict.keys()
+    ang = np.linspace(0, 2*np.pi, len(var_list), endpoint=False)
+    pv = sub.pivot_table(index=["model","scenario"], columns="disp",
+                         values="percentage_change", aggfunc="first")
+
+    for m in models:
+        mk = m_mark[m]
+        for s in scenarios:
+            if (m,s) not in pv.index: continue
+
+            if m == 'FRIDAv2.1' and frida_unc == True:
+                # Medians and 5th/95th bounds of every variable in one gather
+                med_vals, lo_vals, hi_vals = perc_unc_table.gather(
+                    [var_dict[var] for var in var_list], s, year, percentiles=(50, 5, 95))
+
+                for v_i, var in enumerate(var_list):
+                    ax.scatter(ang[v_i], med_vals[v_i],
+                               marker=mk, s=90, alpha=.75,
+                               color=colours.get(s, "grey"),
+                               edgecolors="dimgrey", linewidths=.3)
+                    ax.plot(np.repeat(ang[v_i], 2), [lo_vals[v_i], hi_vals[v_i]],
+                            color=colours.get(s, "grey"), alpha=.75)
+
+    l1, l2 = ax.get_ylim()
+    limit = np.amax((np.abs(l1), np.abs(l2)))
+
+    ax.set_xticks(ang); ax.set_xticklabels(var_list, fontsize=var_label_fs)
+    yt = mticker.MaxNLocator(nbins=5, prune="both").tick_values(-limit, limit)
+    ax.set_yticks(yt); ax.set_yticklabels([f"{t:.0f}%" for t in yt], fontsize=r_tick_fs)
+    ax.grid(True, ls="--", alpha=.6)
+    ax.plot(np.linspace(0, 2*np.pi, 100), np.zeros(100), color='grey', lw=1)
+
+    ax.set_title(str(year), y=1.10, fontsize=title_fs)
+
+# ----------------------------------------------------------------
+# 3.  render cache
+# ----------------------------------------------------------------
+def _dashboard_fingerprint(*, df, df_changes, region, years_bottom, scenarios,
+                           models, baseline_scenario, p_vars, frida_unc_data,
+                           perc_unc_table, var_dict, arguments) -> str:
+    """Fingerprint of the exact data slices the panels draw, plus the plotting arguments."""
+    scen_no_base = [s for s in scenarios if s != baseline_scenario]
+    variable = "Capacity|Electricity"
+
+    # top panel: total capacity series and the FRIDA bands
+    if isinstance(df, IamcCube):
+        ts = df.values
+    else:
+        ts = df.filter(variable=variable, region=region, model=models, scenario=scenarios)
+    bands = []
+    if "FRIDAv2.1" in models and frida_unc_data is not None:
+        for s in scenarios:
+            try:
+                bands.extend(frida_unc_data.band(variable, s, "5th", "95th"))
+            except (KeyError, FileNotFoundError) as e:
+                bands.append(repr(e))
+
+    # bottom row: percentage changes and percentile gathers per year
+    polar = _select_changes(df_changes, region=region, year=list(years_bottom),
+                            variables=p_vars, models=models, scenarios=scen_no_base)
+    polar = polar[["model", "scenario", "variable", "year", "percentage_change"]]
+    gathers = []
+    if "FRIDAv2.1" in models and perc_unc_table is not None:
+        for s in scen_no_base:
+            for yr in years_bottom:
+                try:
+                    gathers.append(perc_unc_table.gather(list(var_dict.values()), s, yr))
+                except KeyError as e:
+                    gathers.append(repr(e))
+
+    return fingerprint(source_fingerprint(__file__), ts, bands, polar, gathers, arguments)
+
+
+# ----------------------------------------------------------------
+# 4.  figure skeleton (see derp_tools/templates.py)
+# ----------------------------------------------------------------
+def _build_dashboard(fig, *, years_bottom, models, scenarios, baseline_scenario,
+                     colours, labels, m_mark, model_linestyles) -> Dict[str, object]:
+    """Axes, row title, legend and title of the dashboard; ``scenarios`` excludes the baseline."""
+    gs  = gridspec.GridSpec(2, 3, figure=fig,
+                            height_ratios=[1,1], width_ratios=[1,1,1],
+                            hspace=.45, wspace=.25)
+    axes = {"total_capacity": fig.add_subplot(gs[0, :])}
+    for col, _ in enumerate(years_bottom):
+        axes[f"polar {col}"] = fig.add_subplot(gs[1, col], projection="polar")
+
+    # row title
+    fig.text(.52, .48, "Electricity Capacity by Technology Compared to Current Trends",
+             ha="center", va="bottom", fontsize=14)
+
+    # --- legend -----------------------------------------------------------
+    scen_handles = [mlines.Line2D([], [], color=colours[s], marker="o",
+                                  ls="None", ms=8,
+                                  label=labels.display("scenario", s))
+                    for s in scenarios]
+
+    bar_patch = mpatches.Patch(facecolor="#bdbdbd", edgecolor="#bdbdbd",
+                               label=labels.display("scenario", baseline_scenario))
+
+    model_handles = [mlines.Line2D([], [], color="black",
+                                   marker=m_mark[m], ls="None", ms=8,
+                                   label=labels.display("model", m))
+                     for m in models]
+
+    line_handles = [mlines.Line2D([], [], color="black",
+                                  ls=model_linestyles.get(m,"-"), lw=2.5,
+                                  label=labels.display("model", m))
+                    for m in models]
+
+    handles_all = scen_handles + [bar_patch] + model_handles + line_handles
+    fig.legend(handles=handles_all,
+               ncol=len(handles_all),
+               bbox_to_anchor=(.5,.03), loc="lower center",
+               fontsize=9, frameon=True,
+               title="Scenario               |               Model marker               |               Model line")
+
+    # --- title ------------------------------------------------------------
+    fig.suptitle("Heatwaves and Drought Illustrative Scenarios",
+                 fontsize=18, fontweight="bold", y=.975)
+    return axes
+
+
+# ----------------------------------------------------------------
+# 5.  master plot
+# ----------------------------------------------------------------
+def create_cap_elec_polar_dashboard(
+        *, df, df_changes, df_share,
+        region, years_bottom,
+        scenarios, models, baseline_scenario,
+        all_vars_names, scenario_names, groups,
+        colours,
+        frida_unc_data, perc_unc_table, var_dict,
+        model_linestyles=None, scenario_display=None, model_display=None,
+        save_dir="../figures/combined_panels/uncertainties/", file_suffix="",
+        figsize=(20,12), share_years=(2040,2070,2100), formats=("png","pdf"),
+        force=False, reuse_template=False) -> List[str]:
+    """
+    Render the dashboard of one region and save it in ``formats`` (by
+    default PNG at dpi 150 and PDF at dpi 300, see ``SAVE_OPTIONS``).
+
+    The data slices and arguments the figure depends on are fingerprinted;
+    if all files already exist and were rendered from the same fingerprint
+    (see the ``.render.json`` record next to the first file), nothing is
+    redrawn. ``force=True`` always redraws.
+
+    With ``reuse_template=True`` the figure skeleton (axes, legend, titles
+    and layout) is built once per scenario/model set and kept open, and
+    later regions only swap the data in (see derp_tools/templates.py);
+    ``derp_tools.templates.close_templates()`` closes them.
+
+    The FRIDA bands and percentiles are drawn only where ``frida_unc_data``
+    and ``perc_unc_table`` are given (not None).
+
+    Returns the paths of the saved files.
+    """
+    # manual legend overrides
+    scen_disp = scenario_display or {}
+    mod_disp  = model_display or {}
+    model_linestyles = MODEL_LINESTYLES if model_linestyles is None else model_linestyles
+
+    # Display names, resolved once for all panels and the legend
+    labels = (LabelRegistry(display={"variable": all_vars_names, "scenario": scenario_names})
+              .add_display("scenario", scen_disp)
+              .add_display("model", mod_disp))
+
+    m_mark  = _model_markers(models)
+    scen_no_base = [s for s in scenarios if s != baseline_scenario]
+    p_vars = groups["Installed Electricity Capacity"]
+
+    if not formats or any(f not in SAVE_OPTIONS for f in formats):
+        raise ValueError(f"formats must be some of {list(SAVE_OPTIONS)}, got {list(formats)}")
+    stem = f"{save_dir}/dashboard_cap_elec_{region.replace(' ','_')}{file_suffix}"
+    outputs = [f"{stem}.{fmt}" for fmt in formats]
+    names = " & ".join(pathlib.Path(p).name for p in outputs)
+
+    fp = _dashboard_fingerprint(
+        df=df, df_changes=df_changes, region=region, years_bottom=years_bottom,
+        scenarios=scenarios, models=models, baseline_scenario=baseline_scenario,
+        p_vars=p_vars, frida_unc_data=frida_unc_data, perc_unc_table=perc_unc_table,
+        var_dict=var_dict,
+        arguments=dict(colours={s: colours.get(s) for s in scenarios},
+                       scenario_display=scen_disp, model_display=mod_disp,
+                       scenario_names={s: scenario_names.get(s) for s in scenarios},
+                       model_linestyles={m: model_linestyles.get(m) for m in models},
+                       all_vars={v: all_vars_names.get(v) for v in p_vars},
+                       years_bottom=list(years_bottom), figsize=list(figsize)))
+    if not force and is_up_to_date(outputs, fp):
+        print("up to date:", names)
+        return outputs
+
+    pathlib.Path(save_dir).mkdir(parents=True, exist_ok=True)
+    build = functools.partial(_build_dashboard, years_bottom=years_bottom, models=models,
+                              scenarios=scen_no_base, baseline_scenario=baseline_scenario,
+                              colours=colours, labels=labels, m_mark=m_mark,
+                              model_linestyles=model_linestyles)
+    if reuse_template:
+        key = fingerprint(
+            "cap_elec_polar", list(years_bottom), models, scen_no_base, baseline_scenario,
+            {s: colours[s] for s in scen_no_base},
+            [labels.display("scenario", s) for s in scenarios],
+            [labels.display("model", m) for m in models],
+            {m: model_linestyles.get(m, "-") for m in models}, list(figsize))
+        template = get_template(key, build, figsize=figsize)
+    else:
+        template = FigureTemplate(build, figsize=figsize)
+    template.reset()
+    fig = template.fig
+
+    # --- top-left ---------------------------------------------------------
+    with stage("panel total capacity", region=region, file=pathlib.Path(outputs[0]).name):
+        plot_total_capacity_ax(df, ax=template.axes["total_capacity"], region=region,
+                               models=models, scenarios=scenarios,
+                               all_vars=all_vars_names, colours=colours,
+                               frida_unc=frida_unc_data is not None,
+                               frida_unc_data=frida_unc_data,
+                               model_linestyles=model_linestyles)
+
+    # --- top-right --------------------------------------------------------
+    # ax_share = template.axes["share"]   # fig.add_subplot(gs[0, 2]) in _build_dashboard
+    # plot_elec_share_ax(ax_share, df_share, region=region,
+    #                    base_scenario=baseline_scenario,
+    #                    compare_scenarios=scen_no_base,
+    #                    years=share_years,
+    #                    colours=colours, m_mark=m_mark)
+
+    # --- bottom row -------------------------------------------------------
+    for col, yr in enumerate(years_bottom):
+        with stage(f"panel polar {yr}", region=region, file=pathlib.Path(outputs[0]).name):
+            plot_single_polar_ax(df_changes, ax=template.axes[f"polar {col}"], region=region,
+                                 year=yr, variables=p_vars, models=models,
+                                 scenarios=scen_no_base,
+                                 all_vars=all_vars_names,
+                                 colours=colours, m_mark=m_mark,
+                                 frida_unc=perc_unc_table is not None,
+                                 frida_unc_data=frida_unc_data,
+                                 var_dict=var_dict, perc_unc_table=perc_unc_table,
+                                 labels=labels)
+
+    # Layout of the first region rendered with the template
+    template.layout(rect=[0,.07,1,.94])
+
+    for fmt, path in zip(formats, outputs):
+        with stage(f"save {fmt}", region=region, file=pathlib.Path(path).name) as st:
+            fig.savefig(path, **SAVE_OPTIONS[fmt])
+            st.output(path)
+    if not reuse_template:
+        template.close()
+    mark_rendered(outputs, fp)
+    print("saved:", names)
+    return outputs
@@ -0,0 +1,141 @@
+"""
+Diagnostics of missing or undefined changes relative to a baseline scenario.
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.changes import SERIES_COLUMNS, align_on_series, as_long
+
+# Why a change relative to the baseline is not defined, in code order
+# (code 0 means the change is defined)
+MISSING_REASONS = [
+    "No Baseline Data",        # scenario reports the point, baseline does not
+    "Division by Zero",        # baseline is zero
+    "Missing Scenario Value",  # baseline reports the point, scenario does not
+    "Year Not Reported",       # as above, but the model reports no data for that scenario and year at all
+]
+
+
+class MissingDataReport:
+    """
+    Result of ``diagnose_missing``.
+
+    Attributes:
+    -----------
+    cells : pandas.DataFrame
+        One row per undefined change (model, scenario, region, variable, year,
+        value, baseline_value and a categorical ``reason``)
+    series : pandas.DataFrame
+        One row per scenario and (model, region, variable) series with the
+        number of points considered and the number with a defined change
+    """
+
+    def __init__(self, cells: pd.DataFrame, series: pd.DataFrame, baseline: str):
+        self.cells = cells
+        self.series = series
+        self.baseline = baseline
+
+    def summary(self) -> pd.Series:
+        """Number of undefined changes per reason."""
+        return self.cells["reason"].value_counts().reindex(MISSING_REASONS, fill_value=0)
+
+    def counts(self, by: Sequence[str] = ("model", "scenario")) -> pd.DataFrame:
+        """Undefined changes per reason (columns), broken down by ``by``."""
+        return (self.cells.groupby(list(by) + ["reason"], observed=True).size()
+                          .unstack("reason", fill_value=0)
+                          .reindex(columns=MISSING_REASONS, fill_value=0))
+
+    def coverage(self, index: Sequence[str] = ("model", "scenario"),
+                 columns: str = "variable") -> pd.DataFrame:
+        """Share (0-1) of points with a defined change, as an ``index`` x ``columns`` matrix."""
+        grouped = self.series.groupby(list(index) + [columns], observed=True)[["n_points", "n_defined"]].sum()
+        return (grouped["n_defined"] / grouped["n_points"]).unstack(columns)
+
+    def select(self, **labels) -> pd.DataFrame:
+        """Undefined changes matching the given labels, e.g. ``select(region="World")``."""
+        keep = np.ones(len(self.cells), dtype=bool)
+        for column, value in labels.items():
+            values = [value] if isinstance(value, (str, int, np.integer)) else list(value)
+            keep &= self.cells[column].isin(values).to_numpy()
+        return self.cells[keep]
+
+
+# -------------------
+# Function to classify missing changes
+# -------------------
+
+def diagnose_missing(df, baseline: str, scenarios: Optional[List[str]] = None,
+                     value_col: str = "value") -> MissingDataReport:
+    """
+    Classify every missing or undefined change relative to ``baseline`` in one pass.
+
+    All scenarios are laid out on one aligned (scenario, series, year) array
+    with the baseline. A point of a scenario is considered if the model ran
+    that scenario and either the scenario or the baseline reports it; it is
+    then either defined or classified with one of ``MISSING_REASONS``.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Data in long format
+    baseline : str
+        Baseline scenario
+    scenarios : list, optional
+        Scenarios to check, by default all except the baseline
+    value_col : str, optional
+        Name of the value column
+
+    Returns:
+    --------
+    MissingDataReport
+    """
+    data = as_long(df)
+    if scenarios is None:
+        scenarios = sorted(s for s in pd.unique(data["scenario"]) if s != baseline)
+    stack, _, _, first_rows, years = align_on_series(data, [baseline] + list(scenarios),
+                                                     value_col, with_labels=True)
+    base, scen = stack[0], stack[1:]
+    series_labels = data[SERIES_COLUMNS].iloc[first_rows].reset_index(drop=True)
+
+    s_present = ~np.isnan(scen)
+    b_present = ~np.isnan(base)[np.newaxis]
+
+    # Which models ran each scenario, and in which years they report anything
+    model_codes, models = pd.factorize(series_labels["model"])
+    n_scen, n_models, n_years = len(scenarios), len(models), len(years)
+    per_model = np.zeros((n_scen, n_models, n_years), dtype=np.int64)
+    s_idx, k_idx, y_idx = np.nonzero(s_present)
+    np.add.at(per_model, (s_idx, model_codes[k_idx], y_idx), 1)
+    year_reported = (per_model > 0)[:, model_codes, :]
+    model_ran = (per_model.sum(axis=2) > 0)[:, model_codes, np.newaxis]
+
+    considered = model_ran & (s_present | b_present)
+    reason = np.zeros(scen.shape, dtype=np.int8)
+    reason[s_present & ~b_present] = 1
+    reason[s_present & b_present & (base[np.newaxis] == 0)] = 2
+    reason[~s_present & b_present & year_reported] = 3
+    reason[~s_present & b_present & ~year_reported] = 4
+    reason[~considered] = 0
+
+    # Undefined points only, labelled from the series table
+    s_idx, k_idx, y_idx = np.nonzero(reason)
+    cells = series_labels.iloc[k_idx].reset_index(drop=True)
+    cells.insert(1, "scenario", pd.Categorical.from_codes(s_idx, categories=scenarios))
+    cells["year"] = years[y_idx]
+    cells["value"] = scen[s_idx, k_idx, y_idx]
+    cells["baseline_value"] = base[k_idx, y_idx]
+    cells["reason"] = pd.Categorical.from_codes(reason[s_idx, k_idx, y_idx] - 1,
+                                                categories=MISSING_REASONS)
+
+    # Points considered / defined per scenario and series
+    n_points = considered.sum(axis=2)
+    n_defined = (considered & (reason == 0)).sum(axis=2)
+    s_idx, k_idx = np.nonzero(n_points)
+    series = series_labels.iloc[k_idx].reset_index(drop=True)
+    series.insert(1, "scenario", pd.Categorical.from_codes(s_idx, categories=scenarios))
+    series["n_points"] = n_points[s_idx, k_idx]
+    series["n_defined"] = n_defined[s_idx, k_idx]
+
+    return MissingDataReport(cells, series, baseline)
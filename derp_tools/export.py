@@ -0,0 +1,246 @@
+"""
+Export of derived tables (baseline changes, shares, percentile differences)
+so that they can be reused without re-running the analysis scripts.
+
+A dataset is a directory with one file per partition (hive layout, e.g.
+``model=GCAM 7.0/scenario=D1/part-0.parquet``) and a ``_derived.json``
+describing it. Three formats are supported:
+
+- ``parquet``: compressed (zstd) columnar files, the format to share
+- ``arrow``: uncompressed Arrow IPC files, read back memory-mapped
+- ``csv.gz``: gzip-compressed CSV, for consumers without pyarrow
+
+Parquet and Arrow need pyarrow.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # optional dependency
+    pa = ds = pafs = None
+
+from derp_tools.changes import as_long
+from derp_tools.store import ChangesView, CompactStore
+
+# File extension of the data files per format
+EXPORT_FORMATS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "csv.gz": ".csv.gz",
+}
+
+# Partition columns used when a table has them
+DEFAULT_PARTITIONS = ["model", "scenario"]
+
+MANIFEST_NAME = "_derived.json"
+
+
+def _require_pyarrow(fmt: str):
+    if pa is None:
+        raise ImportError(f"pyarrow is needed for the {fmt!r} format; use 'csv.gz' or install pyarrow")
+
+
+def _as_frame(data) -> pd.DataFrame:
+    """Long DataFrame of a pyam.IamDataFrame, ChangesView, CompactStore or DataFrame."""
+    if isinstance(data, (ChangesView, CompactStore)):
+        # Categorical identifiers become Arrow dictionaries, never strings per row
+        return data.to_frame(categorical=True)
+    frame = as_long(data)
+    if isinstance(frame.index, pd.MultiIndex) or frame.index.name is not None:
+        frame = frame.reset_index()
+    return frame
+
+
+def _partition_dir(values: Sequence[object], columns: Sequence[str]) -> str:
+    return os.path.join(*[f"{c}={quote(str(v), safe='')}" for c, v in zip(columns, values)]) if columns else ""
+
+
+# -------------------
+# Function to write a derived dataset
+# -------------------
+
+def write_derived(data, path: str, *, fmt: str = "parquet",
+                  partition_by: Optional[Sequence[str]] = None,
+                  description: str = "", overwrite: bool = True) -> str:
+    """
+    Write a derived table as a partitioned dataset.
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame, pyam.IamDataFrame, ChangesView or CompactStore
+        Table to write (an indexed frame is written with its index as columns)
+    path : str
+        Directory of the dataset
+    fmt : str, optional
+        "parquet" (default), "arrow" or "csv.gz"
+    partition_by : list, optional
+        Partition columns; by default model and scenario where present.
+        An empty list writes a single file.
+    description : str, optional
+        Stored in the dataset's ``_derived.json``
+    overwrite : bool, optional
+        Replace an existing dataset at ``path``
+
+    Returns:
+    --------
+    str
+        The dataset directory
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {list(EXPORT_FORMATS)}")
+    frame = _as_frame(data)
+    if partition_by is None:
+        partition_by = [c for c in DEFAULT_PARTITIONS if c in frame.columns]
+    missing = [c for c in partition_by if c not in frame.columns]
+    if missing:
+        raise KeyError(f"partition column(s) not in the table: {missing}")
+
+    if os.path.exists(path):
+        if not overwrite:
+            raise FileExistsError(f"{path} exists (use overwrite=True to replace it)")
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    if fmt == "csv.gz":
+        files = _write_csv_partitions(frame, path, list(partition_by))
+    else:
+        _require_pyarrow(fmt)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        options = (ds.ParquetFileFormat().make_write_options(compression="zstd")
+                   if fmt == "parquet" else ds.IpcFileFormat().make_write_options(compression=None))
+        visited = []
+        ds.write_dataset(
+            table, path, format="parquet" if fmt == "parquet" else "ipc",
+            partitioning=list(partition_by) or None, partitioning_flavor="hive" if partition_by else None,
+            basename_template="part-{i}" + EXPORT_FORMATS[fmt], file_options=options,
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda written: visited.append(written.path))
+        files = [os.path.relpath(f, path) for f in visited]
+
+    manifest = {
+        "format": fmt,
+        "description": description,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "rows": int(len(frame)),
+        "columns": {c: str(t) for c, t in frame.dtypes.items()},
+        "partition_by": list(partition_by),
+        "files": sorted(files),
+    }
+    with open(os.path.join(path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    print(f"Wrote {len(frame)} rows to {path} ({fmt}, {len(files)} file(s))")
+    return path
+
+
+def _write_csv_partitions(frame: pd.DataFrame, path: str, partition_by: List[str]) -> List[str]:
+    groups = frame.groupby(partition_by, observed=True, sort=True) if partition_by else [((), frame)]
+    files = []
+    for values, part in groups:
+        values = values if isinstance(values, tuple) else (values,)
+        rel = os.path.join(_partition_dir(values, partition_by), "part-0" + EXPORT_FORMATS["csv.gz"])
+        os.makedirs(os.path.dirname(os.path.join(path, rel)) or path, exist_ok=True)
+        part.drop(columns=partition_by).to_csv(os.path.join(path, rel), index=False, compression="gzip")
+        files.append(rel)
+    return files
+
+
+# -------------------
+# Function to read a derived dataset back
+# -------------------
+
+def read_manifest(path: str) -> Dict[str, object]:
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def read_derived(path: str, filters: Optional[Dict[str, object]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a dataset written by ``write_derived``.
+
+    Parameters:
+    -----------
+    path : str
+        Dataset directory
+    filters : dict, optional
+        {column: value or list of values}; partitions that do not match are
+        not read at all, e.g. ``{"scenario": "HD_ER_RCP85_1_CDD_20_10"}``
+    columns : list, optional
+        Columns to read (all by default)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Partition columns come back as categoricals. Arrow files are
+        memory-mapped: unfiltered reads, or reads filtered on partition
+        columns only, map the stored columns rather than copying them into
+        memory (filters on other columns copy the matching rows).
+    """
+    manifest = read_manifest(path)
+    fmt, partition_by = manifest["format"], manifest["partition_by"]
+    filters = {k: [v] if isinstance(v, (str, int)) else list(v) for k, v in (filters or {}).items()}
+
+    if fmt == "csv.gz":
+        return _read_csv_partitions(path, manifest, filters, columns)
+
+    _require_pyarrow(fmt)
+    if not manifest["files"]:
+        return _empty_frame(manifest, columns)
+    partitioning = ds.partitioning(pa.schema([(c, pa.string()) for c in partition_by]),
+                                   flavor="hive") if partition_by else None
+    # Arrow files are memory-mapped rather than read into new buffers
+    filesystem = pafs.LocalFileSystem(use_mmap=True) if fmt == "arrow" else None
+    base = os.path.abspath(path)
+    dataset = ds.dataset([os.path.join(base, f) for f in manifest["files"]],
+                         format="parquet" if fmt == "parquet" else "ipc",
+                         partitioning=partitioning, partition_base_dir=base,
+                         filesystem=filesystem)
+    expression = None
+    for column, values in filters.items():
+        condition = ds.field(column).isin(values)
+        expression = condition if expression is None else expression & condition
+    table = dataset.to_table(columns=columns, filter=expression)
+    # Partition values come back as strings; encode them as the other identifiers
+    for column in partition_by:
+        if column in table.column_names:
+            i = table.column_names.index(column)
+            table = table.set_column(i, column, table.column(i).dictionary_encode())
+    frame = table.to_pandas(split_blocks=True, self_destruct=True)
+    return frame[columns or [c for c in manifest["columns"] if c in frame.columns]]
+
+
+def _empty_frame(manifest, columns) -> pd.DataFrame:
+    dtypes = {c: ("object" if t == "category" else t) for c, t in manifest["columns"].items()}
+    return pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtypes.items()})[columns or list(dtypes)]
+
+
+def _read_csv_partitions(path, manifest, filters, columns) -> pd.DataFrame:
+    partition_by = manifest["partition_by"]
+    frames = []
+    for rel in manifest["files"]:
+        parts = {c: unquote(v) for c, v in (p.split("=", 1) for p in rel.split(os.sep)[:-1])}
+        if any(parts.get(c) not in [str(v) for v in vals] for c, vals in filters.items() if c in parts):
+            continue
+        frame = pd.read_csv(os.path.join(path, rel))
+        for c in partition_by:
+            frame[c] = parts[c]
+        frames.append(frame)
+    if not frames:
+        return _empty_frame(manifest, columns)
+    frame = pd.concat(frames, ignore_index=True)
+    for c in partition_by:
+        frame[c] = frame[c].astype("category")
+    for column, values in filters.items():
+        if column not in partition_by:
+            frame = frame[frame[column].isin(values)]
+    order = [c for c in manifest["columns"] if c in frame.columns]
+    return frame[columns or order].reset_index(drop=True)
@@ -0,0 +1,85 @@
+"""
+Content fingerprints of data slices and arguments, and the sidecar records
+that let a figure be skipped when nothing it depends on has changed.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Suffix of the record written next to the first output of a rendered figure
+SIDECAR_SUFFIX = ".render.json"
+
+
+def _update(h, obj):
+    """Feed one object into the hash, dispatching on its type."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        labels = obj.columns if isinstance(obj, pd.DataFrame) else [obj.name]
+        h.update(",".join(map(str, labels)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif hasattr(obj, "fingerprint") and callable(obj.fingerprint):
+        h.update(obj.fingerprint().encode())
+    elif isinstance(getattr(obj, "data", None), pd.DataFrame):
+        # pyam.IamDataFrame
+        _update(h, obj.data)
+    elif isinstance(obj, np.ndarray):
+        h.update(str((obj.dtype, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(json.dumps(obj, sort_keys=True, default=repr).encode())
+
+
+def fingerprint(*parts) -> str:
+    """
+    Hash of data frames, arrays and plain (JSON-able) arguments.
+
+    Frames are hashed by content (``pandas.util.hash_pandas_object``, without
+    the index), so the same rows give the same fingerprint however the frame
+    was obtained. Objects with a ``fingerprint()`` method supply their own.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        _update(h, part)
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def source_fingerprint(path: str) -> str:
+    """Hash of a source file, so that figures are redrawn when the plotting code changes."""
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+
+
+# -------------------
+# Sidecar records of rendered figures
+# -------------------
+
+def sidecar_path(outputs: List[str]) -> str:
+    return outputs[0] + SIDECAR_SUFFIX
+
+
+def is_up_to_date(outputs: List[str], fp: str) -> bool:
+    """True if every output exists and was rendered from fingerprint ``fp``."""
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    try:
+        with open(sidecar_path(outputs)) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return record.get("fingerprint") == fp
+
+
+def mark_rendered(outputs: List[str], fp: str):
+    """Record that ``outputs`` were rendered from fingerprint ``fp``."""
+    record = {
+        "fingerprint": fp,
+        "outputs": [os.path.basename(p) for p in outputs],
+        "rendered": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(sidecar_path(outputs), "w") as f:
+        json.dump(record, f, indent=1)
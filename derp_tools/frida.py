@@ -0,0 +1,421 @@
+"""
+Helpers for the FRIDA uncertainty (percentile) data, and the ensemble engine
+that derives percentile differences from the ensemble members.
+"""
+import csv
+import os
+import warnings
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.loading import YEAR_PATTERN, sniff_encoding
+
+
+def _positions(labels) -> Dict[object, int]:
+    return {label: i for i, label in enumerate(labels)}
+
+
+class PercentileTable:
+    """
+    Dense lookup of percentile differences indexed by
+    (variable, scenario, percentile, year).
+
+    Built once from a table such as
+    ``data/differences/FRIDA_percentage_capacity_differences.csv``
+    (columns Variable, Scenario, Percentile and one column per year), after
+    which all medians and bounds of a panel come from one array gather.
+    """
+
+    def __init__(self, values: np.ndarray, present: np.ndarray,
+                 variables: Sequence[str], scenarios: Sequence[str],
+                 percentiles: Sequence[int], years: Sequence[int], source: str = ""):
+        self.values = values            # (variable, scenario, percentile, year)
+        self.present = present          # (variable, scenario, percentile) rows in the file
+        self.variables = list(variables)
+        self.scenarios = list(scenarios)
+        self.percentiles = list(percentiles)
+        self.years = list(years)
+        self.source = source
+        self._var_pos = _positions(self.variables)
+        self._scen_pos = _positions(self.scenarios)
+        self._pct_pos = _positions(self.percentiles)
+        self._year_pos = _positions(self.years)
+
+    @classmethod
+    def from_frame(cls, raw: pd.DataFrame, source: str = "") -> "PercentileTable":
+        """Build the table from a wide Variable/Scenario/Percentile/years frame."""
+        year_cols = [c for c in raw.columns if YEAR_PATTERN.match(str(c).strip())]
+        years = [int(YEAR_PATTERN.match(str(c).strip()).group(1)) for c in year_cols]
+
+        v_codes, variables = pd.factorize(raw["Variable"])
+        s_codes, scenarios = pd.factorize(raw["Scenario"])
+        p_codes, percentiles = pd.factorize(raw["Percentile"].astype(int))
+
+        shape = (len(variables), len(scenarios), len(percentiles))
+        values = np.full(shape + (len(years),), np.nan)
+        values[v_codes, s_codes, p_codes, :] = raw[year_cols].to_numpy(dtype=float)
+        present = np.zeros(shape, dtype=bool)
+        present[v_codes, s_codes, p_codes] = True
+        return cls(values, present, variables, scenarios, percentiles, years, source)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "PercentileTable":
+        """Read the table from a CSV file."""
+        return cls.from_frame(pd.read_csv(path), source=path)
+
+    def to_wide(self) -> pd.DataFrame:
+        """The table in the layout of its CSV file (Variable, Scenario, Percentile, years)."""
+        v, s, p = np.nonzero(self.present)
+        wide = pd.DataFrame({
+            "Variable": np.asarray(self.variables, dtype=object)[v],
+            "Scenario": np.asarray(self.scenarios, dtype=object)[s],
+            "Percentile": np.asarray(self.percentiles)[p],
+        })
+        years = pd.DataFrame(self.values[v, s, p, :], columns=[str(y) for y in self.years])
+        return pd.concat([wide, years], axis=1)
+
+    def to_csv(self, path: str):
+        """Write the table as e.g. ``FRIDA_percentage_capacity_differences.csv``."""
+        self.to_wide().to_csv(path, index=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long frame (variable, scenario, percentile, year, value) of the rows in the table."""
+        v, s, p = np.nonzero(self.present)
+        n_years = len(self.years)
+        return pd.DataFrame({
+            "variable": pd.Categorical.from_codes(np.repeat(v, n_years), categories=self.variables),
+            "scenario": pd.Categorical.from_codes(np.repeat(s, n_years), categories=self.scenarios),
+            "percentile": np.repeat(np.asarray(self.percentiles, dtype=np.int64)[p], n_years),
+            "year": np.tile(np.asarray(self.years, dtype=np.int64), len(v)),
+            "value": self.values[v, s, p, :].ravel(),
+        })
+
+    def _index(self, positions: Dict[object, int], labels, what: str) -> np.ndarray:
+        missing = [label for label in labels if label not in positions]
+        if missing:
+            where = f" in {self.source}" if self.source else ""
+            raise KeyError(f"{what} not found in percentile table{where}: {missing}")
+        return np.array([positions[label] for label in labels], dtype=int)
+
+    def gather(self, variables: List[str], scenario: str, year: int,
+               percentiles: Sequence[int] = (50, 5, 95)) -> np.ndarray:
+        """
+        Values of ``variables`` for one scenario and year.
+
+        Returns an array of shape (len(percentiles), len(variables)).
+        Raises a KeyError naming the missing labels if a variable, scenario,
+        percentile or year is not in the table, or if a combination of them
+        has no row.
+        """
+        v_idx = self._index(self._var_pos, list(variables), "variable(s)")
+        s_idx = self._index(self._scen_pos, [scenario], "scenario")[0]
+        p_idx = self._index(self._pct_pos, [int(p) for p in percentiles], "percentile(s)")
+        y_idx = self._index(self._year_pos, [int(year)], "year")[0]
+
+        rows_present = self.present[v_idx[np.newaxis, :], s_idx, p_idx[:, np.newaxis]]
+        if not rows_present.all():
+            p_miss, v_miss = np.nonzero(~rows_present)
+            combos = [(self.variables[v_idx[v]], scenario, self.percentiles[p_idx[p]])
+                      for p, v in zip(p_miss, v_miss)]
+            raise KeyError(f"no percentile rows for (variable, scenario, percentile): {combos}")
+
+        return self.values[v_idx[np.newaxis, :], s_idx, p_idx[:, np.newaxis], y_idx]
+
+
+class UncertaintyBands:
+    """
+    Lazy provider of FRIDA percentile series (e.g. 5th/95th) for any variable.
+
+    Files are looked up as ``{unc_dir}/FRIDA_{scenario}_{percentile}.csv``.
+    The first request for a file scans it once to record the byte offset of
+    each variable's row; afterwards only the rows that are asked for are
+    parsed, and each (variable, scenario, percentile) is kept as one float
+    array. Nothing is read for scenarios or percentiles that are never used.
+
+    Parameters:
+    -----------
+    unc_dir : str
+        Directory with the percentile files
+    file_pattern : str, optional
+        File name pattern with ``{scenario}`` and ``{percentile}`` fields
+    """
+
+    def __init__(self, unc_dir: str, file_pattern: str = "FRIDA_{scenario}_{percentile}.csv"):
+        self.unc_dir = unc_dir
+        self.file_pattern = file_pattern
+        self._files = {}    # path -> (encoding, year columns, years, {variable: row offset})
+        self._series = {}   # (variable, scenario, percentile) -> (years, values)
+
+    def _path(self, scenario: str, percentile: str) -> str:
+        return os.path.join(self.unc_dir, self.file_pattern.format(scenario=scenario,
+                                                                   percentile=percentile))
+
+    @staticmethod
+    def _split(line: str) -> List[str]:
+        # Plain split unless the row uses quoting
+        if '"' in line:
+            return next(csv.reader([line]))
+        return line.rstrip("\r\n").split(",")
+
+    def _scan(self, path: str):
+        """Index a percentile file: header layout and row offset of each variable."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no percentile file {path}")
+        encoding = sniff_encoding(path)
+        offsets = {}
+        with open(path, "rb") as f:
+            header = self._split(f.readline().decode(encoding))
+            lowered = [h.strip().lower() for h in header]
+            var_col = lowered.index("variable")
+            year_cols = [i for i, h in enumerate(header) if YEAR_PATTERN.match(h.strip())]
+            years = np.array([int(YEAR_PATTERN.match(header[i].strip()).group(1)) for i in year_cols])
+
+            pos = f.tell()
+            for raw in iter(f.readline, b""):
+                line = raw.decode(encoding)
+                if '"' in line:
+                    variable = self._split(line)[var_col]
+                else:
+                    variable = line.split(",", var_col + 1)[var_col]
+                offsets.setdefault(variable, pos)
+                pos += len(raw)
+        self._files[path] = (encoding, year_cols, years, offsets)
+
+    def get(self, variable: str, scenario: str, percentile: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Years and values of one variable for one scenario and percentile."""
+        key = (variable, scenario, percentile)
+        if key in self._series:
+            return self._series[key]
+
+        path = self._path(scenario, percentile)
+        if path not in self._files:
+            self._scan(path)
+        encoding, year_cols, years, offsets = self._files[path]
+        if variable not in offsets:
+            raise KeyError(f"variable {variable!r} not found in {path}")
+
+        with open(path, "rb") as f:
+            f.seek(offsets[variable])
+            fields = self._split(f.readline().decode(encoding))
+        values = np.array([float(fields[i]) if fields[i].strip() else np.nan for i in year_cols])
+
+        self._series[key] = (years, values)
+        return years, values
+
+    def band(self, variable: str, scenario: str,
+             lower: str = "5th", upper: str = "95th") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Years, lower and upper percentile series of one variable and scenario."""
+        years, lo = self.get(variable, scenario, lower)
+        _, hi = self.get(variable, scenario, upper)
+        return years, lo, hi
+
+
+# -------------------
+# Ensemble engine: percentile differences from the ensemble members
+# -------------------
+
+class EnsembleMembers:
+    """
+    Reader of FRIDA ensemble runs, one file per scenario.
+
+    Files are looked up as ``{member_dir}/FRIDA_{scenario}_members.csv``, in
+    the layout of the other FRIDA files plus a column numbering the ensemble
+    member (run); member ``i`` of every scenario uses the same parameter draw.
+    Files are read in chunks of ``chunk_size`` rows, keeping only the
+    variables and years asked for, so memory grows with the number of members
+    times the selected variables and years, not with the size of the files.
+
+    Parameters:
+    -----------
+    member_dir : str
+        Directory with the member files
+    file_pattern : str, optional
+        File name pattern with a ``{scenario}`` field
+    member_column : str, optional
+        Column identifying the member
+    chunk_size : int, optional
+        Rows parsed at a time
+    """
+
+    def __init__(self, member_dir: str, file_pattern: str = "FRIDA_{scenario}_members.csv",
+                 member_column: str = "Member", chunk_size: int = 50_000):
+        self.member_dir = member_dir
+        self.file_pattern = file_pattern
+        self.member_column = member_column
+        self.chunk_size = chunk_size
+
+    def _path(self, scenario: str) -> str:
+        return os.path.join(self.member_dir, self.file_pattern.format(scenario=scenario))
+
+    def chunks(self, scenario: str, variables: Sequence[str],
+               years: Sequence[int], region: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """Chunks of the member rows of ``variables``, with the columns of ``years`` only."""
+        path = self._path(scenario)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no ensemble file {path}")
+        encoding = sniff_encoding(path)
+        header = pd.read_csv(path, nrows=0, encoding=encoding).columns
+        year_cols = {int(YEAR_PATTERN.match(str(c).strip()).group(1)): c
+                     for c in header if YEAR_PATTERN.match(str(c).strip())}
+        missing = [y for y in years if int(y) not in year_cols]
+        if missing:
+            raise KeyError(f"year(s) not in {path}: {missing}")
+        usecols = [self.member_column, "Variable"] + (["Region"] if region is not None else [])
+        usecols += [year_cols[int(y)] for y in years]
+
+        wanted = set(variables)
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=self.chunk_size, encoding=encoding):
+            keep = chunk["Variable"].isin(wanted)
+            if region is not None:
+                keep &= chunk["Region"] == region
+            if keep.any():
+                yield chunk.loc[keep].rename(columns={year_cols[int(y)]: int(y) for y in years})
+
+    def values(self, scenario: str, variables: Sequence[str], years: Sequence[int],
+               region: Optional[str] = None) -> Tuple[pd.Index, np.ndarray]:
+        """
+        Member ids and values of one scenario.
+
+        Returns the member ids, in the order of the file, and an array of
+        shape (members, len(variables), len(years)), NaN where a member lacks
+        a row. A first pass over the member and variable columns counts the
+        members, so the array is allocated once and each chunk is written
+        into it as it is read: memory is the array plus one chunk.
+        """
+        variables, years = list(variables), [int(y) for y in years]
+        member_pos: Dict[object, int] = {}
+        for chunk in self.chunks(scenario, variables, [], region):
+            for member in pd.unique(chunk[self.member_column]):
+                member_pos.setdefault(member, len(member_pos))
+        if not member_pos:
+            raise KeyError(f"none of the variables {variables} in {self._path(scenario)}")
+
+        var_pos = _positions(variables)
+        values = np.full((len(member_pos), len(variables), len(years)), np.nan)
+        for chunk in self.chunks(scenario, variables, years, region):
+            rows = chunk[self.member_column].map(member_pos).to_numpy()
+            var_codes = chunk["Variable"].map(var_pos).to_numpy()
+            values[rows, var_codes, :] = chunk[years].to_numpy(dtype=float)
+        return pd.Index(list(member_pos)), values
+
+
+def percentage_differences(values: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+    """Member-wise percentage difference to the baseline; NaN where the baseline is 0 or missing."""
+    out = np.full(np.broadcast_shapes(values.shape, baseline.shape), np.nan)
+    defined = ~np.isnan(baseline) & (baseline != 0)
+    np.divide(values - baseline, baseline, out=out, where=defined)
+    return out * 100
+
+
+def ensemble_percentile_differences(members: EnsembleMembers, baseline: str,
+                                    scenarios: Sequence[str], variables: Sequence[str],
+                                    years: Sequence[int],
+                                    percentiles: Sequence[int] = (50, 5, 95),
+                                    region: Optional[str] = None,
+                                    fallback: Optional[PercentileTable] = None) -> PercentileTable:
+    """
+    Percentiles over the ensemble of the member-wise percentage differences
+    of each scenario to the baseline scenario.
+
+    Each member of a scenario is compared with the same member of the
+    baseline, then the differences are reduced to ``percentiles`` across
+    members, for all variables and years in one call per scenario. With the
+    defaults and years 2040/2070/2100 this reproduces
+    ``data/differences/FRIDA_percentage_capacity_differences.csv``, NaN rows
+    included (e.g. a variable whose baseline is 0).
+
+    Parameters:
+    -----------
+    members : EnsembleMembers
+        Reader of the ensemble files
+    baseline : str
+        Baseline scenario
+    scenarios : list
+        Scenarios compared with the baseline
+    variables : list
+        Variables (e.g. the capacity variables)
+    years : list
+        Years of the table, any subset of the years in the files
+    percentiles : list, optional
+        Percentiles (0-100) across members
+    region : str, optional
+        Region to keep, if the files hold several
+    fallback : PercentileTable, optional
+        Table (e.g. the precomputed CSV) whose rows are used for the
+        scenarios without an ensemble file; without it a missing file raises
+
+    Returns:
+    --------
+    PercentileTable
+        Indexed by (variable, scenario, percentile, year)
+    """
+    variables, years = list(variables), [int(y) for y in years]
+    percentiles = [int(p) for p in percentiles]
+    try:
+        base_members, base_values = members.values(baseline, variables, years, region)
+    except FileNotFoundError as e:
+        if fallback is None:
+            raise
+        print(f"Warning: {e}; using the rows of {fallback.source or 'the fallback table'}")
+        base_members = base_values = None
+
+    table = np.full((len(variables), len(scenarios), len(percentiles), len(years)), np.nan)
+    present = np.zeros(table.shape[:3], dtype=bool)
+    for s, scenario in enumerate(scenarios):
+        scen = None
+        if base_values is not None:
+            try:
+                scen = members.values(scenario, variables, years, region)
+            except FileNotFoundError as e:
+                if fallback is None:
+                    raise
+                print(f"Warning: {e}; {scenario} uses the rows of "
+                      f"{fallback.source or 'the fallback table'}")
+        if scen is None:
+            table[:, s], present[:, s] = _fallback_rows(fallback, scenario, variables,
+                                                        percentiles, years)
+            continue
+        scen_members, scen_values = scen
+        common = scen_members.intersection(base_members)
+        if len(common) < len(scen_members) or len(common) < len(base_members):
+            print(f"Warning: {scenario} and {baseline} share {len(common)} of "
+                  f"{len(scen_members)}/{len(base_members)} members; only those are compared")
+        if scen_members.equals(base_members):
+            # Same members in the same order: no re-indexed copies
+            scen_common, base_common = scen_values, base_values
+        else:
+            scen_common = scen_values[scen_members.get_indexer(common)]
+            base_common = base_values[base_members.get_indexer(common)]
+        diffs = percentage_differences(scen_common, base_common)
+        # (percentile, variable, year) -> (variable, percentile, year); variables
+        # whose differences are all NaN (a baseline of 0) stay NaN, as in the CSV
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            table[:, s] = np.nanpercentile(diffs, percentiles, axis=0).transpose(1, 0, 2)
+        # A row exists wherever both scenarios report the variable
+        reported = (~np.isnan(scen_common).all(axis=(0, 2))
+                    & ~np.isnan(base_common).all(axis=(0, 2)))
+        present[:, s] = reported[:, np.newaxis]
+    return PercentileTable(table, present, variables, scenarios, percentiles, years,
+                           source=f"ensemble in {members.member_dir}")
+
+
+def _fallback_rows(fallback: PercentileTable, scenario: str, variables: List[str],
+                   percentiles: List[int], years: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Values (variable, percentile, year) and rows present of one scenario of ``fallback``."""
+    values = np.full((len(variables), len(percentiles), len(years)), np.nan)
+    present = np.zeros(values.shape[:2], dtype=bool)
+    if scenario not in fallback._scen_pos:
+        return values, present
+    s = fallback._scen_pos[scenario]
+    v_out = [i for i, v in enumerate(variables) if v in fallback._var_pos]
+    p_out = [i for i, p in enumerate(percentiles) if p in fallback._pct_pos]
+    y_out = [i for i, y in enumerate(years) if y in fallback._year_pos]
+    v_in = [fallback._var_pos[variables[i]] for i in v_out]
+    p_in = [fallback._pct_pos[percentiles[i]] for i in p_out]
+    y_in = [fallback._year_pos[years[i]] for i in y_out]
+    values[np.ix_(v_out, p_out, y_out)] = fallback.values[np.ix_(v_in, [s], p_in, y_in)][:, 0]
+    present[np.ix_(v_out, p_out)] = fallback.present[np.ix_(v_in, [s], p_in)][:, 0]
+    return values, present
@@ -0,0 +1,214 @@
+"""
+Tree of IAMC variable names (``Capacity|Electricity|Solar`` is a child of
+``Capacity|Electricity``) and vectorised checks that children add up to
+their parent.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.changes import as_long, factorize_columns
+from derp_tools.loading import compile_pattern
+
+# Columns that identify the data point a check is made for
+CHECK_COLUMNS = ["model", "scenario", "region", "year"]
+
+
+class VariableTree:
+    """
+    Parent/child index of ``|``-separated variable names.
+
+    Intermediate levels that are not variables themselves are part of the
+    tree too, so ``children("Final Energy")`` works even if only
+    ``Final Energy|Industry|Electricity`` is reported.
+    """
+
+    def __init__(self, variables: Iterable[str]):
+        self.variables = sorted(set(variables))
+        self.parent: Dict[str, Optional[str]] = {}
+        self._children: Dict[str, List[str]] = {}
+        for variable in self.variables:
+            node = variable
+            while node not in self.parent:
+                parent = node.rsplit("|", 1)[0] if "|" in node else None
+                self.parent[node] = parent
+                if parent is None:
+                    break
+                self._children.setdefault(parent, []).append(node)
+                node = parent
+        for children in self._children.values():
+            children.sort()
+
+    @classmethod
+    def from_data(cls, df) -> "VariableTree":
+        """Tree of the variables of a pyam.IamDataFrame or long DataFrame."""
+        data = as_long(df)
+        return cls(pd.unique(data["variable"]))
+
+    def __contains__(self, variable) -> bool:
+        return variable in self.parent
+
+    def children(self, variable: str) -> List[str]:
+        return list(self._children.get(variable, []))
+
+    def descendants(self, variable: str) -> List[str]:
+        found, stack = [], self.children(variable)
+        while stack:
+            node = stack.pop()
+            found.append(node)
+            stack.extend(self.children(node))
+        return sorted(found)
+
+    def depth(self, variable: str) -> int:
+        return variable.count("|")
+
+    def leaves(self) -> List[str]:
+        return [v for v in self.variables if v not in self._children]
+
+    def components(self, parents=None) -> Dict[str, Tuple[str, List[str]]]:
+        """
+        {check name: (parent, reported direct children)} for every reported
+        variable with reported children, optionally only for ``parents``
+        (labels or ``*`` patterns).
+        """
+        reported = set(self.variables)
+        pattern = compile_pattern(parents) if parents is not None else None
+        checks = {}
+        for variable in self.variables:
+            if pattern is not None and not pattern.fullmatch(variable):
+                continue
+            children = [c for c in self.children(variable) if c in reported]
+            if children:
+                checks[variable] = (variable, children)
+        return checks
+
+
+def common_parent(variables: Sequence[str]) -> Optional[str]:
+    """The parent shared by all ``variables``, or None if they have different parents."""
+    parents = {v.rsplit("|", 1)[0] for v in variables if "|" in v}
+    if len(parents) == 1 and all("|" in v for v in variables):
+        return parents.pop()
+    return None
+
+
+def _match_rows(row_codes: np.ndarray, pair_codes: np.ndarray, n_codes: int):
+    """
+    All (row, pair) combinations with equal codes, without a Python loop.
+
+    Returns the row positions and pair positions, one entry per match.
+    """
+    order = np.argsort(pair_codes, kind="stable")
+    per_code = np.bincount(pair_codes, minlength=n_codes)
+    starts = np.r_[0, np.cumsum(per_code)[:-1]]
+
+    n_matches = per_code[row_codes]
+    rows = np.repeat(np.arange(len(row_codes)), n_matches)
+    # Position of each match within its code's block of pairs
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(n_matches) - n_matches, n_matches)
+    pairs = order[starts[row_codes[rows]] + within]
+    return rows, pairs
+
+
+# -------------------
+# Function to check that children add up to their parent
+# -------------------
+
+def check_sums(df, components: Union[None, Dict[str, Sequence[str]]] = None, *,
+               parents=None, rtol: float = 1e-2, atol: float = 1e-6,
+               tree: Optional[VariableTree] = None) -> pd.DataFrame:
+    """
+    Check parent/child sums for every model, scenario, region and year in one pass.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Data in long format
+    components : dict, optional
+        {name: list of variables} that should add up to their common parent,
+        e.g. the ``groups`` dict of the analysis scripts. Lists without a
+        common parent are skipped with a warning. If None, every reported
+        variable is checked against its reported direct children.
+    parents : str or list, optional
+        With ``components=None``, only check these parents (``*`` wildcards)
+    rtol, atol : float, optional
+        A point is a violation if |children sum - parent| > atol + rtol * |parent|
+    tree : VariableTree, optional
+        Pre-built tree of the data's variables
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per violation: check, parent, model, scenario, region, year,
+        parent_value, children_sum, difference, relative_difference, and the
+        number of children reported and expected
+    """
+    data = as_long(df)
+    if components is None:
+        tree = tree or VariableTree.from_data(data)
+        checks = tree.components(parents)
+    else:
+        checks = {}
+        for name, children in components.items():
+            parent = common_parent(children)
+            if parent is None:
+                print(f"Warning: {name!r} has no common parent, not checked")
+                continue
+            checks[name] = (parent, list(children))
+
+    columns = ["check", "parent"] + CHECK_COLUMNS + [
+        "parent_value", "children_sum", "difference", "relative_difference",
+        "n_children", "n_expected"]
+    if not checks:
+        return pd.DataFrame(columns=columns)
+
+    names = list(checks)
+    parent_vars = [checks[n][0] for n in names]
+    child_pairs = [(k, c) for k, n in enumerate(names) for c in checks[n][1]]
+
+    # Variable codes shared by the data and the checks
+    variables = pd.Index(pd.unique(np.array(parent_vars + [c for _, c in child_pairs], dtype=object)))
+    var_codes = variables.get_indexer(data["variable"])
+    data, var_codes = data[var_codes >= 0], var_codes[var_codes >= 0]
+    point_codes, first_rows = factorize_columns(data, CHECK_COLUMNS)
+    values = data["value"].to_numpy()
+    n_points, n_checks = len(first_rows), len(names)
+
+    # Children: every row adds its value to each check it is a child in
+    pair_check = np.array([k for k, _ in child_pairs])
+    pair_var = variables.get_indexer([c for _, c in child_pairs])
+    rows, pairs = _match_rows(var_codes, pair_var, len(variables))
+    slot = pair_check[pairs] * n_points + point_codes[rows]
+    size = n_checks * n_points
+    children_sum = np.bincount(slot, weights=values[rows], minlength=size).reshape(n_checks, n_points)
+    n_children = np.bincount(slot, minlength=size).reshape(n_checks, n_points)
+
+    # Parents: the same parent may be checked against several child sets
+    rows, checks_of_row = _match_rows(var_codes, variables.get_indexer(parent_vars), len(variables))
+    parent_value = np.full((n_checks, n_points), np.nan)
+    parent_value[checks_of_row, point_codes[rows]] = values[rows]
+
+    difference = children_sum - parent_value
+    bad = (~np.isnan(parent_value) & (n_children > 0) &
+           (np.abs(difference) > atol + rtol * np.abs(parent_value)))
+    k_idx, p_idx = np.nonzero(bad)
+
+    report = data[CHECK_COLUMNS].iloc[first_rows[p_idx]].reset_index(drop=True)
+    report.insert(0, "parent", np.asarray(parent_vars, dtype=object)[k_idx])
+    report.insert(0, "check", np.asarray(names, dtype=object)[k_idx])
+    report["parent_value"] = parent_value[k_idx, p_idx]
+    report["children_sum"] = children_sum[k_idx, p_idx]
+    report["difference"] = difference[k_idx, p_idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        report["relative_difference"] = report["difference"] / report["parent_value"].abs()
+    report["n_children"] = n_children[k_idx, p_idx]
+    report["n_expected"] = np.array([len(checks[n][1]) for n in names])[k_idx]
+    return report[columns]
+
+
+def violation_summary(report: pd.DataFrame) -> pd.DataFrame:
+    """Number of violating points and largest relative difference per check and model."""
+    return (report.assign(abs_relative=report["relative_difference"].abs())
+                  .groupby(["check", "model"])
+                  .agg(points=("year", "size"), max_relative_difference=("abs_relative", "max"))
+                  .reset_index())
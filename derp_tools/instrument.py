@@ -0,0 +1,173 @@
+"""
+Timing and memory instrumentation of named pipeline stages (input files,
+baseline changes, panels, ...), written to a JSON or CSV log.
+
+Library code records stages with the module-level ``stage()`` context
+manager; it only costs a few clock reads, and nothing is kept unless a
+``PipelineLog`` is active:
+
+    log = PipelineLog("FRIDA uncertainties")
+    with log.activate():
+        with stage("load") as st:
+            df = load_and_concat_files_then_pyam(path)
+            st.output(df)
+    log.write("pipeline_logs/run")
+"""
+import json
+import os
+import pathlib
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Log that stage() records into, if any
+_ACTIVE: Optional["PipelineLog"] = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(obj) -> Dict[str, Optional[int]]:
+    """Row count and in-memory size of a DataFrame, IamDataFrame, array or file path."""
+    if obj is None:
+        return {"rows": None, "bytes": None}
+    if isinstance(obj, (str, pathlib.Path)):
+        return {"rows": None, "bytes": os.path.getsize(obj) if os.path.exists(obj) else None}
+    data = getattr(obj, "data", obj) if not hasattr(obj, "memory_usage") else obj
+    if hasattr(data, "memory_usage"):
+        usage = data.memory_usage(index=True)
+        return {"rows": len(data), "bytes": int(usage.sum() if hasattr(usage, "sum") else usage)}
+    if hasattr(data, "nbytes"):
+        return {"rows": len(data) if getattr(data, "ndim", 0) else None, "bytes": int(data.nbytes)}
+    return {"rows": len(obj) if hasattr(obj, "__len__") else None, "bytes": None}
+
+
+class StageRecord(dict):
+    """Measurements of one stage; ``output()`` adds the rows and bytes of its result."""
+
+    def output(self, obj):
+        sizes = measure(obj)
+        self["rows"], self["bytes"] = sizes["rows"], sizes["bytes"]
+        return obj
+
+
+@contextmanager
+def stage(name: str, **info):
+    """
+    Record wall time, CPU time and peak RSS of the enclosed block in the active log.
+
+    Extra keyword arguments (e.g. ``region="World"``) are stored with the
+    record. The yielded record accepts ``output(obj)`` to store row and byte
+    counts of the stage's result.
+    """
+    record = StageRecord(stage=name, **info)
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    rss_before = peak_rss_mb()
+    status = "ok"
+    try:
+        yield record
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record.setdefault("rows", None)
+        record.setdefault("bytes", None)
+        record.update(
+            wall_seconds=round(time.perf_counter() - start_wall, 6),
+            cpu_seconds=round(time.process_time() - start_cpu, 6),
+            peak_rss_mb=peak_rss_mb(),
+            peak_rss_growth_mb=None if rss_before is None else round(peak_rss_mb() - rss_before, 3),
+            pid=os.getpid(),
+            status=status,
+            finished=datetime.now().isoformat(timespec="milliseconds"),
+        )
+        if _ACTIVE is not None:
+            _ACTIVE.add(record)
+
+
+def timed_call(name: str, fn: Callable, *args, **info):
+    """
+    Run ``fn(*args)`` as a stage and return ``(result, record)``.
+
+    For work done in worker processes, whose own log is not seen by the
+    parent: the parent passes the record on with ``record_stages``.
+    """
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, None
+    try:
+        with stage(name, **info) as record:
+            result = record.output(fn(*args))
+    finally:
+        _ACTIVE = previous
+    return result, record
+
+
+def record_stages(records: List[dict]):
+    """Add stages measured elsewhere (e.g. in a worker process) to the active log."""
+    if _ACTIVE is not None:
+        for record in records:
+            _ACTIVE.add(record)
+
+
+class PipelineLog:
+    """
+    Collects the stage records of a run and writes them as JSON and CSV.
+
+    Parameters:
+    -----------
+    name : str, optional
+        Name of the run, stored in the JSON log
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.records: List[dict] = []
+
+    def add(self, record: dict):
+        self.records.append(dict(record))
+
+    @contextmanager
+    def activate(self):
+        """Make this the log that ``stage()`` records into."""
+        global _ACTIVE
+        previous, _ACTIVE = _ACTIVE, self
+        try:
+            yield self
+        finally:
+            _ACTIVE = previous
+
+    def stage(self, name: str, **info):
+        """``stage()`` recording into this log, whether or not it is active."""
+        @contextmanager
+        def _stage():
+            with self.activate():
+                with stage(name, **info) as record:
+                    yield record
+        return _stage()
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+    def write(self, path_stem: str):
+        """Write ``<path_stem>.json`` and ``<path_stem>.csv``."""
+        pathlib.Path(path_stem).parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{path_stem}.json", "w") as f:
+            json.dump({"name": self.name, "started": self.started,
+                       "stages": self.records}, f, indent=1, default=str)
+        self.to_frame().to_csv(f"{path_stem}.csv", index=False)
+        print(f"Pipeline log written to {path_stem}.json/.csv")
@@ -0,0 +1,238 @@
+"""
+Central registry of model, scenario, region and variable labels: renames
+applied to the data, and display names used on the figures.
+
+Renames are applied to the distinct labels of a dimension (the categories of
+the loaded data, or the levels of a pyam index), never row by row, so they
+cost O(number of labels). Display names are resolved once per label and
+cached, so every panel drawing the same variables reuses them:
+
+    labels = LabelRegistry(rename={"variable": {"Capacity|Electricity|Gas|CCS":
+                                                "Capacity|Electricity|Gas|w/ CCS"}})
+    labels.add_display("variable", capacity_additions_names, overall_capacity_names)
+    labels.add_display("scenario", scenario_names)
+    df = labels.rename(df)
+    labels.display("variable", "Capacity|Electricity|Solar")
+"""
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyam
+
+# Dimensions that can be renamed and displayed
+LABEL_DIMENSIONS = ["model", "scenario", "region", "variable", "unit"]
+
+# pyam releases whose internals the fast path of ``LabelRegistry.rename`` was
+# checked against; other releases go through the public IamDataFrame.rename
+PYAM_FAST_RENAME_VERSIONS = {(3, 3)}
+
+# Display name of a label without an entry, per dimension (default: the label)
+DEFAULT_DISPLAY = {
+    "variable": lambda label: label.split("|")[-1],
+    "model": lambda label: label.replace("_", " "),
+}
+
+
+def _check_dimension(dimension: str):
+    if dimension not in LABEL_DIMENSIONS:
+        raise ValueError(f"Unknown label dimension {dimension!r}, expected one of {LABEL_DIMENSIONS}")
+
+
+def _pyam_version() -> tuple:
+    try:
+        return tuple(int(part) for part in pyam.__version__.split(".")[:2])
+    except (AttributeError, ValueError):
+        return ()
+
+
+def _renamed_index(index: pd.MultiIndex, mapping: Dict[str, Dict[str, str]]):
+    """
+    ``index`` with its levels renamed and whether the renamed labels sort in
+    a different order, or (None, False) if a rename merges two labels (the
+    rows would then have to be combined).
+    """
+    reordered = False
+    for dimension, renames in mapping.items():
+        if dimension not in index.names:
+            continue
+        level = index.levels[index.names.index(dimension)]
+        renamed = pd.Index([renames.get(label, label) for label in level])
+        if not renamed.is_unique:
+            return None, False
+        reordered |= not renamed.is_monotonic_increasing
+        index = index.set_levels(renamed, level=dimension, verify_integrity=False)
+    return index, reordered
+
+
+class LabelRegistry:
+    """
+    Renames and display names of labels, compiled once per dimension.
+
+    Parameters:
+    -----------
+    rename : dict, optional
+        {dimension: {old label: new label}}
+    display : dict, optional
+        {dimension: {label: display name}}
+    fallback : dict, optional
+        {dimension: function giving the display name of a label without an
+        entry}; see ``DEFAULT_DISPLAY``
+    """
+
+    def __init__(self, rename: Optional[Dict[str, Dict[str, str]]] = None,
+                 display: Optional[Dict[str, Dict[str, str]]] = None,
+                 fallback: Optional[Dict[str, Callable[[str], str]]] = None):
+        self._rename: Dict[str, Dict[str, str]] = {}
+        self._display: Dict[str, Dict[str, str]] = {}
+        self._fallback = dict(DEFAULT_DISPLAY, **(fallback or {}))
+        self._cache: Dict[str, Dict[str, str]] = {}
+        for dimension, renames in (rename or {}).items():
+            self.add_rename(dimension, renames)
+        for dimension, names in (display or {}).items():
+            self.add_display(dimension, names)
+
+    # -------------------
+    # Registration
+    # -------------------
+
+    def add_rename(self, dimension: str, *mappings: Dict[str, str]) -> "LabelRegistry":
+        """Add renames of ``dimension``; later mappings win, as with ``dict.update``."""
+        _check_dimension(dimension)
+        renames = self._rename.setdefault(dimension, {})
+        for mapping in mappings:
+            renames.update(mapping)
+        return self
+
+    def add_display(self, dimension: str, *mappings: Dict[str, str]) -> "LabelRegistry":
+        """Add display names of ``dimension``; later mappings win, as with ``dict.update``."""
+        _check_dimension(dimension)
+        names = self._display.setdefault(dimension, {})
+        for mapping in mappings:
+            names.update(mapping)
+        self._cache.pop(dimension, None)
+        return self
+
+    def with_display(self, dimension: str, *mappings: Dict[str, str]) -> "LabelRegistry":
+        """Copy of the registry with display names of ``dimension`` overridden by ``mappings``."""
+        copy = LabelRegistry(self._rename, self._display, self._fallback)
+        return copy.add_display(dimension, *mappings)
+
+    def mapping(self, dimension: str) -> Dict[str, str]:
+        """Registered display names of ``dimension`` as a plain dict."""
+        return dict(self._display.get(dimension, {}))
+
+    # -------------------
+    # Renaming
+    # -------------------
+
+    def rename_label(self, dimension: str, label: str) -> str:
+        return self._rename.get(dimension, {}).get(label, label)
+
+    def rename(self, df):
+        """
+        Data with the registered renames applied.
+
+        ``df`` is a pyam.IamDataFrame, whose index levels are renamed, or a
+        long DataFrame, whose categorical columns have their categories
+        renamed. If a rename merges two labels of a pyam.IamDataFrame, the
+        rows are combined by ``pyam.IamDataFrame.rename`` (which raises on
+        conflicting values); on pyam releases not in
+        ``PYAM_FAST_RENAME_VERSIONS`` every rename goes through it.
+        """
+        mapping = {dim: renames for dim, renames in self._rename.items() if renames}
+        if not mapping:
+            return df
+        if isinstance(df, pyam.IamDataFrame):
+            return self._rename_pyam(df, mapping)
+        return self._rename_frame(df, mapping)
+
+    @staticmethod
+    def _rename_pyam(df: pyam.IamDataFrame, mapping) -> pyam.IamDataFrame:
+        if _pyam_version() in PYAM_FAST_RENAME_VERSIONS:
+            renamed = LabelRegistry._rename_pyam_levels(df, mapping)
+            if renamed is not None:
+                return renamed
+        # Labels are merged, or pyam's internals are unknown: leave it to pyam,
+        # which renames the meta (model, scenario) and data dimensions separately
+        meta_dims = [d for d in mapping if d in df.meta.index.names]
+        data_dims = [d for d in mapping if d not in meta_dims]
+        for dims in (meta_dims, data_dims):
+            if dims:
+                df = df.rename({d: mapping[d] for d in dims}, check_duplicates=True)
+        return df
+
+    @staticmethod
+    def _rename_pyam_levels(df: pyam.IamDataFrame, mapping) -> Optional[pyam.IamDataFrame]:
+        """Rename the index levels of ``df`` in place of its rows; None if labels are merged."""
+        index, reordered = _renamed_index(df._data.index, mapping)
+        meta_index, meta_reordered = df.meta.index, False
+        if index is not None and isinstance(meta_index, pd.MultiIndex):
+            meta_index, meta_reordered = _renamed_index(meta_index, mapping)
+        if index is None or meta_index is None:
+            return None
+        # Same update of pyam's internals as pyam.IamDataFrame.rename, minus
+        # its row-by-row filter and replacement
+        ret = df.copy()
+        ret._data.index = index
+        ret.meta.index = meta_index
+        ret._exclude.index = meta_index
+        # pyam keeps its data sorted, which only needs redoing if a renamed
+        # label now sorts elsewhere (levels are sorted, so order follows codes)
+        if reordered:
+            ret._data.sort_index(inplace=True)
+        if meta_reordered:
+            ret.meta.sort_index(inplace=True)
+            ret._exclude.sort_index(inplace=True)
+        ret._set_attributes()
+        return ret
+
+    @staticmethod
+    def _rename_frame(df: pd.DataFrame, mapping) -> pd.DataFrame:
+        df = df.copy(deep=False)
+        for dimension, renames in mapping.items():
+            if dimension not in df.columns:
+                continue
+            column = df[dimension]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                categories = column.cat.categories
+                renamed = pd.Index([renames.get(c, c) for c in categories])
+                if renamed.is_unique:
+                    df[dimension] = column.cat.rename_categories(renamed)
+                    continue
+                # Merged categories: recode through the unique new labels
+                codes, uniques = pd.factorize(renamed)
+                new_codes = np.where(column.cat.codes.to_numpy() >= 0,
+                                     codes[column.cat.codes.to_numpy()], -1)
+                df[dimension] = pd.Categorical.from_codes(new_codes, categories=uniques)
+            else:
+                codes, uniques = pd.factorize(column)
+                renamed = np.array([renames.get(u, u) for u in uniques], dtype=object)
+                df[dimension] = np.where(codes >= 0, renamed[codes], None)
+        return df
+
+    # -------------------
+    # Display names
+    # -------------------
+
+    def display(self, dimension: str, label: str) -> str:
+        """Display name of one label (cached)."""
+        cache = self._cache.setdefault(dimension, {})
+        if label not in cache:
+            names = self._display.get(dimension, {})
+            fallback = self._fallback.get(dimension)
+            if label in names:
+                name = names[label]
+            else:
+                name = fallback(label) if fallback is not None else label
+            cache[label] = name
+        return cache[label]
+
+    def display_names(self, dimension: str, labels: Iterable[str]) -> List[str]:
+        return [self.display(dimension, label) for label in labels]
+
+    def display_column(self, dimension: str, column) -> np.ndarray:
+        """Display names of a column, resolved once per distinct label."""
+        codes, uniques = pd.factorize(pd.Series(column))
+        names = np.array(self.display_names(dimension, uniques), dtype=object)
+        return np.where(codes >= 0, names[codes], None)
@@ -0,0 +1,466 @@
+"""
+Loading of IAMC-format input files (Model, Scenario, Region, Variable, Unit
+followed by one column per year) into a pyam.IamDataFrame.
+"""
+import codecs
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+import pandas as pd
+import pyam
+
+from derp_tools.cache import DEFAULT_CACHE_BYTES, ParsedFileCache, source_state
+from derp_tools.instrument import record_stages, stage, timed_call
+
+# IAMC identifier columns, in the order pyam expects them
+IAMC_COLUMNS = ["model", "scenario", "region", "variable", "unit"]
+
+# Year headers are either plain years (2005) or R-style exports (X2005)
+YEAR_PATTERN = re.compile(r"^X?(\d{4})$")
+
+# File extensions understood by the loader
+VALID_EXTENSIONS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+}
+
+# Rows parsed at a time by the streaming reader
+DEFAULT_CHUNK_ROWS = 50_000
+
+T = TypeVar("T")
+
+
+# -------------------
+# Helpers
+# -------------------
+
+def sniff_encoding(path: str, sample_size: int = 1 << 20) -> str:
+    """Guess the text encoding of a CSV file from its first ``sample_size`` bytes."""
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False so that a multi-byte character cut by the sample is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "ISO-8859-1"
+
+
+def read_csv_with_fallback(read: Callable[[str], T], encoding: str) -> T:
+    """
+    ``read(encoding)``, re-run with ISO-8859-1 if the file fails to decode.
+
+    ``sniff_encoding`` only sees the start of the file, so a Latin-1 byte
+    further down can still break a UTF-8 read.
+    """
+    try:
+        return read(encoding)
+    except UnicodeDecodeError:
+        if encoding == "ISO-8859-1":
+            raise
+        return read("ISO-8859-1")
+
+
+def split_iamc_columns(columns) -> Tuple[Dict[str, object], List[object], List[int]]:
+    """
+    Sort the header of a wide IAMC table into identifier and year columns.
+
+    Returns a dict {iamc name: original column label}, the list of year column
+    labels and the matching integer years. Any other column is ignored.
+    """
+    id_cols, year_cols, years = {}, [], []
+    for col in columns:
+        label = str(col).strip()
+        if label.lower() in IAMC_COLUMNS:
+            id_cols[label.lower()] = col
+            continue
+        match = YEAR_PATTERN.match(label)
+        if match:
+            year_cols.append(col)
+            years.append(int(match.group(1)))
+
+    missing = [c for c in IAMC_COLUMNS if c not in id_cols]
+    if missing:
+        raise ValueError(f"missing IAMC columns: {missing}")
+    if not year_cols:
+        raise ValueError("no year columns found")
+    return id_cols, year_cols, years
+
+
+def wide_to_long(wide: pd.DataFrame, id_cols: Dict[str, object], year_cols: List[object],
+                 years: List[int], value_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Convert a wide IAMC table with categorical identifiers to long format.
+
+    The year block is taken once as a 2-d array and only its non-NaN cells are
+    gathered, so no intermediate long copy of the wide table is built.
+    """
+    values = wide[year_cols].to_numpy(dtype=value_dtype)
+    rows, cols = np.nonzero(~np.isnan(values))
+
+    data = {}
+    for dim in IAMC_COLUMNS:
+        column = wide[id_cols[dim]]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype("category")
+        data[dim] = pd.Categorical.from_codes(column.cat.codes.to_numpy()[rows],
+                                              categories=column.cat.categories.astype(str))
+    data["year"] = np.asarray(years, dtype=np.int64)[cols]
+    data["value"] = values[rows, cols]
+    return pd.DataFrame(data)
+
+
+def read_iamc_file(full_path: str, value_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Read one wide IAMC file (csv or xlsx) into a long DataFrame.
+
+    Identifier columns are read as categoricals and year columns as
+    ``value_dtype``; the encoding of CSV files is sniffed once up front.
+    """
+    if full_path.endswith(".csv"):
+        encoding = sniff_encoding(full_path)
+        header = pd.read_csv(full_path, nrows=0, encoding=encoding).columns
+        id_cols, year_cols, years = split_iamc_columns(header)
+        dtype = {col: "category" for col in id_cols.values()}
+        dtype.update({col: value_dtype for col in year_cols})
+        wide = read_csv_with_fallback(
+            lambda enc: pd.read_csv(full_path, encoding=enc, dtype=dtype,
+                                    usecols=list(id_cols.values()) + year_cols),
+            encoding)
+    elif full_path.endswith(".xlsx"):
+        # Excel headers are only known once the sheet is open, so the
+        # identifiers are declared for both spellings used in our inputs
+        dtype = {name: "category" for dim in IAMC_COLUMNS for name in (dim, dim.capitalize())}
+        wide = pd.read_excel(full_path, dtype=dtype)
+        id_cols, year_cols, years = split_iamc_columns(wide.columns)
+    else:
+        raise ValueError(f"unsupported file type: {full_path}")
+
+    return wide_to_long(wide, id_cols, year_cols, years, value_dtype)
+
+
+# -------------------
+# Streaming, filtered reading
+# -------------------
+
+def compile_pattern(patterns) -> re.Pattern:
+    """
+    One regular expression for a label or list of labels with ``*``
+    wildcards, matched against the whole label as in ``pyam.IamDataFrame.filter``.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    alternatives = [re.escape(str(p)).replace(r"\*", ".*") for p in patterns]
+    return re.compile("|".join(f"(?:{a})" for a in alternatives))
+
+
+def normalise_filters(filters: Optional[dict]) -> Tuple[Dict[str, re.Pattern], Optional[set]]:
+    """Split filters into compiled label patterns per IAMC column and a set of years."""
+    patterns, years = {}, None
+    for key, value in (filters or {}).items():
+        if value is None:
+            continue
+        if key == "year":
+            years = {int(value)} if isinstance(value, (int, np.integer, str)) else {int(y) for y in value}
+        elif key in IAMC_COLUMNS:
+            patterns[key] = compile_pattern(value)
+        else:
+            raise ValueError(f"cannot filter on {key!r}, use one of {IAMC_COLUMNS + ['year']}")
+    return patterns, years
+
+
+def _filter_chunk(wide: pd.DataFrame, id_cols: Dict[str, object],
+                  patterns: Dict[str, re.Pattern]) -> pd.DataFrame:
+    """Rows of a wide chunk whose identifiers match all patterns."""
+    keep = np.ones(len(wide), dtype=bool)
+    for dim, pattern in patterns.items():
+        column = wide[id_cols[dim]]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype("category")
+        # Match each distinct label once, then look the rows up by code
+        matches = np.array([pattern.fullmatch(str(c)) is not None
+                            for c in column.cat.categories] + [False])
+        keep &= matches[column.cat.codes.to_numpy()]
+    return wide[keep]
+
+
+def _filter_chunks(chunks, id_cols: Dict[str, object], year_cols: List[object],
+                   years: List[int], patterns: Dict[str, re.Pattern],
+                   value_dtype: str) -> List[pd.DataFrame]:
+    """Long frames of the matching rows of each wide chunk."""
+    frames = []
+    for wide in chunks:
+        wide = _filter_chunk(wide, id_cols, patterns)
+        if len(wide):
+            frames.append(wide_to_long(wide, id_cols, year_cols, years, value_dtype))
+    return frames
+
+
+def _select_years(year_cols: List[object], years: List[int], wanted: set):
+    """Year columns (and years) restricted to the wanted years."""
+    kept = [(c, y) for c, y in zip(year_cols, years) if y in wanted]
+    return [c for c, _ in kept], [y for _, y in kept]
+
+
+def _iter_xlsx_chunks(full_path: str, chunksize: int):
+    """Header and row chunks of the first sheet of an xlsx file, read in read-only mode."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(full_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows))
+        yield header
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def read_iamc_filtered(full_path: str, filters: Optional[dict] = None,
+                       value_dtype: str = "float64",
+                       chunksize: int = DEFAULT_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Read the rows of one wide IAMC file (csv or xlsx) that match ``filters``.
+
+    The file is parsed ``chunksize`` rows at a time and each chunk is filtered
+    before it is converted to long format, so only matching rows are ever
+    kept; peak memory is bounded by the chunk size plus the result. Year
+    filters prune the year columns before parsing.
+
+    Parameters:
+    -----------
+    full_path : str
+        Path of the csv or xlsx file
+    filters : dict, optional
+        Labels per column, e.g. ``{"region": "World", "variable": "Capacity|*",
+        "year": [2040, 2070, 2100]}``. ``*`` is a wildcard, lists match any entry.
+    value_dtype : str, optional
+        dtype of the year columns
+    chunksize : int, optional
+        Number of rows parsed at a time
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Matching rows in long format with categorical identifiers
+    """
+    patterns, years_wanted = normalise_filters(filters)
+
+    if full_path.endswith(".csv"):
+        encoding = sniff_encoding(full_path)
+        header = pd.read_csv(full_path, nrows=0, encoding=encoding).columns
+        id_cols, year_cols, years = split_iamc_columns(header)
+        if years_wanted is not None:
+            year_cols, years = _select_years(year_cols, years, years_wanted)
+        dtype = {col: "category" for col in id_cols.values()}
+        dtype.update({col: value_dtype for col in year_cols})
+        # The chunks are filtered inside the retry, a decode error can come from any of them
+        frames = read_csv_with_fallback(
+            lambda enc: _filter_chunks(pd.read_csv(full_path, encoding=enc, dtype=dtype,
+                                                   usecols=list(id_cols.values()) + year_cols,
+                                                   chunksize=chunksize),
+                                       id_cols, year_cols, years, patterns, value_dtype),
+            encoding)
+    elif full_path.endswith(".xlsx"):
+        raw_chunks = _iter_xlsx_chunks(full_path, chunksize)
+        header = next(raw_chunks)
+        id_cols, year_cols, years = split_iamc_columns(header)
+        if years_wanted is not None:
+            year_cols, years = _select_years(year_cols, years, years_wanted)
+        positions = [header.index(c) for c in list(id_cols.values()) + year_cols]
+        columns = list(id_cols.values()) + year_cols
+
+        def _frames():
+            for rows in raw_chunks:
+                wide = pd.DataFrame([[row[i] if i < len(row) else None for i in positions]
+                                     for row in rows], columns=columns)
+                for col in year_cols:
+                    wide[col] = pd.to_numeric(wide[col], errors="coerce")
+                yield wide
+        frames = _filter_chunks(_frames(), id_cols, year_cols, years, patterns, value_dtype)
+    else:
+        raise ValueError(f"unsupported file type: {full_path}")
+
+    if not frames:
+        # Keep the long layout so that empty files concatenate like any other
+        empty = {dim: pd.Categorical([]) for dim in IAMC_COLUMNS}
+        empty.update(year=np.array([], dtype=np.int64), value=np.array([], dtype=value_dtype))
+        return pd.DataFrame(empty)
+    return concat_long(frames)
+
+
+def concat_long(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate long IAMC frames, merging the categories of each identifier once."""
+    data = {dim: pd.api.types.union_categoricals([f[dim] for f in frames])
+            for dim in IAMC_COLUMNS}
+    data["year"] = np.concatenate([f["year"].to_numpy() for f in frames])
+    data["value"] = np.concatenate([f["value"].to_numpy() for f in frames])
+    return pd.DataFrame(data)
+
+
+def long_to_pyam(long_df: pd.DataFrame) -> pyam.IamDataFrame:
+    """
+    Build a pyam.IamDataFrame from a long categorical frame.
+
+    The MultiIndex is assembled from the categorical codes directly, so the
+    identifier strings are never expanded to one Python object per row.
+    """
+    levels, codes = [], []
+    for dim in IAMC_COLUMNS:
+        cat = long_df[dim].cat
+        levels.append(pd.Index(cat.categories))
+        codes.append(cat.codes.to_numpy())
+    year_codes, year_levels = pd.factorize(long_df["year"].to_numpy(), sort=True)
+    index = pd.MultiIndex(levels=levels + [pd.Index(year_levels)],
+                          codes=codes + [year_codes],
+                          names=IAMC_COLUMNS + ["year"], verify_integrity=False)
+    return pyam.IamDataFrame(pd.Series(long_df["value"].to_numpy(), index=index, name="value"))
+
+
+# -------------------
+# Function to load and concatenate files from a directory
+# -------------------
+
+def load_and_concat_files_then_pyam(directory_path, file_types=None, *,
+                                    max_workers: Optional[int] = None,
+                                    value_dtype: str = "float64",
+                                    cache_dir: Optional[str] = None,
+                                    cache_max_bytes: int = DEFAULT_CACHE_BYTES,
+                                    filters: Optional[dict] = None,
+                                    chunksize: int = DEFAULT_CHUNK_ROWS) -> Optional[pyam.IamDataFrame]:
+    """
+    Load specified file types from a directory in parallel, concatenate them
+    in long format, then convert the result to a pyam IamDataFrame.
+
+    Parameters:
+    -----------
+    directory_path : str
+        Path to the directory containing data files
+    file_types : str or list, optional
+        Specify which file types to process: "xlsx", "csv", or ["xlsx", "csv"]
+        If None, both xlsx and csv files will be processed
+    max_workers : int, optional
+        Size of the process pool used to parse the files. Defaults to one
+        worker per file (capped at the number of CPUs); 1 reads in-process.
+    value_dtype : str, optional
+        dtype of the year columns, "float64" (default) or "float32"
+    cache_dir : str, optional
+        If given, parsed files are cached there as Arrow files and re-used
+        (memory-mapped) on later runs while the source file is unchanged
+    cache_max_bytes : int, optional
+        Size bound of the cache directory, least recently used files go first
+    filters : dict, optional
+        If given, files are streamed ``chunksize`` rows at a time and only the
+        rows matching the filters are kept, e.g. ``{"region": "World",
+        "variable": "Final Energy*", "year": range(2020, 2101, 10)}``
+        (``*`` wildcards as in pyam's ``filter``)
+    chunksize : int, optional
+        Rows parsed at a time when ``filters`` are given
+
+    Returns:
+    --------
+    pyam.IamDataFrame
+        Combined IamDataFrame from all files
+    """
+    # Set default file types if not specified
+    if file_types is None:
+        file_types = ["xlsx", "csv"]
+    elif isinstance(file_types, str):
+        file_types = [file_types]
+
+    # Get the extensions to look for
+    extensions_to_check = [VALID_EXTENSIONS[ft] for ft in file_types if ft in VALID_EXTENSIONS]
+
+    file_names = sorted(f for f in os.listdir(directory_path)
+                        if any(f.endswith(ext) for ext in extensions_to_check))
+    full_paths = [os.path.join(directory_path, f) for f in file_names]
+
+    # Filtered reads are cached separately for every set of filters
+    if filters:
+        normalise_filters(filters)  # unknown filter keys fail here, not once per file
+        variant = value_dtype + "|" + json.dumps(
+            {k: v if isinstance(v, (str, int)) else list(v)
+             for k, v in sorted(filters.items()) if v is not None}, default=str)
+        reader, reader_args = read_iamc_filtered, (filters, value_dtype, chunksize)
+    else:
+        variant = value_dtype
+        reader, reader_args = read_iamc_file, (value_dtype,)
+
+    # Serve unchanged files from the cache, parse the rest
+    cache = ParsedFileCache(cache_dir, cache_max_bytes) if cache_dir else None
+    parsed = {}
+    if cache is not None:
+        for file_name, full_path in zip(file_names, full_paths):
+            frame, record = timed_call(f"read {file_name}", cache.get, full_path, variant,
+                                       file=file_name, cached=True)
+            # A miss is logged once, by the parse below
+            if frame is not None:
+                record_stages([record])
+                parsed[file_name] = frame
+                print(f"Read {file_name} (cached)")
+    to_parse = [(f, p) for f, p in zip(file_names, full_paths) if f not in parsed]
+    # State of the sources before they are parsed, stored with their cache entries
+    states = {}
+    if cache is not None and cache.enabled:
+        states = {f: source_state(p) for f, p in to_parse}
+
+    if max_workers is None:
+        max_workers = min(len(to_parse), os.cpu_count() or 1)
+
+    if max_workers > 1 and len(to_parse) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(f, pool.submit(timed_call, f"read {f}", reader, p, *reader_args,
+                                       file=f, cached=False))
+                       for f, p in to_parse]
+            for file_name, future in futures:
+                # If there is an error, print a message and continue to the next file
+                try:
+                    parsed[file_name], record = future.result()
+                    record_stages([record])
+                    print(f"Read {file_name}")
+                except Exception as e:
+                    print(f"Error reading {file_name}: {e}")
+    else:
+        for file_name, full_path in to_parse:
+            try:
+                parsed[file_name], record = timed_call(f"read {file_name}", reader, full_path,
+                                                       *reader_args, file=file_name, cached=False)
+                record_stages([record])
+                print(f"Read {file_name}")
+            except Exception as e:
+                print(f"Error reading {file_name}: {e}")
+
+    if cache is not None:
+        for file_name, full_path in to_parse:
+            if file_name in parsed:
+                cache.put(full_path, parsed[file_name], variant=variant,
+                          state=states.get(file_name))
+
+    # List of all long pandas dataframes, in file name order
+    all_dfs = [parsed[f] for f in file_names if f in parsed]
+
+    # Concatenate all pandas dataframes
+    if not all_dfs:
+        print("No files were processed")
+        return None
+    with stage("concatenate files", files=len(all_dfs)) as st:
+        long_df = st.output(concat_long(all_dfs))
+    if long_df.empty:
+        print("No rows matched the filters")
+        return None
+    with stage("convert to pyam") as st:
+        return st.output(long_to_pyam(long_df))
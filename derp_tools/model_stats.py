@@ -0,0 +1,161 @@
+"""
+Statistics across models (mean, median, min, max, spread, quantiles) of
+every scenario, region, variable and year, computed once and looked up by
+the panels.
+
+The data is laid out as an ``IamcCube`` (model, scenario, region, variable,
+year) and every statistic is one reduction over the model axis, so batch
+runs over regions and panels read the same arrays instead of grouping the
+data again per call:
+
+    share_stats = ModelStatistics.from_data(df_share, value_col="electricity_share")
+    share_stats.get("NDC_EI_DERP2_HD", "World", years=[2040, 2070, 2100])   # mean/min/max
+    share_stats.model_values("HD_D1_RCP85_1_CDD_20_10", "World", years=[2040, 2070])
+"""
+import warnings
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.changes import as_long
+from derp_tools.cube import IamcCube
+
+# Statistics computed for every cell, besides the quantiles
+STATISTICS = ["count", "mean", "median", "min", "max", "spread"]
+
+
+def quantile_name(q: float) -> str:
+    """Name of a quantile statistic, e.g. 0.05 -> "q05"."""
+    return f"q{round(q * 100):02d}"
+
+
+class ModelStatistics:
+    """
+    Cross-model statistics of an ``IamcCube``.
+
+    ``values`` holds one array per statistic with axes (scenario, region,
+    variable, year); cells that no model reports have count 0 and NaN
+    elsewhere. The cube stays available for the per-model values.
+
+    Parameters:
+    -----------
+    cube : IamcCube
+        Data with the models to reduce over
+    quantiles : list, optional
+        Quantiles (0-1) across models, stored as ``q05``, ``q95``, ...
+    """
+
+    def __init__(self, cube: IamcCube, quantiles: Sequence[float] = (0.05, 0.95)):
+        self.cube = cube
+        self.quantiles = list(quantiles)
+        self.statistics = STATISTICS + [quantile_name(q) for q in self.quantiles]
+
+        data = cube.values
+        count = (~np.isnan(data)).sum(axis=0)
+        # All-NaN cells give NaN without the RuntimeWarnings of the nan-functions
+        if data.size == 0:
+            # No model or no cell (e.g. the region was filtered out): nothing is reported
+            quantiles = np.full((1 + len(self.quantiles),) + data.shape[1:], np.nan)
+            minimum = maximum = np.full(data.shape[1:], np.nan)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                quantiles = np.nanquantile(data, [0.5] + self.quantiles, axis=0)
+                minimum, maximum = np.nanmin(data, axis=0), np.nanmax(data, axis=0)
+        mean = np.where(count > 0, np.nansum(data, axis=0) / np.maximum(count, 1), np.nan)
+
+        self.values = {"count": count, "mean": mean, "median": quantiles[0],
+                       "min": minimum, "max": maximum, "spread": maximum - minimum}
+        for q, values in zip(self.quantiles, quantiles[1:]):
+            self.values[quantile_name(q)] = values
+
+    @classmethod
+    def from_data(cls, df, value_col: str = "value", quantiles: Sequence[float] = (0.05, 0.95),
+                  **labels) -> "ModelStatistics":
+        """
+        Statistics of a pyam.IamDataFrame or long DataFrame.
+
+        ``value_col`` names the column to reduce (e.g. ``electricity_share``);
+        a frame without a variable column is treated as the single variable
+        ``value_col``. Keyword arguments (scenario=, region=, variable=,
+        year=) restrict the cube as in ``IamcCube.from_data``.
+        """
+        data = as_long(df)
+        if value_col != "value" or "variable" not in data.columns:
+            data = data.rename(columns={value_col: "value"})
+            if "variable" not in data.columns:
+                data = data.assign(variable=value_col)
+            if "unit" not in data.columns:
+                data = data.assign(unit="")
+        return cls(IamcCube.from_data(data, **labels), quantiles)
+
+    def _cell(self, scenario, region, variable) -> Optional[Tuple[int, int, int]]:
+        variable = self._variable(variable)
+        try:
+            return (self.cube.index("scenario", scenario), self.cube.index("region", region),
+                    self.cube.index("variable", variable))
+        except KeyError:
+            return None
+
+    def _variable(self, variable):
+        if variable is None:
+            variables = self.cube.labels["variable"]
+            if len(variables) == 0:
+                return None  # empty cube, no cell is found
+            if len(variables) != 1:
+                raise ValueError(f"variable must be given, the cube holds {len(variables)}")
+            return variables[0]
+        return variable
+
+    def _year_positions(self, years) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of ``years`` on the cube's year axis and which of them exist."""
+        years = [int(y) for y in years]
+        pos = np.array([self.cube._pos["year"].get(y, -1) for y in years], dtype=int)
+        return pos, pos >= 0
+
+    def get(self, scenario, region, variable=None, years: Optional[Sequence[int]] = None,
+            statistics: Sequence[str] = ("mean", "min", "max")) -> pd.DataFrame:
+        """
+        Statistics of one (scenario, region, variable) by year.
+
+        Returns a DataFrame indexed by ``years`` (all years of the cube by
+        default) with one column per statistic, NaN where no model reports.
+        """
+        unknown = [s for s in statistics if s not in self.values]
+        if unknown:
+            raise KeyError(f"Unknown statistic(s) {unknown}, expected some of {self.statistics}")
+        years = list(self.cube.years) if years is None else [int(y) for y in years]
+        frame = pd.DataFrame(np.nan, index=pd.Index(years, name="year"), columns=list(statistics))
+        cell = self._cell(scenario, region, variable)
+        if cell is None:
+            return frame
+        pos, found = self._year_positions(years)
+        for stat in statistics:
+            frame.loc[np.array(years)[found], stat] = self.values[stat][cell][pos[found]]
+        return frame
+
+    def models(self, scenario, region, variable=None) -> List[str]:
+        """Models (sorted as in the cube) reporting any year of the cell."""
+        cell = self._cell(scenario, region, variable)
+        if cell is None:
+            return []
+        reported = ~np.isnan(self.cube.values[(slice(None),) + cell]).all(axis=1)
+        return [m for m, r in zip(self.cube.labels["model"], reported) if r]
+
+    def model_values(self, scenario, region, variable=None,
+                     years: Optional[Sequence[int]] = None) -> Tuple[List[str], np.ndarray]:
+        """
+        Models reporting the cell (see ``models``) and their values over
+        ``years``, shape (models, years), NaN where a model lacks a year.
+        """
+        years = list(self.cube.years) if years is None else [int(y) for y in years]
+        models = self.models(scenario, region, variable)
+        values = np.full((len(models), len(years)), np.nan)
+        if not models:
+            return models, values
+        cell = self._cell(scenario, region, variable)
+        rows = [self.cube.index("model", m) for m in models]
+        pos, found = self._year_positions(years)
+        values[:, found] = self.cube.values[(rows,) + cell][:, pos[found]]
+        return models, values
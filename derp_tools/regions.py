@@ -0,0 +1,183 @@
+"""
+Aggregation of model-native regions (AUS, CHI, Africa_Eastern, ...) into
+user-defined macro regions.
+
+The mapping is a table with one row per (native region, macro region) pair
+and an optional ``model`` column for model-specific region names, e.g.
+
+    model,region,macro_region
+    TIAM_Grantham,AFR,Africa
+    GCAM 7.0,Africa_Eastern,Africa
+    GCAM 7.0,Africa_Northern,Africa
+    *,USA,North America
+
+A native region may belong to several macro regions. Extensive variables are
+summed; intensive variables (prices, shares, ...) are averaged weighted by a
+chosen variable of the same model, scenario, native region and year.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import pyam
+
+from derp_tools.changes import as_long, factorize_columns
+from derp_tools.fingerprint import fingerprint
+from derp_tools.loading import compile_pattern
+
+# Columns of a region mapping table
+MAPPING_COLUMNS = ["model", "region", "macro_region"]
+
+# Identifier columns of an aggregated data point
+OUTPUT_COLUMNS = ["model", "scenario", "macro_region", "variable", "unit", "year"]
+
+
+def read_region_mapping(mapping) -> pd.DataFrame:
+    """
+    Region mapping as a DataFrame with columns model, region and macro_region.
+
+    ``mapping`` is a path to a csv/xlsx file, a DataFrame, or a dict
+    {macro region: [native regions]}. A missing or ``*`` model applies the
+    row to every model.
+    """
+    if isinstance(mapping, str):
+        mapping = pd.read_excel(mapping) if mapping.endswith(".xlsx") else pd.read_csv(mapping)
+    elif isinstance(mapping, dict):
+        mapping = pd.DataFrame([(macro, native) for macro, natives in mapping.items()
+                                for native in natives], columns=["macro_region", "region"])
+
+    mapping = mapping.rename(columns=str.lower)
+    missing = [c for c in ["region", "macro_region"] if c not in mapping.columns]
+    if missing:
+        raise KeyError(f"region mapping is missing column(s): {missing}")
+    if "model" not in mapping.columns:
+        mapping["model"] = "*"
+    mapping["model"] = mapping["model"].fillna("*")
+    return mapping[MAPPING_COLUMNS].drop_duplicates().reset_index(drop=True)
+
+
+class RegionAggregator:
+    """
+    Aggregate native regions to macro regions in one grouped reduction.
+
+    Parameters:
+    -----------
+    mapping : str, pandas.DataFrame or dict
+        Region mapping, see ``read_region_mapping``
+    weights : dict, optional
+        {intensive variable: weight variable}, e.g.
+        ``{"Price|Carbon": "Emissions|CO2"}``. Keys may use ``*`` wildcards.
+        All other variables are treated as extensive and summed.
+    cache_size : int, optional
+        Number of aggregated results kept in memory, keyed by a fingerprint
+        of the input data, mapping and weights
+    """
+
+    def __init__(self, mapping, weights: Optional[Dict[str, str]] = None,
+                 cache_size: int = 8):
+        self.mapping = read_region_mapping(mapping)
+        self.weights = dict(weights or {})
+        self._patterns = [(compile_pattern(k), v) for k, v in self.weights.items()]
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _weight_variable(self, variable: str) -> Optional[str]:
+        for pattern, weight in self._patterns:
+            if pattern.fullmatch(variable):
+                return weight
+        return None
+
+    def _expand(self, data: pd.DataFrame) -> pd.DataFrame:
+        """One row per (data row, macro region it belongs to)."""
+        generic = self.mapping[self.mapping["model"] == "*"].drop(columns="model")
+        specific = self.mapping[self.mapping["model"] != "*"]
+        parts = []
+        if len(generic):
+            parts.append(data.merge(generic, on="region", how="inner"))
+        if len(specific):
+            parts.append(data.merge(specific, on=["model", "region"], how="inner"))
+        if not parts:
+            return data.iloc[:0].assign(macro_region=pd.Series(dtype=object))
+        # A row matched by a generic and a model-specific entry counts once
+        return pd.concat(parts, ignore_index=True).drop_duplicates(
+            subset=["model", "scenario", "region", "variable", "unit", "year", "macro_region"])
+
+    def _aggregate(self, data: pd.DataFrame) -> pd.DataFrame:
+        data = data[["model", "scenario", "region", "variable", "unit", "year", "value"]]
+
+        # Weight of every row: 1 for extensive variables, the weight
+        # variable's value at the same native point for intensive ones
+        variables = pd.Index(data["variable"].unique())
+        weight_of = pd.Series([self._weight_variable(v) for v in variables], index=variables)
+        row_weight_var = data["variable"].map(weight_of)
+        intensive = row_weight_var.notna().to_numpy()
+
+        weight = np.ones(len(data))
+        if intensive.any():
+            point_codes, _ = factorize_columns(data, ["model", "scenario", "region", "year"])
+            weight_vars = pd.Index(weight_of.dropna().unique())
+            wpos = weight_vars.get_indexer(data["variable"])
+            table = np.full((len(weight_vars), point_codes.max() + 1), np.nan)
+            is_w = wpos >= 0
+            table[wpos[is_w], point_codes[is_w]] = data["value"].to_numpy()[is_w]
+            weight[intensive] = table[weight_vars.get_indexer(row_weight_var[intensive]),
+                                      point_codes[intensive]]
+
+        data = data.assign(_weight=weight, _intensive=intensive)
+        data = data[~np.isnan(data["_weight"].to_numpy()) & ~np.isnan(data["value"].to_numpy())]
+        expanded = self._expand(data)
+        if expanded.empty:
+            return pd.DataFrame(columns=OUTPUT_COLUMNS + ["value"])
+
+        # One grouped reduction over all variables, years and macro regions
+        codes, first_rows = factorize_columns(expanded, OUTPUT_COLUMNS)
+        w = expanded["_weight"].to_numpy()
+        numerator = np.bincount(codes, weights=expanded["value"].to_numpy() * w)
+        denominator = np.bincount(codes, weights=w)
+        group_intensive = expanded["_intensive"].to_numpy()[first_rows]
+
+        value = numerator.copy()
+        np.divide(numerator, denominator, out=value,
+                  where=group_intensive & (denominator != 0))
+        value[group_intensive & (denominator == 0)] = np.nan
+
+        result = expanded[OUTPUT_COLUMNS].iloc[first_rows].reset_index(drop=True)
+        result["value"] = value
+        return result
+
+    def aggregate(self, df, *, append: bool = False) -> Optional[pyam.IamDataFrame]:
+        """
+        Macro-region data of ``df`` as a pyam.IamDataFrame.
+
+        Parameters:
+        -----------
+        df : pyam.IamDataFrame or pandas.DataFrame
+            Data in long format with native regions
+        append : bool, optional
+            Return the native data together with the macro regions
+
+        Returns:
+        --------
+        pyam.IamDataFrame
+            Aggregated data with the macro regions in the ``region`` column,
+            or None if no region of ``df`` is in the mapping
+        """
+        key = fingerprint(df, self.mapping, self.weights)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            result = self._cache[key]
+        else:
+            result = self._aggregate(as_long(df))
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        if result.empty:
+            print("No region of the data is in the region mapping")
+            return None
+        aggregated = pyam.IamDataFrame(result.rename(columns={"macro_region": "region"}))
+        if append:
+            native = df if isinstance(df, pyam.IamDataFrame) else pyam.IamDataFrame(df)
+            return pyam.concat([native, aggregated])
+        return aggregated
@@ -0,0 +1,90 @@
+"""
+Pre-grouped index over a long table (e.g. the output of
+``compute_baseline_changes``) for panels that pull one small series per
+(region, variable, scenario, model).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from derp_tools.changes import as_long, factorize_columns
+
+# Grouping of the index, outermost first
+INDEX_KEYS = ["region", "variable", "scenario", "model"]
+
+
+class SeriesIndex:
+    """
+    Rows of a long table grouped by (region, variable, scenario, model) and
+    sorted by year within each group.
+
+    The table is scanned and sorted once; every group is then a contiguous
+    slice of the year and value arrays, found in O(1) through a dict.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Long data with region, variable, scenario, model and year columns
+    value_col : str, optional
+        Column whose values are indexed, e.g. ``percentage_change``
+    """
+
+    def __init__(self, df, value_col: str = "percentage_change"):
+        data = as_long(df)
+        codes, first_rows = factorize_columns(data, INDEX_KEYS)
+        year = data["year"].to_numpy()
+
+        # One stable sort by group, then year
+        order = np.lexsort((year, codes))
+        sorted_codes = codes[order]
+        self.years = year[order]
+        self.values = data[value_col].to_numpy()[order]
+
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        stops = np.r_[starts[1:], len(order)]
+        labels = data[INDEX_KEYS].iloc[first_rows[sorted_codes[starts]]].itertuples(index=False, name=None)
+        self._slices: Dict[tuple, slice] = {key: slice(a, b) for key, a, b in zip(labels, starts, stops)}
+
+        # Models present per (region, variable, scenario), for the panel loops
+        self._models: Dict[tuple, List[str]] = {}
+        for region, variable, scenario, model in self._slices:
+            self._models.setdefault((region, variable, scenario), []).append(model)
+
+    def series(self, region, variable, scenario, model,
+               years: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Years and values of one group, sorted by year (views unless ``years``
+        restricts them). Empty arrays if the group does not exist.
+        """
+        sl = self._slices.get((region, variable, scenario, model))
+        if sl is None:
+            return self.years[:0], self.values[:0]
+        ys, vals = self.years[sl], self.values[sl]
+        if years is not None:
+            keep = np.isin(ys, years)
+            ys, vals = ys[keep], vals[keep]
+        return ys, vals
+
+    def value(self, region, variable, scenario, model, year) -> Optional[float]:
+        """Value of one group in one year (first row if repeated), or None."""
+        ys, vals = self.series(region, variable, scenario, model)
+        pos = np.searchsorted(ys, year)
+        if pos < len(ys) and ys[pos] == year:
+            return vals[pos]
+        return None
+
+    def models(self, region, variable, scenario,
+               years: Optional[Sequence[int]] = None) -> List[str]:
+        """Sorted models with rows for (region, variable, scenario), in ``years`` if given."""
+        models = self._models.get((region, variable, scenario), [])
+        if years is not None:
+            models = [m for m in models
+                      if len(self.series(region, variable, scenario, m, years)[0])]
+        return sorted(models)
+
+    def has_any(self, region, variables: Sequence[str],
+                years: Optional[Sequence[int]] = None, exclude_scenarios: Sequence[str] = ()) -> bool:
+        """True if the region has rows for any of ``variables`` (in ``years``) outside ``exclude_scenarios``."""
+        return any(self.models(r, v, s, years)
+                   for (r, v, s) in self._models
+                   if r == region and v in variables and s not in exclude_scenarios)
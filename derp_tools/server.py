@@ -0,0 +1,399 @@
+"""
+Local query server: loads the IAMC data once and answers slice, baseline
+change and share queries, and renders single panels, over HTTP on localhost.
+
+Several analysts (or notebooks) can then share one warm process instead of
+each reloading the data. Built on asyncio only; requests are answered one at
+a time by a worker thread (pandas and matplotlib are not thread-safe), and
+recent responses are kept in an LRU cache.
+
+    python -m derp_tools.server --data "H&D/Additional Results/data" \\
+        --file-types csv --baseline NDC_EI_DERP2_HD
+
+With ``--percentile-table`` and ``--var-dict`` (e.g. the dashboard config
+``frida_uncertainties.json``) the polar panel draws the FRIDA percentiles.
+
+Endpoints (GET, labels repeated for several values, ``*`` wildcards allowed):
+
+    /meta                                           labels of every dimension
+    /filter?model=*FRIDA*&variable=Capacity|*&year=2050
+    /delta?scenario=HD_ER_RCP85_1_CDD_20_10&region=World[&baseline=...]
+    /share?numerator=Final Energy|Electricity&denominator=Final Energy&region=World
+    /panel/total_capacity?region=World              PNG
+    /panel/polar?region=World&year=2050&variable=Capacity|Coal&variable=...   PNG
+
+Tables are returned as JSON (``{"columns": [...], "data": [[...], ...]}``)
+or, with ``format=arrow``, as an Arrow IPC stream (needs pyarrow). Unknown
+parameters are answered with 400 and the list of the endpoint's parameters.
+"""
+import argparse
+import asyncio
+import fnmatch
+import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+from derp_tools.shares import compute_share, slice_share
+from derp_tools.store import STORE_COLUMNS, CompactStore
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 128
+
+# Dimensions a query can filter on
+QUERY_COLUMNS = STORE_COLUMNS + ["year"]
+
+# Parameters of each endpoint; any other parameter is answered with 400
+ENDPOINT_PARAMETERS = {
+    "/meta": [],
+    "/filter": QUERY_COLUMNS + ["format"],
+    "/delta": QUERY_COLUMNS + ["format", "baseline"],
+    # The share is one variable per (model, scenario, region, year)
+    "/share": ["model", "scenario", "region", "year", "format", "numerator", "denominator"],
+    "/panel/total_capacity": ["model", "scenario", "region", "variable"],
+    "/panel/polar": ["model", "scenario", "region", "variable", "year", "baseline"],
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+Response = Tuple[int, str, bytes]
+
+
+class QueryError(ValueError):
+    """A query that cannot be answered (reported to the client as 400)."""
+
+
+def _json_response(obj, status: int = 200) -> Response:
+    return status, "application/json", json.dumps(obj, default=str).encode()
+
+
+class QueryServer:
+    """
+    In-memory data and the query handlers of the server.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame
+        Data, loaded once
+    baseline : str, optional
+        Default baseline scenario of ``/delta`` and the polar panel
+    frida_unc_data : UncertaintyBands, optional
+        FRIDA percentile bands, drawn on the total capacity panel
+    perc_unc_table : PercentileTable, optional
+        FRIDA percentile differences, drawn on the polar panel
+    var_dict : dict, optional
+        Polar panel labels -> variables of ``perc_unc_table`` (the
+        ``var_dict`` of the dashboards); without it the percentiles are
+        not drawn
+    cache_size : int, optional
+        Number of responses kept in the LRU cache
+    """
+
+    def __init__(self, df, *, baseline: Optional[str] = None, frida_unc_data=None,
+                 perc_unc_table=None, var_dict: Optional[Dict[str, str]] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.df = df
+        self.store = CompactStore.from_data(df)
+        self.baseline = baseline
+        self.frida_unc_data = frida_unc_data
+        self.perc_unc_table = perc_unc_table
+        self.var_dict = dict(var_dict or {})
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, Response]" = OrderedDict()
+        self._changes = {}   # baseline -> ChangesView
+        self._shares = {}    # (numerator, denominator) -> compute_share result
+        self.hits = self.misses = 0
+        self.routes = {
+            "/meta": self.meta,
+            "/filter": self.filter,
+            "/delta": self.delta,
+            "/share": self.share,
+            "/panel/total_capacity": self.panel_total_capacity,
+            "/panel/polar": self.panel_polar,
+        }
+
+    # -------------------
+    # Query helpers
+    # -------------------
+
+    def _labels(self, column: str, patterns: List[str]) -> List[object]:
+        """Labels of ``column`` matching ``patterns`` (exact or with * wildcards)."""
+        if column == "year":
+            try:
+                return [int(y) for y in patterns]
+            except ValueError:
+                raise QueryError(f"year must be an integer, got {patterns}") from None
+        labels = self.store.labels[column]
+        matched = []
+        for pattern in patterns:
+            if any(c in pattern for c in "*?["):
+                matched.extend(fnmatch.filter(labels.astype(str), pattern))
+            elif pattern in labels:
+                matched.append(pattern)
+        return list(dict.fromkeys(matched))
+
+    def _selection(self, params: Dict[str, List[str]]) -> Dict[str, List[object]]:
+        return {column: self._labels(column, params[column])
+                for column in QUERY_COLUMNS if column in params}
+
+    def _rows(self, params) -> np.ndarray:
+        return np.flatnonzero(self.store.mask(**self._selection(params)))
+
+    def _changes_view(self, baseline: Optional[str]):
+        baseline = baseline or self.baseline
+        if baseline is None:
+            raise QueryError("no baseline: pass baseline= or start the server with --baseline")
+        if baseline not in self.store.labels["scenario"]:
+            raise QueryError(f"baseline scenario {baseline!r} not in the data")
+        if baseline not in self._changes:
+            self._changes[baseline] = self.store.changes(baseline)
+        return self._changes[baseline]
+
+    @staticmethod
+    def _table(frame: pd.DataFrame, params) -> Response:
+        fmt = params.get("format", ["json"])[0]
+        if fmt == "arrow":
+            if pa is None:
+                raise QueryError("format=arrow needs pyarrow on the server")
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return 200, "application/vnd.apache.arrow.stream", sink.getvalue().to_pybytes()
+        if fmt != "json":
+            raise QueryError(f"format must be 'json' or 'arrow', not {fmt!r}")
+        return 200, "application/json", frame.to_json(orient="split", index=False).encode()
+
+    # -------------------
+    # Endpoints
+    # -------------------
+
+    def meta(self, params) -> Response:
+        labels = {c: self.store.labels[c].astype(str).tolist() for c in STORE_COLUMNS}
+        labels["year"] = sorted(int(y) for y in np.unique(self.store.year))
+        return _json_response({"rows": len(self.store), "baseline": self.baseline,
+                               "labels": labels,
+                               "cache": {"size": len(self._cache), "max": self.cache_size,
+                                         "hits": self.hits, "misses": self.misses}})
+
+    def filter(self, params) -> Response:
+        return self._table(self.store.to_frame(self._rows(params)), params)
+
+    def delta(self, params) -> Response:
+        view = self._changes_view(params.get("baseline", [None])[0])
+        return self._table(view.to_frame(self._rows(params)), params)
+
+    def share(self, params) -> Response:
+        numerator = params.get("numerator", ["Final Energy|Electricity"])[0]
+        denominator = params.get("denominator", ["Final Energy"])[0]
+        key = (numerator, denominator)
+        if key not in self._shares:
+            self._shares[key] = compute_share(self.df, numerator, denominator)
+        share = slice_share(self._shares[key], **self._selection(params))
+        return self._table(share.reset_index(), params)
+
+    def _render(self, draw, projection=None, figsize=(10, 5)) -> Response:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=figsize)
+        ax = fig.add_subplot(projection=projection)
+        try:
+            draw(ax)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+        finally:
+            plt.close(fig)
+        return 200, "image/png", buffer.getvalue()
+
+    def _panel_labels(self, params, column: str) -> List[str]:
+        if column in params:
+            return self._labels(column, params[column])
+        return self.store.labels[column].astype(str).tolist()
+
+    @staticmethod
+    def _colours(scenarios) -> Dict[str, str]:
+        palette = ["#1b9e77", "#d95f02", "#7570b3", "#e7298a", "#66a61e", "#e6ab02"]
+        return {s: palette[i % len(palette)] for i, s in enumerate(scenarios)}
+
+    def panel_total_capacity(self, params) -> Response:
+        from derp_tools.dashboard import plot_total_capacity_ax
+
+        region = params.get("region", ["World"])[0]
+        variable = params.get("variable", ["Capacity|Electricity"])[0]
+        models = self._panel_labels(params, "model")
+        scenarios = self._panel_labels(params, "scenario")
+        frida_unc = self.frida_unc_data is not None and "FRIDAv2.1" in models
+        return self._render(lambda ax: plot_total_capacity_ax(
+            self.df, ax=ax, region=region, models=models, scenarios=scenarios,
+            all_vars={}, colours=self._colours(scenarios), frida_unc=frida_unc,
+            frida_unc_data=self.frida_unc_data, variable=variable))
+
+    def panel_polar(self, params) -> Response:
+        from derp_tools.dashboard import _model_markers, plot_single_polar_ax
+
+        if "year" not in params or "variable" not in params:
+            raise QueryError("the polar panel needs year= and variable=")
+        view = self._changes_view(params.get("baseline", [None])[0])
+        region = params.get("region", ["World"])[0]
+        year = self._labels("year", params["year"][:1])[0]
+        variables = self._labels("variable", params["variable"])
+        models = self._panel_labels(params, "model")
+        scenarios = [s for s in self._panel_labels(params, "scenario") if s != view.baseline]
+        frida_unc = (self.perc_unc_table is not None and bool(self.var_dict)
+                     and "FRIDAv2.1" in models)
+        # The percentile table is keyed by the configured FRIDA variables;
+        # without them the axes are labelled after the requested variables
+        var_dict = self.var_dict or {v.split("|")[-1]: v for v in variables}
+        return self._render(lambda ax: plot_single_polar_ax(
+            view, ax=ax, region=region, year=year, variables=variables, models=models,
+            scenarios=scenarios, all_vars={}, colours=self._colours(scenarios),
+            m_mark=_model_markers(models), frida_unc=frida_unc, frida_unc_data=self.frida_unc_data,
+            var_dict=var_dict, perc_unc_table=self.perc_unc_table),
+            projection="polar", figsize=(6, 6))
+
+    # -------------------
+    # Dispatch and cache
+    # -------------------
+
+    def cached(self, path: str, params: Dict[str, List[str]]) -> Tuple[Optional[Response], tuple]:
+        """Cached response of a query (None if not cached) and its cache key."""
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        response = self._cache.get(key)
+        if response is not None:
+            self._cache.move_to_end(key)
+        return response, key
+
+    def handle(self, path: str, params: Dict[str, List[str]]) -> Response:
+        """Answer one query (runs in the worker thread)."""
+        handler = self.routes.get(path)
+        if handler is None:
+            return _json_response({"error": f"unknown path {path}",
+                                   "paths": sorted(self.routes)}, status=404)
+        # A misspelt filter (e.g. regoin=) would otherwise return the whole table
+        unknown = [k for k in params if k not in ENDPOINT_PARAMETERS[path]]
+        if unknown:
+            return _json_response({"error": f"unknown parameter(s) for {path}: {unknown}",
+                                   "parameters": ENDPOINT_PARAMETERS[path]}, status=400)
+        try:
+            return handler(params)
+        except (QueryError, KeyError, ValueError) as e:
+            return _json_response({"error": str(e)}, status=400)
+
+    def remember(self, key: tuple, response: Response):
+        # /meta reports the cache itself, so it is never cached
+        if response[0] != 200 or key[0] == "/meta":
+            return
+        self._cache[key] = response
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # -------------------
+    # HTTP
+    # -------------------
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass    # headers are not used
+            if len(request_line) < 2:
+                return
+            method, target = request_line[0], request_line[1]
+            if method not in ("GET", "HEAD"):
+                response = _json_response({"error": "only GET is supported"}, status=405)
+                cache_state = "none"
+            else:
+                url = urlsplit(target)
+                params = parse_qs(url.query)
+                response, key = self.cached(url.path, params)
+                if response is not None:
+                    self.hits += 1
+                    cache_state = "hit"
+                else:
+                    self.misses += 1
+                    cache_state = "miss"
+                    loop = asyncio.get_running_loop()
+                    response = await loop.run_in_executor(self._executor, self.handle, url.path, params)
+                    self.remember(key, response)
+
+            status, content_type, body = response
+            head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"X-Cache: {cache_state}\r\n"
+                    "Connection: close\r\n\r\n")
+            writer.write(head.encode("latin-1") + (b"" if method == "HEAD" else body))
+            await writer.drain()
+        except Exception as e:  # never let one request stop the server
+            print(f"Warning: request failed: {e!r}")
+            writer.write(b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\n"
+                         b"Connection: close\r\n\r\n")
+        finally:
+            writer.close()
+
+    async def serve(self, port: int = DEFAULT_PORT):
+        """Serve on localhost until cancelled."""
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        server = await asyncio.start_server(self._client, HOST, port)
+        print(f"Serving {len(self.store)} rows on http://{HOST}:{port}/ (paths: {sorted(self.routes)})")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", required=True, help="directory with the IAMC files")
+    parser.add_argument("--file-types", nargs="+", default=None, choices=["csv", "xlsx"])
+    parser.add_argument("--cache-dir", default=None, help="cache of parsed input files")
+    parser.add_argument("--baseline", default=None, help="default baseline scenario")
+    parser.add_argument("--uncertainty-dir", default=None, help="FRIDA percentile files")
+    parser.add_argument("--percentile-table", default=None, help="FRIDA percentile differences csv")
+    parser.add_argument("--var-dict", default=None,
+                        help="JSON file mapping polar panel labels to the FRIDA variables of the "
+                             "percentile table, or a derp_tools config holding it as 'var_dict'")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"responses kept in the LRU cache (default {DEFAULT_CACHE_SIZE})")
+    args = parser.parse_args(argv)
+
+    from derp_tools.frida import PercentileTable, UncertaintyBands
+    from derp_tools.loading import load_and_concat_files_then_pyam
+
+    var_dict = None
+    if args.var_dict:
+        with open(args.var_dict) as f:
+            var_dict = json.load(f)
+        var_dict = var_dict.get("var_dict", var_dict)
+        if not all(isinstance(v, str) for v in var_dict.values()):
+            parser.error(f"{args.var_dict} is not a mapping of labels to variables")
+
+    df = load_and_concat_files_then_pyam(args.data, file_types=args.file_types,
+                                         cache_dir=args.cache_dir)
+    if df is None:
+        parser.error(f"no data in {args.data}")
+    server = QueryServer(
+        df, baseline=args.baseline, cache_size=args.cache_size, var_dict=var_dict,
+        frida_unc_data=UncertaintyBands(args.uncertainty_dir) if args.uncertainty_dir else None,
+        perc_unc_table=PercentileTable.from_csv(args.percentile_table) if args.percentile_table else None)
+    try:
+        asyncio.run(server.serve(args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Shares of IAMC variables in a total (e.g. electricity in final energy).
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from derp_tools.changes import as_long, factorize_columns
+
+# Columns that identify one data point of a variable
+POINT_COLUMNS = ["model", "scenario", "region", "year"]
+
+
+def parent_variable(variable: str) -> str:
+    """Parent of an IAMC variable, e.g. ``Final Energy`` for ``Final Energy|Electricity``."""
+    if "|" not in variable:
+        raise ValueError(f"variable {variable!r} has no parent")
+    return variable.rsplit("|", 1)[0]
+
+
+# -------------------
+# Function to compute shares
+# -------------------
+
+def compute_share(df, numerator: Union[str, List[str]],
+                  denominator: Union[None, str, Dict[str, str]] = None,
+                  percent: bool = True, values: bool = False) -> pd.DataFrame:
+    """
+    Share of one or more variables in a denominator variable, for every
+    model, scenario, region and year at once.
+
+    All variables involved are scattered onto one aligned
+    (variable, model/scenario/region/year) array and divided in a single
+    vectorised step. Zero denominators are masked and give NaN instead of inf.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Data in long format (model, scenario, region, variable, unit, year, value)
+    numerator : str or list
+        Variable(s) whose share is computed
+    denominator : str or dict, optional
+        Denominator used for every numerator, or a dict {numerator: denominator}.
+        If None, each numerator is divided by its parent variable.
+    percent : bool, optional
+        Return shares in % (default) rather than as fractions
+    values : bool, optional
+        Also return the numerator and denominator values, as one column
+        ``"<variable> value"`` per variable involved
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One column per numerator, indexed by a sorted (model, scenario, region,
+        year) MultiIndex with a row for every point where at least one
+        numerator and its denominator are both reported (the share columns
+        first, then the value columns if ``values``). Use ``slice_share``
+        (or ``.loc``) to select regions, scenarios or years.
+    """
+    numerators = [numerator] if isinstance(numerator, str) else list(dict.fromkeys(numerator))
+    if denominator is None:
+        denominators = [parent_variable(v) for v in numerators]
+    elif isinstance(denominator, str):
+        denominators = [denominator] * len(numerators)
+    else:
+        denominators = [denominator[v] for v in numerators]
+
+    data = as_long(df)
+    variables = pd.Index(list(dict.fromkeys(numerators + denominators)))
+    var_pos = variables.get_indexer(data["variable"])
+    data, var_pos = data[var_pos >= 0], var_pos[var_pos >= 0]
+
+    point_codes, first_rows = factorize_columns(data, POINT_COLUMNS)
+    aligned = np.full((len(variables), len(first_rows)), np.nan)
+    aligned[var_pos, point_codes] = data["value"].to_numpy()
+
+    num = aligned[variables.get_indexer(numerators)]
+    den = aligned[variables.get_indexer(denominators)]
+    reported = ~np.isnan(num) & ~np.isnan(den)
+
+    share = np.full_like(num, np.nan)
+    np.divide(num, den, out=share, where=reported & (den != 0))
+    if percent:
+        share *= 100
+
+    keep = reported.any(axis=0)
+    index = pd.MultiIndex.from_frame(data[POINT_COLUMNS].iloc[first_rows[keep]])
+    result = pd.DataFrame(share[:, keep].T, index=index, columns=numerators)
+    if values:
+        for i, variable in enumerate(variables):
+            result[f"{variable} value"] = aligned[i, keep]
+    return result.sort_index()
+
+
+def slice_share(share: pd.DataFrame, **levels) -> pd.DataFrame:
+    """
+    Rows of a ``compute_share`` result matching the given index levels.
+
+    E.g. ``slice_share(share, region="World", year=[2040, 2070, 2100])``;
+    each keyword takes one label or a list of labels.
+    """
+    mask = np.ones(len(share), dtype=bool)
+    for level, labels in levels.items():
+        if labels is None:
+            continue
+        if isinstance(labels, (str, int, np.integer)):
+            labels = [labels]
+        mask &= share.index.get_level_values(level).isin(labels)
+    return share[mask]
@@ -0,0 +1,229 @@
+"""
+Compact in-memory store of IAMC long data: dictionary-encoded identifiers
+and one contiguous value array, with baseline changes computed on access.
+
+A pandas long frame with object identifiers costs one Python string
+reference per identifier per row, and ``compute_baseline_changes`` adds
+three more float columns. Here every identifier is a small integer code
+(int8/int16/int32, depending on the number of labels) into a label index,
+years are int16, and the baseline changes keep only the baseline of each
+(model, region, variable) series; ``baseline_value``, ``delta`` and
+``percentage_change`` are derived when asked for, for the selected rows only:
+
+    store = CompactStore.from_data(df)
+    changes = store.changes("NDC_EI_DERP2_HD")
+    changes.select(region="World", year=2050, variable=p_vars)   # small DataFrame
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyam
+
+from derp_tools.changes import SERIES_COLUMNS
+
+# Identifier columns of the store, in order
+STORE_COLUMNS = ["model", "scenario", "region", "variable", "unit"]
+
+# Columns derived by a ChangesView
+CHANGE_COLUMNS = ["baseline_value", "delta", "percentage_change"]
+
+
+def code_dtype(n_labels: int) -> np.dtype:
+    """Smallest signed integer type holding codes 0..n_labels-1 and -1."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_labels < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _as_labels(value) -> List[object]:
+    if isinstance(value, (str, int, np.integer)):
+        return [value]
+    return list(value)
+
+
+class CompactStore:
+    """
+    IAMC long data as integer codes plus label indexes.
+
+    Attributes:
+    -----------
+    codes : dict
+        {identifier column: integer code per row}
+    labels : dict
+        {identifier column: pandas.Index of its labels}
+    year : numpy.ndarray
+        Year of every row (int16)
+    value : numpy.ndarray
+        Value of every row
+    """
+
+    def __init__(self, codes: Dict[str, np.ndarray], labels: Dict[str, pd.Index],
+                 year: np.ndarray, value: np.ndarray):
+        self.codes = codes
+        self.labels = labels
+        self.year = year
+        self.value = value
+
+    @classmethod
+    def from_data(cls, df, value_dtype: str = "float64") -> "CompactStore":
+        """
+        Build the store from a pyam.IamDataFrame or long DataFrame.
+
+        The codes of a pyam.IamDataFrame are taken from its index and those of
+        categorical columns from the categories, so identifiers are never
+        expanded to strings.
+        """
+        codes, labels = {}, {}
+        if isinstance(df, pyam.IamDataFrame):
+            index = df._data.index
+            for column in STORE_COLUMNS:
+                level = index.names.index(column)
+                labels[column] = index.levels[level]
+                codes[column] = index.codes[level]
+            year = index.levels[index.names.index("year")].to_numpy()[
+                index.codes[index.names.index("year")]]
+            value = df._data.to_numpy()
+        else:
+            for column in STORE_COLUMNS:
+                data = df[column]
+                if isinstance(data.dtype, pd.CategoricalDtype):
+                    labels[column] = data.cat.categories
+                    codes[column] = data.cat.codes.to_numpy()
+                else:
+                    codes[column], labels[column] = pd.factorize(data)
+            year, value = df["year"].to_numpy(), df["value"].to_numpy()
+
+        codes = {c: codes[c].astype(code_dtype(len(labels[c])), copy=False) for c in STORE_COLUMNS}
+        labels = {c: pd.Index(labels[c]) for c in STORE_COLUMNS}
+        return cls(codes, labels, np.asarray(year, dtype=np.int16),
+                   np.ascontiguousarray(value, dtype=value_dtype))
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def memory_usage(self, index: bool = True) -> int:
+        """Bytes held by the codes, labels, years and values."""
+        total = self.year.nbytes + self.value.nbytes
+        total += sum(c.nbytes for c in self.codes.values())
+        total += sum(l.memory_usage(deep=True) for l in self.labels.values())
+        return int(total)
+
+    def mask(self, **labels) -> np.ndarray:
+        """
+        Rows matching the given labels, e.g. ``mask(region="World", year=[2040, 2050])``.
+
+        Labels are translated to codes once, so the comparison is on integers.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        for column, value in labels.items():
+            if value is None:
+                continue
+            if column == "year":
+                keep &= np.isin(self.year, [int(y) for y in _as_labels(value)])
+            elif column in self.codes:
+                wanted = self.labels[column].get_indexer(_as_labels(value))
+                keep &= np.isin(self.codes[column], wanted[wanted >= 0])
+            else:
+                raise KeyError(f"Unknown column {column!r}, expected one of {STORE_COLUMNS + ['year']}")
+        return keep
+
+    def to_frame(self, rows: Optional[np.ndarray] = None, categorical: bool = False) -> pd.DataFrame:
+        """
+        Long DataFrame of ``rows`` (a boolean mask or positions; all rows if None).
+
+        Identifiers are categorical with ``categorical=True``, otherwise
+        plain labels (only expanded for the rows asked for).
+        """
+        take = slice(None) if rows is None else rows
+        data = {}
+        for column in STORE_COLUMNS:
+            codes = self.codes[column][take]
+            if categorical:
+                data[column] = pd.Categorical.from_codes(codes, categories=self.labels[column])
+            else:
+                data[column] = self.labels[column].to_numpy()[codes]
+        data["year"] = self.year[take].astype(np.int64)
+        data["value"] = self.value[take]
+        return pd.DataFrame(data)
+
+    def series_codes(self):
+        """Code of every row's (model, region, variable) series and the number of series."""
+        combined = np.zeros(len(self), dtype=np.int64)
+        for column in SERIES_COLUMNS:
+            combined = combined * len(self.labels[column]) + self.codes[column]
+        codes, uniques = pd.factorize(combined)
+        return codes.astype(code_dtype(len(uniques)), copy=False), len(uniques)
+
+    def changes(self, baseline: str) -> "ChangesView":
+        """Changes relative to ``baseline``, computed on access (see ``ChangesView``)."""
+        return ChangesView(self, baseline)
+
+
+class ChangesView:
+    """
+    Baseline values, absolute and percentage changes of a ``CompactStore``.
+
+    Only the baseline of every (model, region, variable) series and year is
+    stored; the change columns of ``compute_baseline_changes`` are derived
+    on access, and ``select`` derives them for the selected rows only.
+    Missing and zero baselines give NaN percentage changes.
+    """
+
+    def __init__(self, store: CompactStore, baseline: str):
+        self.store = store
+        self.baseline = baseline
+        if baseline not in self.store.labels["scenario"]:
+            print(f"Warning: baseline scenario(s) not in data: {[baseline]}")
+
+        self.series, n_series = store.series_codes()
+        year_codes, self.years = pd.factorize(store.year, sort=True)
+        self.year_codes = year_codes.astype(code_dtype(len(self.years)), copy=False)
+
+        self.stack = np.full((n_series, len(self.years)), np.nan, dtype=store.value.dtype)
+        rows = store.mask(scenario=baseline)
+        self.stack[self.series[rows], self.year_codes[rows]] = store.value[rows]
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def memory_usage(self, index: bool = True) -> int:
+        """Bytes held by the store and the baseline array."""
+        return int(self.store.memory_usage() + self.series.nbytes +
+                   self.year_codes.nbytes + self.stack.nbytes)
+
+    def derived(self, rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """``baseline_value``, ``delta`` and ``percentage_change`` of ``rows``."""
+        take = slice(None) if rows is None else rows
+        baseline_value = self.stack[self.series[take], self.year_codes[take]]
+        delta = self.store.value[take] - baseline_value
+        defined = ~np.isnan(baseline_value) & (baseline_value != 0)
+        percentage_change = np.full_like(delta, np.nan)
+        np.divide(delta, baseline_value, out=percentage_change, where=defined)
+        percentage_change *= 100
+        return {"baseline_value": baseline_value, "delta": delta,
+                "percentage_change": percentage_change}
+
+    @property
+    def baseline_value(self) -> np.ndarray:
+        return self.derived()["baseline_value"]
+
+    @property
+    def delta(self) -> np.ndarray:
+        return self.derived()["delta"]
+
+    @property
+    def percentage_change(self) -> np.ndarray:
+        return self.derived()["percentage_change"]
+
+    def to_frame(self, rows: Optional[np.ndarray] = None, categorical: bool = False) -> pd.DataFrame:
+        """The rows as a DataFrame with the columns of ``compute_baseline_changes``."""
+        frame = self.store.to_frame(rows, categorical=categorical)
+        for column, values in self.derived(rows).items():
+            frame[column] = values
+        return frame
+
+    def select(self, **labels) -> pd.DataFrame:
+        """Rows matching the given labels (see ``CompactStore.mask``) with their changes."""
+        return self.to_frame(np.flatnonzero(self.store.mask(**labels)))
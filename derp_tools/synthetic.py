@@ -0,0 +1,217 @@
+"""
+Synthetic IAMC-format data (Model, Scenario, Region, Variable, Unit and one
+column per year) at any scale, for benchmarking the loader and the analysis
+steps beyond the handful of FRIDA scenarios.
+
+The variables include the capacity and final energy variables the dashboard
+and share computations use, with children that add up to their parents;
+further variables are numbered fillers.
+"""
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Variables every synthetic dataset contains: {variable: unit}
+CORE_VARIABLES = {
+    "Capacity|Electricity": "GW",
+    "Capacity|Biomass": "GW",
+    "Capacity|Coal": "GW",
+    "Capacity|Gas": "GW",
+    "Capacity|Geothermal": "GW",
+    "Capacity|Oil": "GW",
+    "Capacity|Electricity|Hydro": "GW",
+    "Capacity|Electricity|Nuclear": "GW",
+    "Capacity|Electricity|Solar": "GW",
+    "Capacity|Electricity|Wind": "GW",
+    "Final Energy": "EJ/yr",
+    "Final Energy|Electricity": "EJ/yr",
+}
+
+# Capacity|Electricity is the sum of these (as in the H&D "Installed
+# Electricity Capacity" group)
+CAPACITY_COMPONENTS = [v for v in CORE_VARIABLES
+                       if v.startswith("Capacity|") and v != "Capacity|Electricity"]
+
+# Default year grid, as in the mastersheets
+DEFAULT_YEARS = list(range(2005, 2101, 5))
+
+
+def synthetic_labels(n_models: int = 3, n_scenarios: int = 3, n_regions: int = 1,
+                     n_variables: Optional[int] = None) -> Dict[str, List[str]]:
+    """Model, scenario, region and variable names of a synthetic dataset."""
+    n_variables = len(CORE_VARIABLES) if n_variables is None else n_variables
+    if n_variables < len(CORE_VARIABLES):
+        raise ValueError(f"n_variables must be at least {len(CORE_VARIABLES)} (the core variables)")
+    extra = [f"Synthetic|Variable {i:04d}" for i in range(n_variables - len(CORE_VARIABLES))]
+    return {
+        "model": [f"Model {i:02d}" for i in range(n_models)],
+        # The first scenario plays the baseline
+        "scenario": ["Baseline"] + [f"Scenario {i:03d}" for i in range(1, n_scenarios)],
+        "region": ["World"] + [f"Region {i:03d}" for i in range(1, n_regions)],
+        "variable": list(CORE_VARIABLES) + extra,
+    }
+
+
+# -------------------
+# Function to generate a synthetic dataset
+# -------------------
+
+def synthetic_iamc(n_models: int = 3, n_scenarios: int = 3, n_regions: int = 1,
+                   n_variables: Optional[int] = None, years: Sequence[int] = DEFAULT_YEARS,
+                   *, missing: float = 0.0, year_prefix: str = "",
+                   seed: int = 0) -> pd.DataFrame:
+    """
+    Wide IAMC table with one row per model, scenario, region and variable.
+
+    Parameters:
+    -----------
+    n_models, n_scenarios, n_regions : int, optional
+        Number of models, scenarios (the first is called ``Baseline``) and
+        regions (the first is ``World``)
+    n_variables : int, optional
+        Number of variables, at least the core variables (the default)
+    years : list, optional
+        Year columns
+    missing : float, optional
+        Share (0-1) of values left empty, as models do not report everything
+    year_prefix : str, optional
+        "X" for R-style year headers (X2005), as in the mastersheets
+    seed : int, optional
+        Seed of the random values
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Model, Scenario, Region, Variable, Unit and one column per year
+    """
+    labels = synthetic_labels(n_models, n_scenarios, n_regions, n_variables)
+    rng = np.random.default_rng(seed)
+    variables = labels["variable"]
+    n_series = n_models * n_scenarios * n_regions
+    years = [int(y) for y in years]
+
+    # Smooth positive trajectories: a level per series and variable times a
+    # random-walk growth path over the years
+    level = rng.lognormal(mean=3.0, sigma=1.0, size=(n_series, len(variables), 1))
+    growth = np.cumsum(rng.normal(0.01, 0.03, size=(n_series, len(variables), len(years))), axis=2)
+    values = level * np.exp(growth)
+
+    # Children add up to their parents
+    pos = {v: i for i, v in enumerate(variables)}
+    values[:, pos["Capacity|Electricity"]] = values[:, [pos[v] for v in CAPACITY_COMPONENTS]].sum(axis=1)
+    values[:, pos["Final Energy|Electricity"]] = values[:, pos["Final Energy"]] * rng.uniform(
+        0.1, 0.5, size=(n_series, 1))
+
+    if missing > 0:
+        values[rng.random(values.shape) < missing] = np.nan
+
+    model, scenario, region = (a.ravel() for a in np.meshgrid(
+        labels["model"], labels["scenario"], labels["region"], indexing="ij"))
+    units = [CORE_VARIABLES.get(v, "EJ/yr") for v in variables]
+    n_vars = len(variables)
+    wide = pd.DataFrame({
+        "Model": np.repeat(model, n_vars),
+        "Scenario": np.repeat(scenario, n_vars),
+        "Region": np.repeat(region, n_vars),
+        "Variable": np.tile(variables, n_series),
+        "Unit": np.tile(units, n_series),
+    })
+    year_frame = pd.DataFrame(values.reshape(-1, len(years)),
+                              columns=[f"{year_prefix}{y}" for y in years])
+    return pd.concat([wide, year_frame], axis=1)
+
+
+def write_synthetic_files(directory: str, wide: pd.DataFrame, *, file_type: str = "csv",
+                          per_scenario: bool = True, prefix: str = "SYNTH") -> List[str]:
+    """
+    Write a synthetic table to ``directory`` the way the input data is laid out.
+
+    With ``per_scenario`` one file per scenario (``<prefix>_<scenario>.csv``,
+    as the FRIDA files), otherwise a single mastersheet. Returns the paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if per_scenario:
+        parts = [(f"{prefix}_{s.replace(' ', '_')}", g) for s, g in wide.groupby("Scenario", sort=False)]
+    else:
+        parts = [(f"mastersheet_{prefix.lower()}", wide)]
+
+    paths = []
+    for name, part in parts:
+        path = os.path.join(directory, f"{name}.{file_type}")
+        if file_type == "xlsx":
+            part.to_excel(path, index=False)
+        elif file_type == "csv":
+            part.to_csv(path, index=False)
+        else:
+            raise ValueError(f"file_type must be 'csv' or 'xlsx', not {file_type!r}")
+        paths.append(path)
+    return paths
+
+
+# -------------------
+# Function to write a synthetic FRIDA ensemble
+# -------------------
+
+def write_synthetic_ensemble(directory: str, scenarios: Sequence[str],
+                             variables: Sequence[str] = tuple(CAPACITY_COMPONENTS),
+                             years: Sequence[int] = DEFAULT_YEARS, n_members: int = 100,
+                             *, zero_in: Optional[Dict[str, Sequence[str]]] = None,
+                             seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Write ensemble runs as ``FRIDA_<scenario>_members.csv`` files, the layout
+    read by ``derp_tools.frida.EnsembleMembers``.
+
+    Member ``i`` of every scenario shares a level per variable (the same
+    parameter draw), and the rows of each file are shuffled so that members
+    are spread over the chunks of a reader.
+
+    Parameters:
+    -----------
+    directory : str
+        Directory of the files
+    scenarios : list
+        Scenarios, one file each
+    variables : list, optional
+        Variables (the capacity components by default)
+    years : list, optional
+        Year columns
+    n_members : int, optional
+        Ensemble members per scenario
+    zero_in : dict, optional
+        {scenario: variables} reported as 0, e.g. a zero baseline
+    seed : int, optional
+        Seed of the random values
+
+    Returns:
+    --------
+    dict
+        {scenario: values}, arrays of shape (members, variables, years)
+        ordered by member number
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    variables, years = list(variables), [int(y) for y in years]
+    level = rng.lognormal(mean=3.0, sigma=1.0, size=(n_members, len(variables), 1))
+
+    written = {}
+    for scenario in scenarios:
+        steps = rng.normal(0.01, 0.03, size=(n_members, len(variables), len(years)))
+        values = level * np.exp(np.cumsum(steps, axis=2))
+        for variable in (zero_in or {}).get(scenario, []):
+            values[:, variables.index(variable)] = 0.0
+
+        wide = pd.DataFrame({
+            "Member": np.repeat(np.arange(n_members), len(variables)),
+            "Model": "FRIDAv2.1",
+            "Scenario": scenario,
+            "Region": "World",
+            "Variable": np.tile(variables, n_members),
+            "Unit": [CORE_VARIABLES.get(v, "GW") for v in variables] * n_members,
+        })
+        year_frame = pd.DataFrame(values.reshape(-1, len(years)), columns=[str(y) for y in years])
+        wide = pd.concat([wide, year_frame], axis=1).sample(frac=1, random_state=seed)
+        wide.to_csv(os.path.join(directory, f"FRIDA_{scenario}_members.csv"), index=False)
+        written[scenario] = values
+    return written
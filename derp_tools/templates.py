@@ -0,0 +1,164 @@
+"""
+Figure templates: the skeleton of a dashboard (figure, GridSpec, axes,
+legend, titles) is built once and re-used for every region, only the data
+artists (lines, scatters, fills, texts) and the axis limits change.
+
+The skeleton is snapshotted right after it is built; ``reset`` removes
+everything the panels added since (artists, extra axes, figure texts) and
+restores the axes to their snapshotted state (axis on/off, titles, labels,
+tick locators, autoscaling, data limits), so that a panel drawn into a
+reset template looks as in a new figure. The layout (``tight_layout``) is
+computed once, for the first region rendered:
+
+    template = get_template(key, build_fn, figsize=(20, 12))
+    template.reset()
+    ...draw the panels into template.axes[...]...
+    template.layout(rect=[0, .07, 1, .94])
+    template.fig.savefig(png, dpi=150, bbox_inches="tight")
+
+Templates are cached per key (the arguments the skeleton depends on) in the
+process, so the workers of ``derp_tools.batch.render_batch`` keep one each.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import matplotlib.pyplot as plt
+
+# Templates kept open per process (least recently used closed first)
+MAX_TEMPLATES = 8
+
+_TEMPLATES: "OrderedDict[str, FigureTemplate]" = OrderedDict()
+
+
+def _axes_artists(ax) -> list:
+    return (list(ax.lines) + list(ax.collections) + list(ax.patches) + list(ax.texts)
+            + list(ax.images) + list(ax.artists) + list(ax.tables))
+
+
+def _figure_artists(fig) -> list:
+    return (list(fig.texts) + list(fig.legends) + list(fig.lines) + list(fig.patches)
+            + list(fig.images) + list(fig.artists))
+
+
+def _title_texts(ax) -> list:
+    return [ax.title, ax._left_title, ax._right_title]
+
+
+def _axis_state(axis) -> dict:
+    return {"major_locator": axis.get_major_locator(),
+            "minor_locator": axis.get_minor_locator(),
+            "major_formatter": axis.get_major_formatter(),
+            "minor_formatter": axis.get_minor_formatter(),
+            "label": axis.label.get_text()}
+
+
+def _restore_axis(axis, state: dict):
+    axis.set_major_locator(state["major_locator"])
+    axis.set_minor_locator(state["minor_locator"])
+    axis.set_major_formatter(state["major_formatter"])
+    axis.set_minor_formatter(state["minor_formatter"])
+    axis.label.set_text(state["label"])
+
+
+class FigureTemplate:
+    """
+    A figure skeleton re-used across renders.
+
+    Parameters:
+    -----------
+    build : callable
+        ``build(fig)`` adds the axes, legend and titles to an empty figure
+        and returns the axes by name (a dict)
+    figsize : tuple
+        Size of the figure
+    """
+
+    def __init__(self, build: Callable, figsize=(20, 12)):
+        self.fig = plt.figure(figsize=figsize)
+        self.axes: Dict[str, object] = build(self.fig)
+        self.laid_out = False
+        self._snapshot()
+
+    def _snapshot(self):
+        fig = self.fig
+        self._fig_axes = list(fig.axes)
+        self._fig_artists = set(map(id, _figure_artists(fig)))
+        self._axes_state = {}
+        for ax in self._fig_axes:
+            self._axes_state[ax] = {
+                "artists": set(map(id, _axes_artists(ax))),
+                "axison": ax.axison,
+                "titles": [t.get_text() for t in _title_texts(ax)],
+                "autoscale": (ax.get_autoscalex_on(), ax.get_autoscaley_on()),
+                "limits": (ax.get_xlim(), ax.get_ylim()),
+                "xaxis": _axis_state(ax.xaxis),
+                "yaxis": _axis_state(ax.yaxis),
+                "legend": ax.legend_,
+            }
+
+    def reset(self):
+        """Remove the data of the last render and restore the skeleton."""
+        fig = self.fig
+        for ax in list(fig.axes):
+            if ax not in self._axes_state:
+                fig.delaxes(ax)
+        for artist in _figure_artists(fig):
+            if id(artist) not in self._fig_artists:
+                artist.remove()
+
+        for ax, state in self._axes_state.items():
+            for artist in _axes_artists(ax):
+                if id(artist) not in state["artists"]:
+                    artist.remove()
+            if ax.legend_ is not None and ax.legend_ is not state["legend"]:
+                ax.legend_.remove()
+            ax.axison = state["axison"]
+            for text, title in zip(_title_texts(ax), state["titles"]):
+                text.set_text(title)
+            _restore_axis(ax.xaxis, state["xaxis"])
+            _restore_axis(ax.yaxis, state["yaxis"])
+            ax.set_autoscalex_on(state["autoscale"][0])
+            ax.set_autoscaley_on(state["autoscale"][1])
+            ax.set_xlim(state["limits"][0], auto=None)
+            ax.set_ylim(state["limits"][1], auto=None)
+            # Data limits from the skeleton's own artists only
+            ax.relim()
+        self.fig.stale = True
+
+    def layout(self, **kwargs):
+        """``tight_layout`` of the first render, kept for the later ones."""
+        if not self.laid_out:
+            self.fig.tight_layout(**kwargs)
+            self.laid_out = True
+
+    def close(self):
+        plt.close(self.fig)
+
+
+# -------------------
+# Templates cached per process
+# -------------------
+
+def get_template(key: str, build: Callable, figsize=(20, 12)) -> FigureTemplate:
+    """
+    The cached template of ``key``, or a new one built with ``build``; the
+    key must identify everything the skeleton depends on (e.g. a fingerprint
+    of the scenarios, models, display names and figure size).
+    """
+    if key in _TEMPLATES:
+        _TEMPLATES.move_to_end(key)
+        return _TEMPLATES[key]
+    template = FigureTemplate(build, figsize=figsize)
+    _TEMPLATES[key] = template
+    while len(_TEMPLATES) > MAX_TEMPLATES:
+        _TEMPLATES.popitem(last=False)[1].close()
+    return template
+
+
+def close_templates(key: Optional[str] = None):
+    """Close the cached template of ``key``, or all of them."""
+    keys = [key] if key is not None else list(_TEMPLATES)
+    for k in keys:
+        template = _TEMPLATES.pop(k, None)
+        if template is not None:
+            template.close()
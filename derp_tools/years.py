@@ -0,0 +1,234 @@
+"""
+Harmonisation of IAMC data onto a common year grid.
+
+FRIDA reports every 5 years from 1980 to 2150, the mastersheets 2005, 2010
+and then every decade to 2100. ``YearHarmoniser`` lays all series out once
+as a (series, year) array and resamples every series onto a target grid in
+a few array operations, so that models can be compared year by year:
+
+    harmoniser = YearHarmoniser(df)
+    aligned = harmoniser.to_grid(YEAR_GRIDS["iam"])                  # linear
+    totals = harmoniser.to_grid(YEAR_GRIDS["iam"], method="cumulative")
+
+Methods:
+
+- ``linear``: linear interpolation between the reported years
+- ``step``: the last reported value is held until the next report
+- ``cumulative``: each grid year gets the average of the (linearly
+  interpolated) series over its period, the years closer to it than to its
+  neighbours, so that the integral over the grid is conserved (for flows
+  such as emissions when moving to a coarser grid)
+
+Unreported years inside a series are bridged; grid years outside a series'
+reported span are left out unless ``extrapolate`` holds its first/last value.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyam
+
+from derp_tools.changes import as_long
+from derp_tools.loading import IAMC_COLUMNS, long_to_pyam
+
+# Year grids of the data in the repository
+YEAR_GRIDS = {
+    "frida": list(range(1980, 2151, 5)),
+    "iam": [2005] + list(range(2010, 2101, 10)),
+    "five_year": list(range(2005, 2101, 5)),
+}
+
+RESAMPLE_METHODS = ["linear", "step", "cumulative"]
+
+
+def _neighbours(values: np.ndarray, years: np.ndarray, grid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Column of the last reported year at or before, and of the first reported
+    year at or after, every grid year; -1 where there is none.
+    """
+    n_years = len(years)
+    cols = np.arange(n_years)
+    reported = ~np.isnan(values)
+    last = np.maximum.accumulate(np.where(reported, cols, -1), axis=1)
+    first = np.minimum.accumulate(np.where(reported, cols, n_years)[:, ::-1], axis=1)[:, ::-1]
+    first = np.where(first == n_years, -1, first)
+
+    before = np.searchsorted(years, grid, side="right") - 1
+    after = np.searchsorted(years, grid, side="left")
+    prev = np.where(before >= 0, last[:, np.clip(before, 0, n_years - 1)], -1)
+    nxt = np.where(after < n_years, first[:, np.clip(after, 0, n_years - 1)], -1)
+    return prev, nxt
+
+
+def _take(array: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    return np.take_along_axis(array, np.clip(cols, 0, None), axis=1)
+
+
+def _linear(values, years, grid, extrapolate) -> np.ndarray:
+    prev, nxt = _neighbours(values, years, grid)
+    x0, x1 = years[np.clip(prev, 0, None)], years[np.clip(nxt, 0, None)]
+    y0, y1 = _take(values, prev), _take(values, nxt)
+    span = np.where(x1 > x0, x1 - x0, 1)
+    out = np.where(x1 > x0, y0 + (grid - x0) * (y1 - y0) / span, y0)
+    out = np.where((prev >= 0) & (nxt >= 0), out, np.nan)
+    if extrapolate:
+        out = np.where(prev < 0, y1, out)
+        out = np.where(nxt < 0, y0, out)
+        out = np.where((prev < 0) & (nxt < 0), np.nan, out)
+    return out
+
+
+def _step(values, years, grid, extrapolate) -> np.ndarray:
+    prev, nxt = _neighbours(values, years, grid)
+    out = np.where(prev >= 0, _take(values, prev), np.nan)
+    if extrapolate:
+        out = np.where((prev < 0) & (nxt >= 0), _take(values, nxt), out)
+    else:
+        # Nothing is held beyond the last report
+        last_reported = np.where(~np.isnan(values), years, -np.inf).max(axis=1, keepdims=True)
+        out = np.where(grid > last_reported, np.nan, out)
+    return out
+
+
+def _integral(dense: np.ndarray, years: np.ndarray, cumulative: np.ndarray, at: np.ndarray) -> np.ndarray:
+    """Integral of the piecewise-linear series from the first year to ``at``."""
+    col = np.clip(np.searchsorted(years, at, side="right") - 1, 0, len(years) - 1)
+    value_at = _linear(dense, years, at, extrapolate=False)
+    return cumulative[:, col] + (at - years[col]) * (dense[:, col] + value_at) / 2
+
+
+def _cumulative(values, years, grid) -> np.ndarray:
+    if len(grid) == 1:
+        return _linear(values, years, grid, extrapolate=False)
+    # Bridge unreported years first, so that the integral runs over the whole span
+    dense = _linear(values, years, years, extrapolate=False)
+    segments = np.diff(years) * (dense[:, 1:] + dense[:, :-1]) / 2
+    cumulative = np.concatenate([np.zeros((len(dense), 1)),
+                                 np.cumsum(np.nan_to_num(segments), axis=1)], axis=1)
+    edges = np.concatenate([grid[:1], (grid[1:] + grid[:-1]) / 2, grid[-1:]])
+    integral = _integral(dense, years, cumulative, edges)
+    return (integral[:, 1:] - integral[:, :-1]) / np.diff(edges)
+
+
+def resample(values: np.ndarray, years: Sequence[int], grid: Sequence[int],
+             method: str = "linear", extrapolate: bool = False) -> np.ndarray:
+    """
+    Resample every row of ``values`` (series x years, NaN where not reported)
+    from ``years`` onto ``grid``.
+
+    Parameters:
+    -----------
+    values : numpy.ndarray
+        Array of shape (series, len(years))
+    years : list
+        Sorted years of the columns of ``values``
+    grid : list
+        Sorted target years
+    method : str, optional
+        "linear" (default), "step" or "cumulative" (see the module docstring)
+    extrapolate : bool, optional
+        Hold the first/last reported value outside a series' span (linear
+        and step only)
+
+    Returns:
+    --------
+    numpy.ndarray
+        Array of shape (series, len(grid)), NaN where a series has no value
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {RESAMPLE_METHODS}")
+    values = np.asarray(values, dtype=float)
+    years = np.asarray(years, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    if np.any(np.diff(years) <= 0) or np.any(np.diff(grid) <= 0):
+        raise ValueError("years and grid must be strictly increasing")
+    if method == "linear":
+        return _linear(values, years, grid, extrapolate)
+    if method == "step":
+        return _step(values, years, grid, extrapolate)
+    return _cumulative(values, years, grid)
+
+
+class YearHarmoniser:
+    """
+    IAMC data as one (series, year) array, resampled onto year grids.
+
+    The array is built once; resampled data is cached per (grid, method,
+    extrapolate), so panels and regions sharing a grid reuse it.
+
+    Parameters:
+    -----------
+    df : pyam.IamDataFrame or pandas.DataFrame
+        Long data; ``to_grid`` returns the same type
+    """
+
+    def __init__(self, df):
+        self.as_pyam = isinstance(df, pyam.IamDataFrame)
+        data = as_long(df)
+
+        # Series identifiers as categorical codes, never expanded to strings
+        combined = np.zeros(len(data), dtype=np.int64)
+        self.categories: Dict[str, pd.Index] = {}
+        column_codes = {}
+        for column in IAMC_COLUMNS:
+            codes, uniques = pd.factorize(data[column])
+            self.categories[column] = pd.Index(uniques)
+            column_codes[column] = codes
+            combined = combined * len(uniques) + codes
+        series, uniques = pd.factorize(combined)
+        # Scatter in reverse so that the first row of each series wins
+        first_rows = np.empty(len(uniques), dtype=np.int64)
+        first_rows[series[::-1]] = np.arange(len(data) - 1, -1, -1)
+        self.series_codes = {column: codes[first_rows] for column, codes in column_codes.items()}
+
+        year_codes, years = pd.factorize(data["year"].to_numpy(), sort=True)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.values = np.full((len(first_rows), len(self.years)), np.nan)
+        self.values[series, year_codes] = data["value"].to_numpy(dtype=float)
+        self._cache: Dict[tuple, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def to_array(self, grid: Sequence[int], method: str = "linear",
+                 extrapolate: bool = False) -> np.ndarray:
+        """Values of every series on ``grid``, shape (series, len(grid))."""
+        return resample(self.values, self.years, [int(y) for y in grid], method, extrapolate)
+
+    def to_grid(self, grid: Sequence[int], method: str = "linear", extrapolate: bool = False):
+        """
+        The data resampled onto ``grid`` (cached), as a pyam.IamDataFrame if
+        the harmoniser was built from one, otherwise as a long DataFrame with
+        categorical identifiers. Points without a value are left out.
+        """
+        grid = [int(y) for y in grid]
+        key = (tuple(grid), method, extrapolate)
+        if key not in self._cache:
+            values = self.to_array(grid, method, extrapolate)
+            rows, cols = np.nonzero(~np.isnan(values))
+            long_df = pd.DataFrame({
+                column: pd.Categorical.from_codes(self.series_codes[column][rows],
+                                                  categories=self.categories[column])
+                for column in IAMC_COLUMNS
+            })
+            long_df["year"] = np.asarray(grid, dtype=np.int64)[cols]
+            long_df["value"] = values[rows, cols]
+            self._cache[key] = long_to_pyam(long_df) if self.as_pyam else long_df
+        return self._cache[key]
+
+    def grids(self) -> pd.DataFrame:
+        """Reported years per model: first, last and number of years, and the step(s)."""
+        model_codes = self.series_codes["model"]
+        rows = []
+        for code, model in enumerate(self.categories["model"]):
+            reported = ~np.isnan(self.values[model_codes == code]).all(axis=0)
+            years = self.years[reported]
+            steps = sorted(set(np.diff(years).tolist()))
+            rows.append({"model": model, "first": years.min(), "last": years.max(),
+                         "n_years": len(years), "steps": steps})
+        return pd.DataFrame(rows).set_index("model")
+
+
+def harmonise_years(df, grid: Sequence[int], method: str = "linear", extrapolate: bool = False):
+    """One-off ``YearHarmoniser(df).to_grid(grid, method, extrapolate)``."""
+    return YearHarmoniser(df).to_grid(grid, method, extrapolate)